@@ -1,28 +1,59 @@
-import haversine as hv
-import pandas as pd
+import argparse
+import os
+
+import numpy as np
 import pulp as pl
 from pulp import GUROBI  # solver
 
-def distance_matrix(buyer_lat, buyer_long):
-    return (hv.haversine(buyer_lat, buyer_long,
-                         unit=hv.Unit.KILOMETERS))  # distance function which returns distance between two points in KMs.
-
-
-def main():
-    m = 80    #number of nodes
-    n = 5     #number of vehicles
-
-    # reading customer data
-    customer_data = pd.read_csv(r"C:\Users\Rishi Mehdiratta\Desktop\Data\Customer_Data.csv")
-
-    # reading vehicle data
-    vehicle_data = pd.read_csv(r"C:\Users\Rishi Mehdiratta\Desktop\Data\Vehicle_Data.csv")
-
+from fleet import assign_vehicles, vehicle_types
+from instance_data import head, load_customers, load_vehicles
+from instrumentation import gurobi_log_solutions, open_trace, phase
+from matrix import node_coordinates, unique_speeds
+from matrix_cache import MatrixCache
+from neighbours import DEFAULT_K, arc_report, candidate_arcs, format_arc_report
+from travel_times import arc_minutes, HaversineProvider
+
+CUSTOMER_CSV = r"C:\Users\Rishi Mehdiratta\Desktop\Data\Customer_Data.csv"
+VEHICLE_CSV = r"C:\Users\Rishi Mehdiratta\Desktop\Data\Vehicle_Data.csv"
+HORIZON = 720  # length of the working day in minutes, big M of the time window constraints
+HUB_LAT = 28.65781432  # hub (depot) location
+HUB_LONG = 77.21996426
+GUROBI_LOG = "CVRPTW.log"  # Gurobi log of the PuLP backend, read for the incumbents of a trace
+
+
+def create_data_model(m=80, n=None, k=DEFAULT_K, customer_csv=CUSTOMER_CSV, vehicle_csv=VEHICLE_CSV, provider=None,
+                      trace=None):
+    """Reads the customer and vehicle data and computes all parameters of the model.
+
+    m is the last customer row and n the last vehicle row used (None for the whole fleet),
+    k the number of nearest neighbours kept as candidate arcs of each node, provider the
+    travel-time provider (travel_times.py), haversine KMs when None.
+    """
+    # reading customer and vehicle data, typed column arrays cached as .npz after the first read
+    with phase(trace, "load"):
+        customer_data = load_customers(customer_csv)
+        vehicle_data = load_vehicles(vehicle_csv)
+    if n is None:
+        n = len(vehicle_data["Vehicle Type"]) - 1
+
+    types = vehicle_types(head(vehicle_data, n + 1))  # set of vehicle types, identical vehicles grouped with a count
+    with phase(trace, "matrix"):
+        return model_data(head(customer_data, m + 1), types, k, MatrixCache(), provider=provider)
+
+
+def model_data(customer_data, types, k=DEFAULT_K, cache=None, hub_lat=HUB_LAT, hub_long=HUB_LONG, provider=None):
+    """Computes all parameters of the model for the customer rows of a Customer_Data.csv frame.
+
+    The rows may also be the column arrays of instance_data.load_customers.
+    KMs and travel times come from a travel-time provider (travel_times.py), by default a
+    HaversineProvider over cache (a MatrixCache), or computed directly without one, e.g. for
+    the many small sub-instances of a decomposition. Above DENSE_NODES nodes its matrix is a
+    matrix.TiledMatrix that computes its tiles on demand. Another provider, e.g. a road
+    network, replaces both the haversine KMs and the KMs / speed travel times; its matrices
+    are data['travel_minutes'].
+    """
     # SETS
-    customers = list(customer_data.loc[0:m, "customer_no"])  # set of customers
-    M = 20000
-
-    vehicles = list(vehicle_data.loc[0:n, "Vehicle Type"])  # set of vehicles:
+    customers = np.asarray(customer_data["customer_no"]).tolist()  # set of customers
 
     depot = 0  # depot denoted as 0
 
@@ -33,364 +64,435 @@ def main():
     # ---------------------PARAMETERS_START----------------------------#
 
     # values for calculating distance
-    buyer_lat: float = customer_data.loc[0:m, "buyer_lat"]  # reading buyer lat
-    buyer_long: float = customer_data.loc[0:m, "buyer_long"]  # reading buyer long
-
-    hub_lat: float = 28.65781432  # reading hub lat
-    hub_long: float = 77.21996426  # reading hub long
+    buyer_lat: float = customer_data["buyer_lat"]  # reading buyer lat
+    buyer_long: float = customer_data["buyer_long"]  # reading buyer long
 
     # Parameter-1
-    nodes_coordinates = {}  # dictionary which have customers as keys and a tuple containing there lat and long as values
-
-    nodes_coordinates[0] = (hub_lat, hub_long)
-    for i in customers:
-        nodes_coordinates.update({i: (buyer_lat[customers.index(i)], buyer_long[customers.index(i)])})
-
-    # Parameter - 2
-    demand: float = customer_data.loc[0:m, "weight(Kg)"]  # reading demand of each customer
-
-    demand_node = {}  # dictionary whose keys are customers and values as there respective demands
-    for i in customers:
-        demand_node.update({i: demand[customers.index(i)]})
-
-    # Parameter - 3
-    service_time: int = customer_data.loc[0:m, "transaction_time(mins)"]  # reading transaction time/service time of each node
-
-    service_time_node = {}  # dictionary whose key values are customers and values as service times
-    service_time_node[0] = 0  # S_0
-    for i in customers:
-        service_time_node.update({i: service_time[customers.index(i)]})
-
-    # Parameter - 4
-    free_km: int = vehicle_data.loc[0:n, "Free KMs"]  # set of freekms of vehicles:
-
-    free_km_vehicle = {}  # dictionary whose key values are vehicles and values as freekms of vehicles
-    for v in vehicles:
-        free_km_vehicle.update({v: free_km[vehicles.index(v)]})
+    lat, long = node_coordinates(hub_lat, hub_long, buyer_lat, buyer_long)  # arrays in the order of nodes, depot first
 
-    # Parameter - 5
-    maximum_capacity: int = vehicle_data.loc[0:n, "Capacity(Kg)"]
+    # Parameter - 2, 3: demand and service time of each customer, S_0 = 0
+    demand_node = dict(zip(customers, np.asarray(customer_data["weight(Kg)"]).tolist()))
+    service_time_node = {depot: 0}
+    service_time_node.update(zip(customers, np.asarray(customer_data["transaction_time(mins)"]).tolist()))
 
-    maximum_capacity_vehicle = {}  # maximum capacity a vehicle can take in a trip
-    for v in vehicles:
-        maximum_capacity_vehicle.update({v: maximum_capacity[vehicles.index(v)]})
-
-    # Parameter - 6
-    fixed_cost: float = vehicle_data.loc[0:n, "Fixed Cost"]
-
-    fixed_cost_vehicle = {}
-    for v in vehicles:
-        fixed_cost_vehicle.update({v: fixed_cost[vehicles.index(v)]})
+    # Parameter - 4 to 6, 8 to 14: free kms, capacity, costs, limits and speed are attributes of each vehicle type
 
     # Parameter - 7
-    distance_nodes = {}
-    for i in nodes:
-        for j in nodes:
-            if i != j:
-                distance_nodes.update({(i, j): float(distance_matrix(nodes_coordinates[i], nodes_coordinates[j]))})
-
-    # Parameter - 8
-    max_kms: int = vehicle_data.loc[0:n, "Max KMs (per day)"]
-
-    max_kms_vehicle = {}  # maximum kms a vehicle can travel
-    for v in vehicles:
-        max_kms_vehicle.update({v: max_kms[vehicles.index(v)]})
-
-    # Parameter - 9
-    max_time: int = vehicle_data.loc[0:n, "Max Time(hrs)"]
-
-    max_time_vehicle = {}  # maximum time a vehicle can take to deliver products
-    for v in vehicles:
-        max_time_vehicle.update({v: max_time[vehicles.index(v)]})
-
-    # Parameter - 10
-    speed: int = vehicle_data.loc[0:n, "uniform speed (km/min)"]
-
-    speed_vehicle = {}  # speed per vehicle
-    for v in vehicles:
-        speed_vehicle.update({v: speed[vehicles.index(v)]})
-
-    # Parameter - 11
-    variable_cost: float = vehicle_data.loc[0:n, "Variable Cost"]
-
-    variable_cost_vehicle = {}
-    for v in vehicles:
-        variable_cost_vehicle.update({v: variable_cost[vehicles.index(v)]})
-
-    # Parameter - 12
-    max_customer: int = vehicle_data.loc[0:n, "Max Buyers/Customers (in a trip)"]
-
-    max_customer_vehicle = {}  # maximum number of customers a vehicle can serve with in a day
-    for v in vehicles:
-        max_customer_vehicle.update({v: max_customer[vehicles.index(v)]})
-
-    # Parameter - 13
-    max_demand: int = vehicle_data.loc[0:n, "Max Weight per Buyer/Customer"]
-
-    max_demand_vehicle = {}  # maximum demand a vehicle can deliver for each buyer
-    for v in vehicles:
-        max_demand_vehicle.update({v: max_demand[vehicles.index(v)]})
-
-    # Parameter - 14
-    min_demand: int = vehicle_data.loc[0:n, "Min Weight per Buyer/Customer"]
-
-    min_demand_vehicle = {}  # minimum demand a vehicle can deliver for each buyer
-    for v in vehicles:
-        min_demand_vehicle.update({v: min_demand[vehicles.index(v)]})
-
-    time_nodes = {}  # time between two nodes
-    for v in vehicles:
-        for i in nodes:
-            for j in nodes:
-                if i != j:
-                    time_nodes.update({(i, j, v): distance_nodes[i, j] / speed_vehicle[v]})
-
-    earliest_time = customer_data.loc[0:m, "E"]       #converted the given time frames into integers (Earliest Time)
-    latest_time = customer_data.loc[0:m, "L"]         #Latest Time
-    earliest_time_dict = {}
-    latest_time_dict = {}
-    for i in customers:
-        earliest_time_dict.update({i: earliest_time[customers.index(i)]})
-    for i in customers:
-        latest_time_dict.update({i: latest_time[customers.index(i)]})
+    # distance between two nodes in KMs, cached on disk when a cache is given
+    if provider is None:
+        provider = HaversineProvider(cache)
+    distance_km = provider.distance_km(lat, long)
+
+    # candidate arcs: the k nearest neighbours of each node plus all depot arcs
+    arc_positions = candidate_arcs(lat, long, k)
+    arcs = [(nodes[a], nodes[b]) for a, b in arc_positions]
+
+    out_arcs = {i: [] for i in nodes}  # arcs leaving each node
+    in_arcs = {i: [] for i in nodes}   # arcs entering each node
+    for i, j in arcs:
+        out_arcs[i].append((i, j))
+        in_arcs[j].append((i, j))
+
+    # only the candidate arcs are read from the matrix, the full matrix is never turned into Python floats
+    src, dst = (list(p) for p in zip(*arc_positions))
+    arc_km = distance_km[src, dst]
+    distance_nodes = dict(zip(arcs, arc_km.tolist()))
+
+    # time between two nodes, one matrix per distinct speed (speed class) rather than per vehicle
+    speeds, speed_class = unique_speeds([t.speed for t in types])
+    travel_minutes = None  # haversine travel times are KMs / speed
+    if not isinstance(provider, HaversineProvider):
+        slots = np.concatenate(([-1], np.asarray(customer_data["E"])))  # slot starts, no slot for the depot
+        travel_minutes = provider.travel_minutes(lat, long, speeds, slots)
+    time_nodes = {}
+    for c, speed in enumerate(speeds.tolist()):
+        if travel_minutes is not None:
+            arc_time = travel_minutes[c, src, dst]
+        else:
+            arc_time = arc_km / speed
+        time_nodes.update({(i, j, c): t for (i, j), t in zip(arcs, arc_time.tolist())})
+
+    earliest_time_dict = dict(zip(customers, np.asarray(customer_data["E"]).tolist()))  # converted the given time frames into integers
+    latest_time_dict = dict(zip(customers, np.asarray(customer_data["L"]).tolist()))
     # ---------------------------PARAMETERS_END----------------------------#
-    ##########################################################################################################
+
+    data = {}
+    data['customers'] = customers
+    data['nodes'] = nodes
+    data['depot'] = depot
+    data['types'] = types
+    data['lat'] = lat
+    data['long'] = long
+    data['distance_km'] = distance_km
+    data['travel_minutes'] = travel_minutes
+    data['arcs'] = arcs
+    data['arc_positions'] = arc_positions
+    data['out_arcs'] = out_arcs
+    data['in_arcs'] = in_arcs
+    data['arc_report'] = arc_report(len(nodes), arcs)
+    data['distance'] = distance_nodes
+    data['time'] = time_nodes
+    data['speed_class'] = {t.name: int(c) for t, c in zip(types, speed_class)}
+    data['demand'] = demand_node
+    data['service_time'] = service_time_node
+    data['earliest'] = earliest_time_dict
+    data['latest'] = latest_time_dict
+    return data
+
+
+def add_arcs(data, arcs):
+    """Adds (i, j) node arcs missing from the candidate arcs of data, e.g. the arcs of a warm start."""
+    position = {i: p for p, i in enumerate(data['nodes'])}
+    known = set(data['arcs'])
+    new = [a for a in dict.fromkeys(arcs) if a not in known and a[0] != a[1]]
+    if not new:
+        return
+    n_classes = len(unique_speeds([t.speed for t in data['types']])[0])
+    for i, j in new:
+        a, b = position[i], position[j]
+        data['arcs'].append((i, j))
+        data['arc_positions'].append((a, b))
+        data['out_arcs'][i].append((i, j))
+        data['in_arcs'][j].append((i, j))
+        data['distance'][i, j] = float(data['distance_km'][a, b])
+        for c in range(n_classes):
+            data['time'][i, j, c] = float(arc_minutes(data, c, a, b))
+    data['arc_report'] = arc_report(len(data['nodes']), data['arcs'])
+
+
+def build_model(data):
+    """Builds the CVRPTW indexed by vehicle type instead of by individual vehicle.
+
+    Identical vehicles share one block of arc variables, so the model shrinks by the fleet
+    multiplicity and the symmetry between them disappears. Per-route limits (distance,
+    extra kms, customers per trip) are tracked with labels on the nodes, which is valid
+    because every customer lies on exactly one route. Returns the problem and a dict of
+    its variable families.
+    """
+    customers = data['customers']
+    depot = data['depot']
+    types = data['types']
+    arcs = data['arcs']
+    out_arcs = data['out_arcs']
+    in_arcs = data['in_arcs']
+    distance_nodes = data['distance']
+    time_nodes = data['time']
+    demand_node = data['demand']
+    service_time_node = data['service_time']
+
+    closed_arcs = data.get('closed_arcs', ())  # (i, j, type name) a type can never use, see presolve.py
+    big_m = data.get('big_m', {})  # big M of the time window constraints by (i, j, speed class), HORIZON if missing
+
+    max_km = max(t.max_km for t in types)
+    big_km = max_km + max(distance_nodes.values())  # big M of the distance labels
+    big_customers = len(customers)  # big M of the customer count labels
 
     # ----------------------DECISION_VARIABLES_START-----------------------#
 
     # dv-1
-    vehicle_route = {}  # A decision variable that decides if vehicle v has taken route  i->j or not.
+    vehicle_route = {}  # A decision variable that decides if a vehicle of type t has taken route i->j or not.
+
+    for t in types:
+        for i, j in arcs:
+            if (i, j, t.name) not in closed_arcs:
+                vehicle_route[i, j, t.name] = pl.LpVariable(f"x_{i}_{j}_{t.name}", cat="Binary")
 
-    for v in vehicles:
-        for i in nodes:
-            for j in nodes:
-                if i != j:
-                    vehicle_route.update({(i, j, v): pl.LpVariable(
-                            "x" + "_" + str(i) + "_" + str(j) + "_" + str(v), cat="Binary")})
+    def type_arcs(t, arc_list):
+        """Returns the keys of vehicle_route of type t on the arcs of arc_list."""
+        return [a + (t.name,) for a in arc_list if a + (t.name,) in vehicle_route]
 
     # dv-2
-    extra_kms = {}  # A decision variable that calculates extra km that vehicle v will travel in its route.
+    extra_kms = {}  # extra km beyond the free kms of type t on the route returning to the depot from customer i.
 
-    for v in vehicles:
-        extra_kms.update({v: pl.LpVariable("extra_kms" + "_" + str(v), cat="Continuous", lowBound=0)})
+    for t in types:
+        for i in customers:
+            extra_kms[i, t.name] = pl.LpVariable(f"extra_kms_{i}_{t.name}", lowBound=0)
 
     # dv-3
-    distance = {}  # total distance traveled by vehicle v in its journey
-    for v in vehicles:
-        aux_sum_1 = 0
-        for i in nodes:
-            for j in nodes:
-                if i != j:
-                    aux_sum_1 += distance_nodes[i, j] * vehicle_route[i, j, v]
-        distance.update({v: aux_sum_1})
+    route_km = {depot: 0}  # distance traveled from the depot until arriving at customer i
+
+    for i in customers:
+        route_km[i] = pl.LpVariable(f"d_{i}", lowBound=0, upBound=max_km)
 
     # dv-4
-    vehicle_use = {}  # A decision variable that indicates whether the vehicle v is used or not.
+    vehicle_use = {}  # number of vehicles of type t in use.
 
-    for v in vehicles:
-        vehicle_use.update({v: pl.LpVariable("u" + "_" + str(v), cat="Binary")})
+    for t in types:
+        vehicle_use[t.name] = pl.LpVariable(f"u_{t.name}", lowBound=0, upBound=t.count, cat="Integer")
 
     # dv-5
-    vehicle_visit_node = {}  # A decision variable that indicates whether a vehicle v visited customer i or not.
+    vehicle_visit_node = {}  # A decision variable that indicates whether a vehicle of type t visited customer i or not.
 
-    for v in vehicles:
-        for i in nodes:
-            vehicle_visit_node.update(
-                    {(i, v): pl.LpVariable("y" + "_" + str(i) + "_" + str(v), cat="Binary")})
+    for t in types:
+        for i in customers:
+            vehicle_visit_node[i, t.name] = pl.LpVariable(f"y_{i}_{t.name}", cat="Binary")
 
     # dv-6
-    flow = {}  # A decision variable that indicates number of units of product in a vehicle v from node i to j
-    for v in vehicles:
-        for i in nodes:
-            for j in nodes:
-                if i != j:
-                    flow.update({(i, j, v): pl.LpVariable(
-                            "f" + "_" + str(i) + "_" + str(j) + "_" + str(v), cat="Continuous",
-                            lowBound=0)})
+    flow = {}  # number of units of product in a vehicle of type t from node i to j
+    for i, j, name in vehicle_route:
+        flow[i, j, name] = pl.LpVariable(f"f_{i}_{j}_{name}", lowBound=0)
 
     # dv-7
-    start_time = {}  # A decision variable that indicates starting time of vehicle v visting node i
+    start_time = {depot: 0}  # starting time of the visit at customer i, within its time window; vehicles leave at 0
 
-    for v in vehicles:
-        for i in nodes:
-            start_time.update({(i, v): pl.LpVariable("st" + "_" + str(i) + "_" + str(v),
-                                                            cat="Continuous", lowBound=0)})
+    for i in customers:
+        start_time[i] = pl.LpVariable(f"st_{i}", lowBound=data['earliest'][i], upBound=data['latest'][i])
 
-    # ----------------------DECISION_VARIABLES_END-----------------------#
+    # dv-8
+    route_customers = {depot: 0}  # number of customers served on the route up to and including customer i
 
-    ############################################################################################################################################
+    for i in customers:
+        route_customers[i] = pl.LpVariable(f"c_{i}", lowBound=1, upBound=big_customers)
+
+    # ----------------------DECISION_VARIABLES_END-----------------------#
 
     # problem definition
     prob = pl.LpProblem("Capacitated Vehicle Routing Problem with Time Windows", pl.LpMinimize)  # Minimization Problem
 
-    ############################################################################################################################################
-
-    # objective function
-
-    aux_sum_2 = 0
-    for v in vehicles:
-        aux_sum_2 += ((variable_cost_vehicle[v] * extra_kms[v]) + (
-                fixed_cost_vehicle[v] * vehicle_use[v]))  # To Minimize Cost
-
-    prob += aux_sum_2
-
-    #############################################################################################################################################
+    # objective function: fixed cost of every vehicle used plus variable cost of the extra kms
+    prob += (pl.lpSum(t.fixed_cost * vehicle_use[t.name] for t in types)
+             + pl.lpSum(t.variable_cost * extra_kms[i, t.name] for t in types for i in customers))
 
     # ----------------------CONSTRAINTS_START-----------------------#
 
-    # constraint-1: this constraint finds the value of extra kms traveled,when extra_kms value is less than cumulative distance
-    # traveled by vehicle then it becomes zero.
+    # constraint-1: distance labels, arriving at j after i adds the arc length when any vehicle uses i->j,
+    # and the extra kms of a route are charged on the arc that returns to the depot.
 
-    for v in vehicles:
-        prob += extra_kms[v] >= (distance[v] - free_km_vehicle[v])
+    for i, j in arcs:
+        if j != depot:
+            used = pl.lpSum(vehicle_route[i, j, t.name] for t in types if (i, j, t.name) in vehicle_route)
+            prob += route_km[j] >= route_km[i] + distance_nodes[i, j] - big_km * (1 - used)
 
-    # ___________________________________________________________________________________________________________________________________________#
+    for t in types:
+        for i, _, _ in type_arcs(t, in_arcs[depot]):
+            prob += extra_kms[i, t.name] >= (route_km[i] + distance_nodes[i, depot] - t.free_km
+                                             - big_km * (1 - vehicle_route[i, depot, t.name]))
 
-    # constraint-2: This constraint is a big M constraint which tells that if any vehicle v is in use then it has
-    # atleast visited one node and if it is not in use, then the value of LHS becomes 0 because xijv is a binary
-    # variable and has its lower bound zero.
+    # constraint-2: number of vehicles of type t in use is the number of routes of type t leaving the depot.
 
-    for v in vehicles:
-        aux_sum_3 = 0
-        for i in nodes:
-            for j in nodes:
-                if i != j:
-                    aux_sum_3 += vehicle_route[i, j, v]
-        prob += aux_sum_3 <= M * vehicle_use[v]
+    for t in types:
+        prob += vehicle_use[t.name] == pl.lpSum(vehicle_route[a] for a in type_arcs(t, out_arcs[depot]))
 
-    # ___________________________________________________________________________________________________________________________________________#
-
-    # constraint-3: This constraint says that each customer j in set C should be visited exactly once by any vehicle v.
+    # constraint-3: This constraint says that each customer j in set C should be visited exactly once by any vehicle.
     for j in customers:
-        aux_sum_6 = 0
-        for v in vehicles:
-            aux_sum_6 += vehicle_visit_node[j, v]
-        prob += aux_sum_6 == 1
-    # ___________________________________________________________________________________________________________________________________________#
-
-    # constraint-4: This constraint is a flow balancing constraint which tells that the number of vehicles coming in and out
-    # of a customer’s location is same and it can only be by only one vehicle.
-
-    for v in vehicles:
-        for j in nodes:
-            aux_sum_8 = 0
-            aux_sum_9 = 0
-            for i in nodes:
-                if i != j:
-                    aux_sum_8 += vehicle_route[i, j, v]
-                    aux_sum_9 += vehicle_route[j, i, v]
-            prob += aux_sum_8 == aux_sum_9
-    # ___________________________________________________________________________________________________________________________________________#
-
-    # constraint-5: This constraint is a flow balancing constraint which tells that the number of vehicles coming in and out
-    # of a customer’s location is same and it can only be by only one vehicle.
-
-    for v in vehicles:
-        for i in nodes:
-            aux_sum_10 = 0
-            for j in nodes:
-                if i != j:
-                    aux_sum_10 += vehicle_route[i, j, v]
-            prob += aux_sum_10 == vehicle_visit_node[i, v]
-    # ___________________________________________________________________________________________________________________________________________#
-
-    # constraint-6: This constraint tells that each customer should be visited only once that is entering node is just one.
-
-    for v in vehicles:
-        for i in nodes:
-            aux_sum_21 = 0
-            for j in nodes:
-                if i != j:
-                    aux_sum_21 += vehicle_route[j, i, v]
-            prob += aux_sum_21 == vehicle_visit_node[i, v]
-    # ___________________________________________________________________________________________________________________________________________#
-
-    # constraint-7: This constraint says that every customer j demand must be bounded between the minimum and maximum demand,
-    # any vehicle v can serve.
-
-    for v in vehicles:
-        for j in customers:
-            prob += vehicle_visit_node[j, v] * min_demand_vehicle[v] <= demand_node[j] * vehicle_visit_node[
-                    j, v] <= vehicle_visit_node[j, v] * max_demand_vehicle[v]
-    # ___________________________________________________________________________________________________________________________________________#
+        prob += pl.lpSum(vehicle_visit_node[j, t.name] for t in types) == 1
 
-    # constraint-8: This constraint says that the number of customers per vehicle v must be less than the maximum number of customers
-    # it can serve.
+    # constraint-4: flow balancing, vehicles of type t coming in and going out of every node (depot included) are the same.
 
-    for v in vehicles:
-        aux_sum_12 = 0
-        for j in customers:
-            aux_sum_12 += vehicle_visit_node[j, v]
-        prob += aux_sum_12 <= max_customer_vehicle[v] + 1
-    # ___________________________________________________________________________________________________________________________________________#
-
-    # constraint-7: This constraint is demand satisfaction Constraint.
-
-    for j in customers:
-        aux_sum_13 = 0
-        aux_sum_14 = 0
-        for v in vehicles:
-            for i in nodes:
-                if i != j:
-                    aux_sum_13 += flow[i, j, v]
-                    aux_sum_14 += flow[j, i, v]
-        aux_sum = aux_sum_13 - aux_sum_14
-        prob += aux_sum == demand_node[j]
+    for t in types:
+        for j in data['nodes']:
+            prob += (pl.lpSum(vehicle_route[a] for a in type_arcs(t, in_arcs[j]))
+                     == pl.lpSum(vehicle_route[a] for a in type_arcs(t, out_arcs[j])))
 
-    # ___________________________________________________________________________________________________________________________________________#
+    # constraint-5, 6: a customer visited by type t is left and entered exactly once by that type.
 
-    # constraint-8: This constraint tells that flow in an arc must be less than the maximum capacity of vehicle if that arc i->j is traversed.
-
-    for v in vehicles:
-        for i in nodes:
-            for j in nodes:
-                if i != j:
-                    prob += flow[i, j, v] <= maximum_capacity_vehicle[v] * vehicle_route[i, j, v]
-    # ___________________________________________________________________________________________________________________________________________#
-
-    # constraint-9: Time Window Constraints.
-
-    for v in vehicles:
-        for i in nodes:
-            for j in customers:
-                if i != j:
-                    prob += start_time[i, v] + service_time_node[i] + time_nodes[i, j, v] <= start_time[
-                            j, v] + 720 * (1 - vehicle_route[i, j, v])
-
-    # ___________________________________________________________________________________________________________________________________________#
+    for t in types:
+        for i in customers:
+            prob += pl.lpSum(vehicle_route[a] for a in type_arcs(t, out_arcs[i])) == vehicle_visit_node[i, t.name]
+            prob += pl.lpSum(vehicle_route[a] for a in type_arcs(t, in_arcs[i])) == vehicle_visit_node[i, t.name]
 
-    # Constraint-10: Vehicle must visit in time windows of customers.
+    # constraint-7: every customer j demand must be bounded between the minimum and maximum demand type t can serve.
 
-    for v in vehicles:
-        for i in customers:
-            prob += earliest_time_dict[i] * vehicle_visit_node[i, v] <= start_time[i, v] <= latest_time_dict[
-                    i] * vehicle_visit_node[i, v]
+    for t in types:
+        for j in customers:
+            if not t.min_demand <= demand_node[j] <= t.max_demand:
+                prob += vehicle_visit_node[j, t.name] == 0
 
-    # ___________________________________________________________________________________________________________________________________________#
+    # constraint-8: the number of customers on a route of type t must be less than the maximum number of customers
+    # it can serve, counted with labels along the route.
 
-    # Constraint-11: Bound on total time spent by vehicle in its route and total distnace travelled by vehicle.
-    for v in vehicles:
-        prob += distance[v] <= max_kms_vehicle[v]
+    for i, j in arcs:
+        if j != depot:
+            used = pl.lpSum(vehicle_route[i, j, t.name] for t in types if (i, j, t.name) in vehicle_route)
+            prob += route_customers[j] >= route_customers[i] + 1 - big_customers * (1 - used)
 
-    # ___________________________________________________________________________________________________________________________________________#
+    for t in types:
+        for i, _, _ in type_arcs(t, in_arcs[depot]):
+            prob += route_customers[i] <= t.max_customers + big_customers * (1 - vehicle_route[i, depot, t.name])
 
-    ###########################################################################################################################################
-    # solving the problem
+    # constraint-9: demand satisfaction.
 
-    prob.writeLP("CVRPTW.lp")
+    for j in customers:
+        prob += (pl.lpSum(flow[a] for t in types for a in type_arcs(t, in_arcs[j]))
+                 - pl.lpSum(flow[a] for t in types for a in type_arcs(t, out_arcs[j]))) == demand_node[j]
+
+    # constraint-10: flow in an arc must be less than the maximum capacity of type t if that arc i->j is traversed.
+
+    for t in types:
+        for i, j, _ in type_arcs(t, arcs):
+            prob += flow[i, j, t.name] <= t.capacity * vehicle_route[i, j, t.name]
+
+    # constraint-11: Time Window Constraints, the travel time depends on the speed class of the type. The big M
+    # of an arc is HORIZON unless presolve.py found a smaller one; with none left the bounds imply the constraint.
+
+    for t in types:
+        c = data['speed_class'][t.name]
+        for i, j, _ in type_arcs(t, arcs):
+            big = big_m.get((i, j, c), HORIZON)
+            if j != depot and big > 0:
+                prob += start_time[i] + service_time_node[i] + time_nodes[i, j, c] <= start_time[
+                        j] + big * (1 - vehicle_route[i, j, t.name])
+
+    # constraint-12: Bound on total distance travelled on a route of type t.
+
+    for t in types:
+        for i, _, _ in type_arcs(t, in_arcs[depot]):
+            prob += route_km[i] + distance_nodes[i, depot] <= t.max_km + big_km * (1 - vehicle_route[i, depot, t.name])
+
+    # ----------------------CONSTRAINTS_END-----------------------#
+
+    variables = {'vehicle_route': vehicle_route, 'flow': flow, 'start_time': start_time,
+                 'vehicle_use': vehicle_use, 'vehicle_visit_node': vehicle_visit_node,
+                 'extra_kms': extra_kms, 'route_km': route_km, 'route_customers': route_customers}
+    return prob, variables
+
+
+def routes_from_arcs(data, used_arcs):
+    """Follows the arcs in use out of the depot and returns the routes keyed by concrete vehicle ID.
+
+    used_arcs is a collection of (i, j, type name) triples with x = 1.
+    """
+    depot = data['depot']
+    routes_by_type = {t.name: [] for t in data['types']}
+    succ = {(i, name): j for i, j, name in used_arcs if i != depot}
+    for i, first, name in sorted(used_arcs, key=lambda a: (a[2], str(a[1]))):
+        if i == depot:
+            route = [depot, first]
+            while route[-1] != depot:
+                route.append(succ[route[-1], name])
+            routes_by_type[name].append(route)
+    return assign_vehicles(routes_by_type, data['types'])
+
+
+def extract_routes(data, variables):
+    """Returns the routes of the solved PuLP model keyed by concrete vehicle ID."""
+    return routes_from_arcs(data, [a for a, var in variables['vehicle_route'].items() if var.value() > 0.5])
+
+
+def solve(data, backend="pulp", mps_path=None, warm_start=False, trace=None, column_generation=False):
+    """Builds and solves the model of data; returns (status string, objective, routes by vehicle ID).
+
+    trace (an instrumentation.Trace) gets the time of every phase and the incumbents of the solve.
+    column_generation solves a set partitioning model over routes instead (see column_generation.py).
+    """
+    if column_generation:
+        from column_generation import solve_column_generation
+
+        result = solve_column_generation(data, trace=trace)
+        add_arcs(data, [(i, j) for route in result['routes'].values() for i, j in zip(route, route[1:])])
+        gap = "no plan" if result['gap'] is None else f"{result['gap']:.2%}"
+        print(f"seed objective {result['seed_objective']}, lower bound {result['lower_bound']:.2f}, gap {gap}, "
+              f"{len(result['dropped'])} customers unserved")
+        return result['status'], result['objective'], result['routes']
+    if warm_start:
+        from warm_start import solve_with_warm_start
+
+        result = solve_with_warm_start(data, backend=backend, trace=trace)
+        print(f"heuristic objective {result['heuristic_objective']} in {result['heuristic_seconds']:.1f} s")
+        return result['status'], result['objective'], result['routes'] or {}
+    if backend == "highs":
+        from sparse_model import build_sparse_model, extract_routes as extract_sparse_routes, solve_highs, write_mps
+
+        with phase(trace, "build"):
+            model = build_sparse_model(data)
+        if mps_path:
+            with phase(trace, "write_mps"):
+                write_mps(model, mps_path)
+        with phase(trace, "solve"):
+            status, objective, values = solve_highs(model, time_limit=1800, mip_gap=0.2, trace=trace)
+        return status, objective, extract_sparse_routes(data, model, values) if values is not None else {}
+    with phase(trace, "build"):
+        prob, variables = build_model(data)
+    with phase(trace, "write_lp"):
+        prob.writeLP("CVRPTW.lp")
+    if mps_path:
+        with phase(trace, "write_mps"):
+            prob.writeMPS(mps_path)
     # print(prob)
-    prob.solve(GUROBI(MIPFocus=1, Heuristics=0.5, MIPgap=0.2, Symmetry=2, timeLimit=1800, SolFiles='sol_', Method = -1))
-    print(pl.LpStatus[prob.status])
-    print(pl.value(prob.objective))
-
-    # printing x_i_j_v
-    for v in vehicles:
-        for i in nodes:
-            for j in nodes:
-                if i != j:
-                    if vehicle_route[i, j, v].value() > 0.0:
-                        print(f" route {i} _ {j} _ {v} :{vehicle_route[i, j, v].value()}")
-                        print(f" flow {i} _ {j} _ {v}  : {flow[i, j, v].value()}")
-                        print("_________________________________________________________________")
-
-main()
\ No newline at end of file
+    if os.path.exists(GUROBI_LOG):
+        os.remove(GUROBI_LOG)  # Gurobi appends to its log, the incumbents below are this solve's only
+    with phase(trace, "solve"):
+        prob.solve(GUROBI(MIPFocus=1, Heuristics=0.5, MIPgap=0.2, Symmetry=2, timeLimit=1800, SolFiles='sol_',
+                          Method=-1, LogFile=GUROBI_LOG))
+    if trace is not None:
+        for seconds, objective, bound in gurobi_log_solutions(GUROBI_LOG):
+            trace.solution(objective, "gurobi", bound=bound, solver_seconds=seconds)
+    routes = extract_routes(data, variables) if prob.status == pl.LpStatusOptimal else {}
+    return pl.LpStatus[prob.status], pl.value(prob.objective), routes
+
+
+def main(backend="pulp", mps_path=None, warm_start=False, presize=False, road_network=None, speed_profiles=None,
+         trace_path=None, trace_memory=False, column_generation=False, presolve=False):
+    """Builds and solves the model; backend "pulp" solves with Gurobi, "highs" uses the sparse CSR path.
+
+    With warm_start the MIP starts from the routes of a short OR-Tools solve (see warm_start.py);
+    column_generation replaces the MIP by column generation with a lower bound (column_generation.py).
+    presolve removes the arcs the time windows rule out and tightens the big Ms first (presolve.py).
+    With presize the model is built with the trimmed fleet of fleet_sizing.py and grown
+    back while it is infeasible. With road_network, a road network .npz file, travel times
+    and KMs follow its roads, slowed down per delivery slot by the speed_profiles JSON file.
+    Phase times and the incumbents go to the trace file trace_path (see instrumentation.py).
+    """
+    with open_trace(trace_path, trace_memory, run="CVRP_GUROBI") as trace:
+        provider = None
+        if road_network is not None:
+            from travel_times import RoadNetworkProvider, load_profiles
+
+            provider = RoadNetworkProvider(road_network, load_profiles(speed_profiles) if speed_profiles else None)
+        data = create_data_model(provider=provider, trace=trace)
+        print(format_arc_report(data['arc_report']))
+        print("Vehicle types: " + ", ".join(f"{t.name} x{t.count}" for t in data['types']))
+        if presolve:
+            from presolve import format_presolve_report, presolve as presolve_data
+
+            with trace.phase("presolve"):
+                print(format_presolve_report(presolve_data(data)))
+
+        #######################################################################################################################################
+        # solving the problem
+
+        if presize:
+            from fleet_sizing import (fleet_lower_bound, format_bounds, infeasible_customers, solve_presized,
+                                      unrouted_customers)
+
+            (status, objective, routes), types, bounds = solve_presized(
+                data, lambda sized: solve(sized, backend, mps_path, warm_start, trace, column_generation),
+                unrouted_customers if column_generation else infeasible_customers)
+            print(format_bounds(bounds, fleet_lower_bound(data, bounds)))
+            print("Solved with: " + ", ".join(f"{t.name} x{t.count}" for t in types))
+        else:
+            status, objective, routes = solve(data, backend, mps_path, warm_start, trace, column_generation)
+
+        with trace.phase("print"):
+            print(status)
+            print(objective)
+
+            # printing the route of every vehicle used
+            for vehicle_id, route in routes.items():
+                km = sum(data['distance'][a] for a in zip(route, route[1:]))
+                load = sum(data['demand'][i] for i in route[1:-1])
+                print(f" route {vehicle_id} : {' -> '.join(map(str, route))}")
+                print(f" distance {km:.2f} km, load {load:.2f} kg")
+                print("_________________________________________________________________")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Capacitated Vehicle Routing Problem with Time Windows (MIP)")
+    parser.add_argument("--backend", choices=["pulp", "highs"], default="pulp",
+                        help="pulp: PuLP model solved by Gurobi; highs: sparse CSR assembly solved by HiGHS")
+    parser.add_argument("--mps", help="also write the model as MPS, gzip compressed if the name ends in .gz")
+    parser.add_argument("--warm-start", action="store_true",
+                        help="start the MIP from the routes of a short OR-Tools solve")
+    parser.add_argument("--column-generation", action="store_true",
+                        help="solve a set partitioning model over routes by column generation, with a lower bound")
+    parser.add_argument("--presolve", action="store_true",
+                        help="remove the arcs the time windows rule out and tighten the big Ms of the time windows")
+    parser.add_argument("--presize", action="store_true",
+                        help="build the model with the trimmed fleet of fleet_sizing.py, adding vehicles back if infeasible")
+    parser.add_argument("--road-network", help="road network .npz file (road_network.py) instead of haversine KMs")
+    parser.add_argument("--speed-profiles", help="JSON file of speed factors per road class for delivery slot starts")
+    parser.add_argument("--trace", help="JSON Lines trace file of phase times and incumbents, appended to")
+    parser.add_argument("--trace-memory", action="store_true", help="also trace memory peaks with tracemalloc")
+    args = parser.parse_args()
+    main(args.backend, args.mps, args.warm_start, args.presize, args.road_network, args.speed_profiles, args.trace,
+         args.trace_memory, args.column_generation, args.presolve)
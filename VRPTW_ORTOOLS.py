@@ -1,86 +1,81 @@
 """Vehicles Routing Problem (VRP) with Time Windows."""
 
+import argparse
+
 from ortools.constraint_solver import routing_enums_pb2
 from ortools.constraint_solver import pywrapcp
-import haversine as hv
-import pandas as pd
-
-def distance_matrix(buyer_lat,buyer_long):
-    return(hv.haversine(buyer_lat,buyer_long,unit = hv.Unit.METERS))
-
-def create_data_model_1():
-    """Stores the data for the problem."""
-
-    # reading vehicle and customer data
-    data_customer = pd.read_csv(
-        r"C:\Users\Rishi Mehdiratta\Desktop\Customer Data (Updated).csv")
-    data_vehicle = pd.read_csv(
-        r"C:\Users\Rishi Mehdiratta\Desktop\Data\Vehicle_Data.csv")
-    customers: str = data_customer.loc[:, "customer_id"]
-    customers_set = list(customers)
-    depot = 0
-    nodes_set = [depot] + customers_set
-    vehicle_data: str = data_vehicle.loc[0:17, "Vehicle Type"]
-    vehicle_set = list(vehicle_data)
-
-    buyer_lat: float = data_customer.loc[:, "buyer_lat"]
-    buyer_long: float = data_customer.loc[:, "buyer_long"]
+import numpy as np
+
+from anytime import Convergence, ConvergenceMonitor
+from instance_data import load_customers, load_vehicles
+from instrumentation import open_trace, phase, watch_routing
+from matrix import cast_matrix, node_coordinates
+from matrix_cache import MatrixCache
+from neighbours import DEFAULT_K, arc_report, candidate_arcs, format_arc_report, limit_local_search
+from presolve import earliest_starts, open_arcs, remove_closed_arcs
+from routing_setup import register_matrix_transit
+from travel_times import HaversineProvider
+
+CUSTOMER_CSV = r"C:\Users\Rishi Mehdiratta\Desktop\Customer Data (Updated).csv"
+VEHICLE_CSV = r"C:\Users\Rishi Mehdiratta\Desktop\Data\Vehicle_Data.csv"
+
+
+def create_data_model_1(k=DEFAULT_K, customer_csv=CUSTOMER_CSV, vehicle_csv=VEHICLE_CSV, vehicles=18, trace=None,
+                        provider=None):
+    """Stores the data for the problem, all the customers and the first vehicles rows.
+
+    Travel times come from a travel-time provider (travel_times.py), haversine KMs by default.
+    """
+
+    # reading vehicle and customer data, typed column arrays cached as .npz after the first read
+    with phase(trace, "load"):
+        data_customer = load_customers(customer_csv)
+        data_vehicle = load_vehicles(vehicle_csv)
+    vehicle_set = data_vehicle["Vehicle Type"][:vehicles].tolist()
+
     hub_lat: float = 28.65781432
     hub_long: float = 77.21996426
-    nodes_coordinates = {}
-    for i in range(len(customers_set)):
-        nodes_coordinates.update({customers[i]: (buyer_lat[i], buyer_long[i])})
-    nodes_coordinates[0] = (hub_lat, hub_long)
-    distance_nodes = {}
-    for n1 in nodes_set:
-        for n2 in nodes_set:
-            distance_nodes.update({(n1, n2): distance_matrix(nodes_coordinates[n1], nodes_coordinates[n2])})
-    list_nodes = list(distance_nodes.values())
-    dist_matx = [[list_nodes[n1] for n1 in range(len(nodes_set))] for n1 in range(len(nodes_set))]
-    #print(dist_matx)
-
-
-    list_nodes = list(distance_nodes.values())
-    #print(list_nodes)
-    time_v = []
-    for i in range(len(list_nodes)):
-            time_v.append((list_nodes[i]/30))
-    #print(time_v)
-    time_nodes_list = [[int(time_v[n1]) for n1 in range(len(nodes_set))] for n1 in range(len(nodes_set))]
-    #print(time_nodes_list)
-
-    Earliest_time = {}
-    E = data_customer.loc[:, "E"]
-    for n in customers_set:
-        Earliest_time.update({n: E[customers_set.index(n)]})
-    #print(Earliest_time)
-
-    Latest_time = {}
-    L = data_customer.loc[:, "L"]
-    for n in customers_set:
-        Latest_time.update({n: L[customers_set.index(n)]})
-    # print(Latest_time)
-    time_gap = {}
-    time_gap[0] = (0,720)
-
-    for n in customers_set:
-        time_gap.update({n: (Earliest_time[n], Latest_time[n])})
-
-    #print(time_gap)
-    time_windows = list(time_gap.values())
-    #print(time_windows)
-
-    #print(time_nodes_list)
-    #print(time_windows)
+    # depot is node 0 followed by the customers
+    lat, long = node_coordinates(hub_lat, hub_long, data_customer["buyer_lat"], data_customer["buyer_long"])
+    with phase(trace, "matrix"):
+        provider = provider or HaversineProvider(MatrixCache())
+        slots = np.concatenate(([-1], data_customer["E"]))  # slot starts, no slot for the depot
+        # travel time in minutes at a flat 30 metres per minute
+        time_nodes_list = cast_matrix(provider.travel_minutes(lat, long, [0.03], slots)[0], np.int32).tolist()
+        # k nearest neighbours of each node plus all depot arcs, the arcs local search works on
+        arcs = candidate_arcs(lat, long, k)
+
+    with phase(trace, "time_windows"):
+        # E and L are the delivery slots parsed by instance_data.py, one window per customer row
+        time_windows = [(0, 720)] + list(zip(data_customer["E"].tolist(), data_customer["L"].tolist()))
 
     data = {}
     data['time_matrix'] = time_nodes_list
+    data['k'] = k
+    data['arc_report'] = arc_report(len(time_nodes_list), arcs)
     data['time_windows'] = time_windows
     data['num_vehicles'] = len(vehicle_set)
     data['depot'] = 0
     return data
 
 
+def presolve_time_windows(data):
+    """Raises the time windows to the earliest arrival from the depot and masks the arcs that always miss one.
+
+    Vehicles leave the depot at time 0 or later; data['open_arcs'] is the mask of the arcs
+    create_routing_model keeps (see presolve.py). Returns the number of arcs ruled out.
+    """
+    minutes = np.asarray(data['time_matrix'], dtype=np.float64)
+    windows = np.asarray(data['time_windows'], dtype=np.float64)
+    start = earliest_starts(minutes, 0.0, windows[:, 0])
+    latest = np.concatenate(([np.inf], windows[1:, 1]))
+    data['open_arcs'] = open_arcs(minutes, 0.0, start, latest)
+    data['time_windows'] = data['time_windows'][:1] + [(int(s), w[1]) for s, w in
+                                                        zip(start[1:].tolist(), data['time_windows'][1:])]
+    n = len(minutes)
+    return n * (n - 1) - int(data['open_arcs'].sum())
+
+
 def print_solution(data, manager, routing, solution):
     """Prints solution on console."""
     print(f'Objective: {solution.ObjectiveValue()}')
@@ -106,81 +101,144 @@ def print_solution(data, manager, routing, solution):
     print('Total time of all routes: {}min'.format(total_time))
 
 
-
-"""Solve the VRP with time windows."""
-# Instantiate the data problem.
-data = create_data_model_1()
-
-# Create the routing index manager.
-manager = pywrapcp.RoutingIndexManager(len(data['time_matrix']),
-                                        data['num_vehicles'], data['depot'])
-
-# Create Routing Model.
-routing = pywrapcp.RoutingModel(manager)
-
-
-# Create and register a transit callback.
-def time_callback(from_index, to_index):
-    """Returns the travel time between the two nodes."""
-    # Convert from routing variable Index to time matrix NodeIndex.
-    from_node = manager.IndexToNode(from_index)
-    to_node = manager.IndexToNode(to_index)
-    return data['time_matrix'][from_node][to_node]
-
-transit_callback_index = routing.RegisterTransitCallback(time_callback)
-
-# Define cost of each arc.
-routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
-
-# Add Time Windows constraint.
-time = 'Time'
-routing.AddDimension(
-    transit_callback_index,
-    10,  # allow waiting time
-    720,  # maximum time per vehicle
-    False,  # Don't force start cumul to zero.
-    time)
-time_dimension = routing.GetDimensionOrDie(time)
-
-
-# Add time window constraints for each location except depot.
-for location_idx, time_window in enumerate(data['time_windows']):
-    if location_idx == data['depot']:
-        continue
-    index = manager.NodeToIndex(location_idx)
-    time_dimension.CumulVar(index).SetRange(int(time_window[0]), int(time_window[1]))
-
-
-# Add time window constraints for each vehicle start node.
-depot_idx = data['depot']
-for vehicle_id in range(data['num_vehicles']):
-    index = routing.Start(vehicle_id)
-    time_dimension.CumulVar(index).SetRange(
-        data['time_windows'][depot_idx][0],
-        data['time_windows'][depot_idx][1])
-
-# Instantiate route start and end times to produce feasible times.
-for i in range(data['num_vehicles']):
-    routing.AddVariableMinimizedByFinalizer(
-        time_dimension.CumulVar(routing.Start(i)))
-    routing.AddVariableMinimizedByFinalizer(
-        time_dimension.CumulVar(routing.End(i)))
-
-
-
-# Setting first solution heuristic.
-search_parameters = pywrapcp.DefaultRoutingSearchParameters()
-search_parameters.first_solution_strategy = (
-    routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC)
-
-# Solve the problem.
-#routing.EnableOutput()
-solution = routing.SolveWithParameters(search_parameters)
-
-# Print solution on console.
-if solution:
-    print_solution(data, manager, routing, solution)
-
-
-#if __name__ == '__main__':
-#main()
+def create_routing_model(data):
+    """Creates the index manager and the routing model with its costs and time windows."""
+    # Create the routing index manager.
+    manager = pywrapcp.RoutingIndexManager(len(data['time_matrix']),
+                                           data['num_vehicles'], data['depot'])
+
+    # Create Routing Model.
+    routing = pywrapcp.RoutingModel(manager)
+
+    # Register the time matrix as a native transit.
+    transit_callback_index = register_matrix_transit(routing, data['time_matrix'])
+
+    # Define cost of each arc.
+    routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
+
+    # Add Time Windows constraint.
+    time = 'Time'
+    routing.AddDimension(
+        transit_callback_index,
+        10,  # allow waiting time
+        720,  # maximum time per vehicle
+        False,  # Don't force start cumul to zero.
+        time)
+    time_dimension = routing.GetDimensionOrDie(time)
+
+    # Add time window constraints for each location except depot.
+    for location_idx, time_window in enumerate(data['time_windows']):
+        if location_idx == data['depot']:
+            continue
+        index = manager.NodeToIndex(location_idx)
+        time_dimension.CumulVar(index).SetRange(int(time_window[0]), int(time_window[1]))
+    if data.get('open_arcs') is not None:
+        remove_closed_arcs(manager, routing, data['open_arcs'])
+
+    # Add time window constraints for each vehicle start node.
+    depot_idx = data['depot']
+    for vehicle_id in range(data['num_vehicles']):
+        index = routing.Start(vehicle_id)
+        time_dimension.CumulVar(index).SetRange(
+            data['time_windows'][depot_idx][0],
+            data['time_windows'][depot_idx][1])
+
+    # Instantiate route start and end times to produce feasible times.
+    for i in range(data['num_vehicles']):
+        routing.AddVariableMinimizedByFinalizer(
+            time_dimension.CumulVar(routing.Start(i)))
+        routing.AddVariableMinimizedByFinalizer(
+            time_dimension.CumulVar(routing.End(i)))
+    return manager, routing
+
+
+def create_search_parameters(data, time_limit=None):
+    """Returns the search parameters of the single solve of main, without a time limit if time_limit is None."""
+    # Setting first solution heuristic.
+    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+    search_parameters.first_solution_strategy = (
+        routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC)
+    if time_limit:
+        search_parameters.time_limit.FromMilliseconds(max(int(time_limit * 1000), 1))
+    # Restrict local search to the candidate arcs.
+    limit_local_search(search_parameters, data['k'], len(data['time_matrix']))
+    return search_parameters
+
+
+def main(workers=1, time_limit=None, trace_path=None, trace_memory=False, presolve=False, stall=None,
+         road_network=None, speed_profiles=None):
+    """Solve the VRP with time windows, with a portfolio of parallel solves if workers > 1.
+
+    presolve tightens the time windows and rules out the arcs that always miss one first.
+
+    Phase times and every solution found go to the trace file trace_path (see instrumentation.py).
+    With stall the single solve stops once it has not improved for stall seconds (see anytime.py).
+    With road_network, a road network .npz file, travel times follow its roads, slowed down per
+    delivery slot by the speed_profiles JSON file.
+    """
+    with open_trace(trace_path, trace_memory, run="VRPTW_ORTOOLS") as trace:
+        provider = None
+        if road_network is not None:
+            from travel_times import RoadNetworkProvider, load_profiles
+
+            provider = RoadNetworkProvider(road_network, load_profiles(speed_profiles) if speed_profiles else None)
+        # Instantiate the data problem.
+        data = create_data_model_1(trace=trace, provider=provider)
+        print(format_arc_report(data['arc_report']))
+        if presolve:
+            with trace.phase("presolve"):
+                print(f"Presolve: {presolve_time_windows(data)} arcs miss every time window")
+
+        if workers > 1:
+            from portfolio import format_worker_stats, portfolio_configs, solve_portfolio
+
+            # the vehicles are identical, a seed has nothing to reorder: every worker gets its own pair
+            with trace.phase("solve"):
+                best, stats = solve_portfolio(data, create_routing_model, portfolio_configs(workers, seeds=False),
+                                              time_limit or 10, shared_keys=('time_matrix',), vehicle_keys=())
+            if best is not None:
+                trace.solution(best['objective'], "portfolio", config=best['config'])
+            with trace.phase("print"):
+                print(format_worker_stats(stats))
+                if best is not None:
+                    print(f"best of {len(stats)} workers: {best['config']}, objective {best['objective']}")
+                    for vehicle_id, route in best['routes'].items():
+                        print('Route for vehicle {}:\n {}'.format(vehicle_id, ' -> '.join(map(str, route))))
+            return
+
+        with trace.phase("model"):
+            manager, routing = create_routing_model(data)
+            search_parameters = create_search_parameters(data, time_limit)
+            watch_routing(trace, routing)
+            if stall is not None:
+                monitor = ConvergenceMonitor(Convergence(stall_seconds=stall))
+                monitor.watch_routing(routing)
+
+        # Solve the problem.
+        #routing.EnableOutput()
+        with trace.phase("solve"):
+            solution = routing.SolveWithParameters(search_parameters)
+
+        # Print solution on console.
+        with trace.phase("print"):
+            if solution:
+                print_solution(data, manager, routing, solution)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Vehicle Routing Problem with Time Windows (OR-Tools)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of parallel solves with different strategies, at most one per strategy pair")
+    parser.add_argument("--time-limit", type=float, default=None,
+                        help="wall-clock budget in seconds, 10 by default with several workers")
+    parser.add_argument("--trace", help="JSON Lines trace file of phase times and solutions, appended to")
+    parser.add_argument("--trace-memory", action="store_true", help="also trace memory peaks with tracemalloc")
+    parser.add_argument("--presolve", action="store_true",
+                        help="tighten the time windows and remove the arcs that always miss one")
+    parser.add_argument("--stall", type=float, default=None, metavar="SECONDS",
+                        help="stop the search once it has not improved for this many seconds")
+    parser.add_argument("--road-network", help="road network .npz file (road_network.py) instead of haversine KMs")
+    parser.add_argument("--speed-profiles", help="JSON file of speed factors per road class for delivery slot starts")
+    args = parser.parse_args()
+    main(args.workers, args.time_limit, args.trace, args.trace_memory, args.presolve, args.stall, args.road_network,
+         args.speed_profiles)
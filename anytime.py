@@ -0,0 +1,251 @@
+"""Anytime solving: improving solutions streamed while the solver runs, stopped once it converges.
+
+An AnytimeSolve runs a solve in a thread and yields every improving solution as the
+solver finds it, from an OR-Tools solution callback or a HiGHS improving solution
+callback, so dispatch can start from a good enough plan early:
+
+    for incumbent in anytime_routing(data, Convergence(time_limit=60, stall_seconds=5)):
+        print(incumbent.seconds, incumbent.objective)
+
+or, in asyncio code, `async for incumbent in anytime_routing(...)`. The search stops at
+the first rule of its Convergence that holds: the time limit, no improvement for
+stall_seconds, a relative improvement rate below min_rate over the last window seconds, or
+an objective at or below target. Leaving the loop early stops the search too. Gurobi
+behind PuLP has no callbacks, the MIP streams from the sparse model solved by HiGHS.
+"""
+
+import asyncio
+import dataclasses
+import queue
+import threading
+import time
+from dataclasses import dataclass
+
+POLL_SECONDS = 0.01  # the solvers ask whether to stop far more often, the rules are checked this often
+_DONE = object()
+
+
+@dataclass
+class Convergence:
+    """When an anytime solve stops; None turns a rule off."""
+    time_limit: float = None  # seconds
+    stall_seconds: float = None  # seconds without an improving solution
+    min_rate: float = None  # relative improvement per second over the last window seconds
+    window: float = 10.0
+    target: float = None  # objective that is good enough
+
+    def reason(self, seconds, trajectory):
+        """Returns the rule that stops a solve at seconds with the (seconds, objective) trajectory, or None."""
+        if self.time_limit is not None and seconds >= self.time_limit:
+            return "time_limit"
+        if not trajectory:
+            return None
+        last, best = trajectory[-1]
+        if self.target is not None and best <= self.target:
+            return "target"
+        if self.stall_seconds is not None and seconds - last >= self.stall_seconds:
+            return "stall"
+        if self.min_rate is not None and seconds - trajectory[0][0] >= self.window:
+            before = [objective for t, objective in trajectory if t <= seconds - self.window][-1]
+            if (before - best) / max(abs(before), 1e-9) / self.window < self.min_rate:
+                return "rate"
+        return None
+
+
+@dataclass
+class Incumbent:
+    """An improving solution, found seconds after the solve started."""
+    seconds: float
+    objective: float
+    solution: object
+    source: str
+
+
+class _CurrentValues:
+    """Stands in for an OR-Tools Assignment in a solution callback, where the variables hold the solution."""
+
+    @staticmethod
+    def Value(var):
+        return var.Value()
+
+
+CURRENT_VALUES = _CurrentValues()
+
+
+class ConvergenceMonitor:
+    """Keeps the improving solutions of one solve and tells the solver when its Convergence stops it.
+
+    on_improvement is called with every Incumbent, in the solver's thread.
+    """
+
+    def __init__(self, convergence, on_improvement=None):
+        self.convergence = convergence
+        self.on_improvement = on_improvement
+        self.started = time.perf_counter()
+        self.trajectory = []
+        self.reason = None
+        self._checked = 0.0
+        self._callbacks = []  # solver callbacks must outlive the solve
+
+    def solution(self, objective, read=None, source=None):
+        """Records a solution of a minimisation; read() returns its solution when it improves."""
+        if self.trajectory and objective >= self.trajectory[-1][1]:
+            return
+        seconds = time.perf_counter() - self.started
+        self.trajectory.append((seconds, objective))
+        if self.on_improvement is not None:
+            self.on_improvement(Incumbent(seconds, objective, read() if read is not None else None, source))
+
+    def stop(self, reason="stopped"):
+        """Asks the solver to stop at its next check."""
+        if self.reason is None:
+            self.reason = reason
+
+    def should_stop(self):
+        if self.reason is None:
+            seconds = time.perf_counter() - self.started
+            if seconds - self._checked >= POLL_SECONDS:
+                self._checked = seconds
+                self.reason = self.convergence.reason(seconds, self.trajectory)
+        return self.reason is not None
+
+    def watch_routing(self, routing, read=None):
+        """Watches an OR-Tools routing search; read() returns the solution at hand in a solution callback."""
+        def at_solution():
+            self.solution(routing.CostVar().Max(), read, "ortools")
+
+        limit = routing.solver().CustomLimit(self.should_stop)
+        self._callbacks.extend((at_solution, limit))
+        routing.AddAtSolutionCallback(at_solution)
+        routing.AddSearchMonitor(limit)
+
+    def watch_highs(self, h, read=None):
+        """Watches the MIP solve of a highspy.Highs instance; read(values) returns the solution of a column vector."""
+        def improving(event):
+            values = event.data_out.mip_solution
+            self.solution(event.data_out.objective_function_value,
+                          (lambda: read(values)) if read is not None else None, "highs")
+
+        def interrupt(event):
+            if self.should_stop():
+                event.data_in.user_interrupt = True
+
+        self._callbacks.extend((improving, interrupt))
+        h.cbMipImprovingSolution.subscribe(improving)
+        h.cbMipInterrupt.subscribe(interrupt)
+
+
+class AnytimeSolve:
+    """The improving solutions of a solve running in a thread, iterated over with for or async for.
+
+    solve(monitor) runs the solver watched by monitor, a ConvergenceMonitor, and returns its
+    final result, kept in result once the iteration ends; reason tells why the search
+    stopped ("finished" when the solver ended on its own). decode, when given, turns what
+    the monitor read at a solution into the solution yielded; it runs in the caller's thread.
+    """
+
+    def __init__(self, solve, convergence=None, decode=None):
+        self.monitor = ConvergenceMonitor(convergence or Convergence(), self._queue_incumbent)
+        self.result = None
+        self.best = None
+        self._solve = solve
+        self._decode = decode
+        self._queue = queue.Queue()
+        self._thread = None
+        self._error = None
+
+    @property
+    def reason(self):
+        return self.monitor.reason
+
+    def start(self):
+        if self._thread is None:
+            self.monitor.started = time.perf_counter()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stops the search; the iteration ends after the solutions already found."""
+        self.monitor.stop()
+
+    def _run(self):
+        try:
+            self.result = self._solve(self.monitor)
+        except BaseException as error:
+            self._error = error
+        finally:
+            self.monitor.stop("finished")
+            self._queue.put(_DONE)
+
+    def _queue_incumbent(self, incumbent):
+        self._queue.put(incumbent)
+
+    def _next(self, item):
+        if self._decode is not None:
+            item = dataclasses.replace(item, solution=self._decode(item.solution))
+        self.best = item
+        return item
+
+    def _finish(self):
+        if self._error is not None:
+            raise self._error
+
+    def __iter__(self):
+        self.start()
+        try:
+            while (item := self._queue.get()) is not _DONE:
+                yield self._next(item)
+        finally:
+            self.monitor.stop("closed")
+            self._thread.join()
+        self._finish()
+
+    async def __aiter__(self):
+        self.start()
+        try:
+            while (item := await asyncio.to_thread(self._queue.get)) is not _DONE:
+                yield self._next(item)
+        finally:
+            self.monitor.stop("closed")
+            await asyncio.to_thread(self._thread.join)
+        self._finish()
+
+    def run(self):
+        """Runs the solve to its end; returns the last improving solution, or None."""
+        for _ in self:
+            pass
+        return self.best
+
+
+def anytime_routing(data, convergence=None, initial_routes=None):
+    """AnytimeSolve of the OR-Tools CVRPTW of cvrptw_routing.py.
+
+    Solutions are (routes by type name, dropped customers) like solve_routing returns, and
+    so is result. Without a time limit in convergence the search stops after an hour.
+    """
+    from cvrptw_routing import solve_routing, type_routes
+
+    convergence = convergence or Convergence()
+    time_limit = convergence.time_limit or 3600
+
+    def decode(read):
+        routes, dropped = read
+        return type_routes(data, routes), dropped
+
+    return AnytimeSolve(lambda monitor: solve_routing(data, time_limit, initial_routes, monitor=monitor),
+                        convergence, decode)
+
+
+def anytime_mip(data, convergence=None, mip_gap=None, start=None):
+    """AnytimeSolve of the sparse MIP of sparse_model.py solved by HiGHS.
+
+    Solutions are routes by vehicle ID; result is solve_highs's (status, objective, column
+    values). start is an optional MIP start column vector.
+    """
+    from sparse_model import build_sparse_model, extract_routes, solve_highs
+
+    convergence = convergence or Convergence()
+    model = build_sparse_model(data)
+    return AnytimeSolve(lambda monitor: solve_highs(model, convergence.time_limit, mip_gap, start=start,
+                                                    monitor=monitor),
+                        convergence, lambda values: extract_routes(data, model, values))
@@ -0,0 +1,202 @@
+"""Batch solver for many hub/day instances, streaming one JSON Lines record per solved instance.
+
+Instances come either from a directory or from one CSV partitioned by columns such as hub
+and date:
+
+    python batch.py instances/ --vehicles Vehicle_Data.csv --workers 8 --output plans.jsonl
+    python batch.py orders.csv --partition-by hub date --workers 8
+
+In a directory every subdirectory holding a Customer_Data.csv is an instance (with its
+own Vehicle_Data.csv when it has one), and so is every other CSV file directly in it.
+Rows may carry hub_lat/hub_long columns; without them the hub of CVRP_GUROBI.py is used.
+
+Each instance is solved with the OR-Tools CVRPTW of cvrptw_routing.py in a pool of worker
+processes. The distance matrices are stored by this process in the matrix cache, where an
+instance sharing customers with an earlier one only computes the rows of its new nodes,
+and the workers memory-map them read-only. Records are written in completion order as
+soon as each instance finishes.
+
+With --store the plans are kept in the solution store of solution_store.py: an instance
+seen before is answered from it and a new one starts from the nearest stored plan.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pandas as pd
+
+from CVRP_GUROBI import HUB_LAT, HUB_LONG, model_data
+from cvrptw_routing import solve_routing
+from decomposition import plan_cost
+from fleet import assign_vehicles, vehicle_types
+from fleet_sizing import dropped_customers, solve_presized
+from matrix import DENSE_NODES, node_coordinates
+from matrix_cache import MATRIX_CACHE_DIR, MatrixCache
+from neighbours import DEFAULT_K
+from solution_store import SolutionStore, solve_with_store
+
+CUSTOMER_FILE = "Customer_Data.csv"
+VEHICLE_FILE = "Vehicle_Data.csv"
+
+
+def hub_of(customer_data):
+    """Returns the hub location of an instance, from its hub_lat/hub_long columns when it has them."""
+    if {"hub_lat", "hub_long"}.issubset(customer_data.columns):
+        return float(customer_data["hub_lat"].iloc[0]), float(customer_data["hub_long"].iloc[0])
+    return HUB_LAT, HUB_LONG
+
+
+def directory_instances(directory, vehicle_csv):
+    """Yields (instance ID, customer frame, vehicle frame) for every instance found in a directory."""
+    vehicles = {}
+
+    def read_vehicles(path):
+        if path not in vehicles:
+            vehicles[path] = pd.read_csv(path)
+        return vehicles[path]
+
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if os.path.isdir(path) and os.path.exists(os.path.join(path, CUSTOMER_FILE)):
+            own_vehicles = os.path.join(path, VEHICLE_FILE)
+            yield (name, pd.read_csv(os.path.join(path, CUSTOMER_FILE)),
+                   read_vehicles(own_vehicles if os.path.exists(own_vehicles) else vehicle_csv))
+        elif name.endswith(".csv") and name != VEHICLE_FILE and os.path.isfile(path):
+            yield os.path.splitext(name)[0], pd.read_csv(path), read_vehicles(vehicle_csv)
+
+
+def partitioned_instances(csv_path, partition_by, vehicle_csv):
+    """Yields (instance ID, customer frame, vehicle frame) for every group of rows of a partitioned CSV."""
+    vehicle_data = pd.read_csv(vehicle_csv)
+    for key, rows in pd.read_csv(csv_path).groupby(partition_by, sort=False):
+        key = key if isinstance(key, tuple) else (key,)
+        yield ";".join(f"{column}={value}" for column, value in zip(partition_by, key)), rows, vehicle_data
+
+
+def solve_instance(instance, customer_data, vehicle_data, time_limit=1, k=DEFAULT_K, cache_dir=MATRIX_CACHE_DIR,
+                   presize=True, store_dir=None):
+    """Solves one instance and returns its JSON Lines record.
+
+    With presize the routing model gets the trimmed fleet of fleet_sizing.py, grown back
+    when it leaves customers unserved that more vehicles could serve. With store_dir every
+    solve goes through the solution store there; the record lists how each one started.
+    """
+    started = time.perf_counter()
+    seconds = {}
+    hub_lat, hub_long = hub_of(customer_data)
+    types = vehicle_types(vehicle_data)
+    data = model_data(customer_data, types, k, MatrixCache(cache_dir, read_only=True), hub_lat, hub_long)
+    seconds['model'] = time.perf_counter() - started
+
+    stage = time.perf_counter()
+    store = SolutionStore(store_dir) if store_dir is not None else None
+    starts = []
+
+    def solve(sized):
+        if store is None:
+            return solve_routing(sized, time_limit)
+        routes_by_type, dropped, info = solve_with_store(sized, store, time_limit, {'k': k, 'time_limit': time_limit})
+        starts.append(info['start'])
+        return routes_by_type, dropped
+
+    if presize:
+        (routes_by_type, dropped), fleet, _ = solve_presized(data, solve, dropped_customers)
+    else:
+        (routes_by_type, dropped), fleet = solve(data), types
+    seconds['solve'] = time.perf_counter() - stage
+    record = {'instance': instance, 'customers': len(customer_data), 'fleet': {t.name: t.count for t in fleet}}
+    if store_dir is not None:
+        record['starts'] = starts
+    if routes_by_type is None:
+        record.update(status='no solution', seconds=seconds)
+        return record
+    routes = assign_vehicles(routes_by_type, types)
+    cost, km = plan_cost(customer_data, types, routes, hub_lat, hub_long)
+    seconds['total'] = time.perf_counter() - started
+    record.update(status='solved', cost=cost, km=km, vehicles_used=len(routes), dropped=dropped,
+                  routes=routes, seconds=seconds)
+    return record
+
+
+def write_record(output, record):
+    output.write(json.dumps(record, default=lambda value: value.item()) + "\n")
+    output.flush()
+
+
+def run_batch(instances, output, workers=None, time_limit=1, k=DEFAULT_K, cache_dir=MATRIX_CACHE_DIR, presize=True,
+              store_dir=None):
+    """Solves the instances in a pool of workers, writing each record to output as it finishes.
+
+    At most twice as many instances as workers are in flight, so a large batch is never
+    read into memory at once. Returns the number of records written.
+    """
+    workers = workers or os.cpu_count()
+    cache = MatrixCache(cache_dir)
+    written = 0
+
+    def drain(futures):
+        nonlocal written
+        for future in futures:
+            instance = pending.pop(future)
+            try:
+                record = future.result()
+            except Exception:
+                record = {'instance': instance, 'status': 'error', 'error': traceback.format_exc(limit=3)}
+            write_record(output, record)
+            written += 1
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        for instance, customer_data, vehicle_data in instances:
+            # stored once here, the workers only memory-map it; model_data tiles larger instances instead
+            if len(customer_data) + 1 <= DENSE_NODES:
+                cache.get(*node_coordinates(*hub_of(customer_data), customer_data.loc[:, "buyer_lat"],
+                                            customer_data.loc[:, "buyer_long"]))
+            future = executor.submit(solve_instance, instance, customer_data, vehicle_data, time_limit, k, cache_dir,
+                                     presize, store_dir)
+            pending[future] = instance
+            if len(pending) >= 2 * workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                drain(done)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            drain(done)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("source", help="directory of instances or a CSV partitioned by --partition-by")
+    parser.add_argument("--vehicles", default=VEHICLE_FILE, help="vehicle CSV of instances without their own")
+    parser.add_argument("--partition-by", nargs="+", default=["hub", "date"],
+                        help="columns that identify an instance in a partitioned CSV")
+    parser.add_argument("--workers", type=int, default=None, help="instances solved at the same time")
+    parser.add_argument("--time-limit", type=float, default=1, help="seconds per instance")
+    parser.add_argument("--k", type=int, default=DEFAULT_K, help="nearest neighbours per node")
+    parser.add_argument("--no-presize", action="store_true",
+                        help="route with the full fleet instead of the trimmed fleet of fleet_sizing.py")
+    parser.add_argument("--store", default=None, metavar="DIR",
+                        help="solution store that answers repeated instances and warm-starts new ones")
+    parser.add_argument("--output", default="-", help="JSON Lines file, - for stdout")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.source):
+        instances = directory_instances(args.source, args.vehicles)
+    else:
+        instances = partitioned_instances(args.source, args.partition_by, args.vehicles)
+    output = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        run_batch(instances, output, args.workers, args.time_limit, args.k, presize=not args.no_presize,
+                  store_dir=args.store)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Benchmarks for the routing solvers, run from the repository root with python -m benchmarks.<name>."""
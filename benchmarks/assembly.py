@@ -0,0 +1,60 @@
+"""Model assembly time and peak memory, PuLP objects against the sparse CSR path.
+
+Builds the CVRPTW of CVRP_GUROBI.py for several customer counts both ways and reports
+the build time, the peak memory traced by tracemalloc and the model size. The PuLP path
+also includes writing CVRPTW.lp, which CVRP_GUROBI.main does on every run.
+
+    python -m benchmarks.assembly --sizes 20 40 80 150 --k 10
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from CVRP_GUROBI import build_model, create_data_model
+from sparse_model import build_sparse_model
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(func, *args):
+    """Runs func and returns (result, seconds, peak traced MB)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak / 2 ** 20
+
+
+def build_pulp(data, lp_path):
+    prob, variables = build_model(data)
+    prob.writeLP(lp_path)
+    return prob
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20, 40, 80, 150], help="customer counts m")
+    parser.add_argument("--k", type=int, default=10, help="nearest neighbours per node, 0 for the complete graph")
+    parser.add_argument("--customers", default=os.path.join(REPO_DIR, "Customer_Data.csv"))
+    parser.add_argument("--vehicles", default=os.path.join(REPO_DIR, "Vehicle_Data.csv"))
+    args = parser.parse_args()
+
+    print("{:>5} {:>8} {:>8} {:>10} {:>10} {:>12} {:>12}".format(
+        "m", "columns", "rows", "pulp s", "sparse s", "pulp MB", "sparse MB"))
+    with tempfile.TemporaryDirectory() as tmp:
+        for m in args.sizes:
+            data = create_data_model(m=m - 1, k=args.k or m, customer_csv=args.customers,
+                                     vehicle_csv=args.vehicles)
+            _, pulp_seconds, pulp_mb = measure(build_pulp, data, os.path.join(tmp, "CVRPTW.lp"))
+            model, sparse_seconds, sparse_mb = measure(build_sparse_model, data)
+            print("{:>5} {:>8} {:>8} {:>10.3f} {:>10.3f} {:>12.1f} {:>12.1f}".format(
+                m, model.A.shape[1], model.A.shape[0], pulp_seconds, sparse_seconds, pulp_mb, sparse_mb))
+
+
+if __name__ == "__main__":
+    main()
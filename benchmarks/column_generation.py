@@ -0,0 +1,62 @@
+"""Lower bound and gap of the column generation against the OR-Tools plan it starts from.
+
+Instances come from benchmarks.generator. Its fleet of one Vehicle_Data.csv per 250
+customers cannot serve them completely (only the boleros carry parcels over 100 kg), so
+--fleet-copies replicates it that many times more; with 3 copies every customer can be
+served and the gap is the one of plain cost. Results go to a JSON file.
+
+    python -m benchmarks.column_generation --sizes 100 250 500 --fleet-copies 3 --time-limit 120
+"""
+
+import argparse
+import json
+import os
+
+import pandas as pd
+
+from benchmarks.decomposition import REPO_DIR
+from benchmarks.generator import INSTANCE_DIR, generate_vehicles, instance_paths
+from column_generation import PRICING_ROUTES, solve_column_generation
+from CVRP_GUROBI import model_data
+from fleet import vehicle_types
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 250, 500])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fleet-copies", type=int, default=3, help="copies of the generated fleet")
+    parser.add_argument("--heuristic-time", type=float, default=5, help="seconds of the OR-Tools seed solve")
+    parser.add_argument("--time-limit", type=float, default=120, help="seconds of column generation")
+    parser.add_argument("--mip-time", type=float, default=60, help="seconds of the final MIP")
+    parser.add_argument("--routes", type=int, default=PRICING_ROUTES, help="routes priced per type and iteration")
+    parser.add_argument("--instances", default=INSTANCE_DIR, help="directory of the generated instances")
+    parser.add_argument("--vehicles", default=os.path.join(REPO_DIR, "Vehicle_Data.csv"))
+    parser.add_argument("--output", default="column_generation.json")
+    args = parser.parse_args()
+
+    vehicle_data = pd.read_csv(args.vehicles)
+    print("{:>6} {:>12} {:>8} {:>12} {:>8} {:>12} {:>12} {:>8} {:>8} {:>9}".format(
+        "size", "seed cost", "dropped", "cost", "dropped", "LP", "bound", "gap", "columns", "seconds"))
+    results = []
+    for size in args.sizes:
+        customer_csv, _ = instance_paths(size, args.seed, args.instances, args.vehicles)
+        types = vehicle_types(generate_vehicles(vehicle_data, size * args.fleet_copies))
+        data = model_data(pd.read_csv(customer_csv), types)
+        result = solve_column_generation(data, args.heuristic_time, args.time_limit, args.mip_time,
+                                         routes_per_type=args.routes, seed=args.seed)
+        summary = {key: value for key, value in result.items() if key not in ('routes', 'dropped', 'seed_dropped')}
+        summary.update(size=size, dropped=len(result['dropped']), seed_dropped=len(result['seed_dropped'] or []))
+        results.append(summary)
+        print("{:>6} {:>12} {:>8} {:>12.1f} {:>8} {:>12.1f} {:>12.1f} {:>8} {:>8} {:>9.1f}".format(
+            size, f"{result['seed_objective']:.1f}" if result['seed_objective'] is not None else "-",
+            summary['seed_dropped'], result['objective'], summary['dropped'], result['lp_objective'],
+            result['lower_bound'], f"{result['gap']:.2%}" if result['gap'] is not None else "-",
+            result['columns'], result['seconds']['total']))
+
+    with open(args.output, "w") as f:
+        json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Wall-clock time and plan cost of the decomposition against the monolithic OR-Tools solve.
+
+Instances of every size are drawn from Customer_Data.csv: customers are resampled with
+their weights, service times and slots, and their coordinates jittered by about 500 m.
+The fleet of Vehicle_Data.csv is replicated once per 250 customers. Sizes above
+--monolithic-max are only solved decomposed, the dense matrices of the monolithic model
+no longer fit in memory there. Results go to a JSON file and, when matplotlib is
+installed, to a plot of time and cost against size.
+
+    python -m benchmarks.decomposition --sizes 250 1000 2500 10000 --method sweep
+"""
+
+import argparse
+import json
+import math
+import os
+from dataclasses import replace
+
+import numpy as np
+import pandas as pd
+
+from decomposition import DEFAULT_PARTITION_SIZE, PARTITION_METHODS, solve_decomposed, solve_monolithic
+from fleet import vehicle_types
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASE_SIZE = 250  # customers served by one copy of the fleet
+
+
+def synthetic_customers(customer_data, size, seed=0, jitter=0.005):
+    """Returns size customers resampled from customer_data with coordinates jittered by jitter degrees."""
+    rng = np.random.default_rng(seed)
+    sample = customer_data.iloc[rng.integers(0, len(customer_data), size)].reset_index(drop=True)
+    sample["buyer_lat"] += rng.normal(0.0, jitter, size)
+    sample["buyer_long"] += rng.normal(0.0, jitter, size)
+    sample["customer_no"] = np.arange(1, size + 1)
+    sample["customer_id"] = [f"s_{i}" for i in range(1, size + 1)]
+    return sample
+
+
+def scaled_fleet(types, size):
+    """Replicates every vehicle of types once per BASE_SIZE customers."""
+    copies = math.ceil(size / BASE_SIZE)
+    return [replace(t, vehicle_ids=[f"{v}#{c}" for c in range(copies) for v in t.vehicle_ids]) for t in types]
+
+
+def summary(result):
+    return {"cost": result["cost"], "km": result["km"], "dropped": len(result["dropped"]),
+            "routes": len(result["routes"]), "partitions": result["partitions"],
+            "repaired": result["repaired"], "seconds": result["seconds"]}
+
+
+def plot(results, path):
+    """Plots wall-clock time and cost per customer served against size."""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, (ax_time, ax_cost) = plt.subplots(1, 2, figsize=(11, 4))
+    for solver in ("decomposed", "monolithic"):
+        rows = [r for r in results if solver in r]
+        sizes = [r["size"] for r in rows]
+        ax_time.plot(sizes, [r[solver]["seconds"]["total"] for r in rows], marker="o", label=solver)
+        ax_cost.plot(sizes, [r[solver]["cost"] / max(r["size"] - r[solver]["dropped"], 1) for r in rows],
+                     marker="o", label=solver)
+    ax_time.set(xlabel="customers", ylabel="wall-clock seconds", xscale="log", yscale="log")
+    ax_cost.set(xlabel="customers", ylabel="cost per customer served", xscale="log")
+    for ax in (ax_time, ax_cost):
+        ax.legend()
+        ax.grid(True, which="both", alpha=0.3)
+    fig.tight_layout()
+    fig.savefig(path, dpi=120)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[250, 1000, 2500, 5000, 10000])
+    parser.add_argument("--method", choices=PARTITION_METHODS, default="sweep")
+    parser.add_argument("--no-slots", action="store_true", help="partition by geography only")
+    parser.add_argument("--max-size", type=int, default=DEFAULT_PARTITION_SIZE, help="customers per partition")
+    parser.add_argument("--time-limit", type=float, default=1, help="seconds per partition")
+    parser.add_argument("--repair-time", type=float, default=1, help="seconds per boundary repair")
+    parser.add_argument("--monolithic-time", type=float, default=30, help="seconds of the monolithic solve")
+    parser.add_argument("--monolithic-max", type=int, default=1000, help="largest size also solved monolithically")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--customers", default=os.path.join(REPO_DIR, "Customer_Data.csv"))
+    parser.add_argument("--vehicles", default=os.path.join(REPO_DIR, "Vehicle_Data.csv"))
+    parser.add_argument("--output", default="decomposition.json")
+    parser.add_argument("--plot", default="decomposition.png")
+    args = parser.parse_args()
+
+    customer_data = pd.read_csv(args.customers)
+    types = vehicle_types(pd.read_csv(args.vehicles))
+    print("{:>6} {:>11} {:>5} {:>9} {:>12} {:>8} {:>9} {:>12} {:>8}".format(
+        "size", "partitions", "kept", "dec s", "dec cost", "dropped", "mono s", "mono cost", "dropped"))
+    results = []
+    for size in args.sizes:
+        instance = synthetic_customers(customer_data, size, args.seed)
+        fleet = scaled_fleet(types, size)
+        result = {"size": size, "decomposed": summary(solve_decomposed(
+            instance, fleet, args.max_size, args.method, not args.no_slots, args.time_limit, args.repair_time,
+            args.workers, seed=args.seed))}
+        if size <= args.monolithic_max:
+            result["monolithic"] = summary(solve_monolithic(instance, fleet, args.monolithic_time))
+        results.append(result)
+        dec, mono = result["decomposed"], result.get("monolithic")
+        print("{:>6} {:>11} {:>5} {:>9.1f} {:>12.1f} {:>8} {:>9} {:>12} {:>8}".format(
+            size, dec["partitions"], dec["repaired"], dec["seconds"]["total"], dec["cost"], dec["dropped"],
+            f"{mono['seconds']['total']:.1f}" if mono else "-", f"{mono['cost']:.1f}" if mono else "-",
+            mono["dropped"] if mono else "-"))
+
+    with open(args.output, "w") as f:
+        json.dump({"args": vars(args), "results": results}, f, indent=2)
+    try:
+        plot(results, args.plot)
+    except ImportError:
+        print("matplotlib is not installed, skipping the plot")
+
+
+if __name__ == "__main__":
+    main()
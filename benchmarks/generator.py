@@ -0,0 +1,104 @@
+"""Seeded synthetic instances shaped like Customer_Data.csv and Vehicle_Data.csv.
+
+Customers come in pincode clusters scattered around the hub, like the c_<pincode>_<n>
+customers of Customer_Data.csv. Delivery slots, service times and weights follow the
+shares of Customer_Data.csv: an eighth of the customers order under 10 kg (parcels only
+the bikes take), the rest between 10 and 500 kg. The fleet is Vehicle_Data.csv with every
+vehicle replicated once per 250 customers. The same size and seed always give the same
+files, so benchmark results of different commits compare like for like.
+
+    python -m benchmarks.generator --sizes 100 1000 20000 --seed 0 --directory .benchmark_instances
+"""
+
+import argparse
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.decomposition import BASE_SIZE, REPO_DIR
+from CVRP_GUROBI import HUB_LAT, HUB_LONG
+from instance_data import slot_minutes
+
+INSTANCE_DIR = ".benchmark_instances"
+# (start, end, share) of the delivery slots of Customer_Data.csv
+SLOTS = [("7:00 AM", "1:00 PM", 0.356), ("10:00 AM", "1:00 PM", 0.14), ("1:00 PM", "4:00 PM", 0.16),
+         ("4:00 PM", "7:00 PM", 0.344)]
+SERVICE_MINUTES = [(5, 0.104), (7, 0.32), (10, 0.576)]
+LIGHT_SHARE = 0.128  # customers under 10 kg
+CUSTOMERS_PER_PINCODE = 28
+PINCODE_SPREAD = 0.04  # degrees, standard deviation of the pincode centres around the hub
+CUSTOMER_SPREAD = 0.008  # degrees, standard deviation of the customers around their pincode centre
+FIRST_PINCODE = 110001
+
+
+def generate_customers(size, seed=0, hub_lat=HUB_LAT, hub_long=HUB_LONG):
+    """Returns a Customer_Data.csv frame of size customers."""
+    rng = np.random.default_rng(seed)
+    pincodes = max(1, round(size / CUSTOMERS_PER_PINCODE))
+    centre_lat = hub_lat + rng.normal(0.0, PINCODE_SPREAD, pincodes)
+    centre_long = hub_long + rng.normal(0.0, PINCODE_SPREAD, pincodes)
+    pincode = rng.integers(0, pincodes, size)
+
+    slot = rng.choice(len(SLOTS), size, p=[share for *_, share in SLOTS])
+    starts = np.array([start for start, _, _ in SLOTS])[slot]
+    ends = np.array([end for _, end, _ in SLOTS])[slot]
+    service = rng.choice([m for m, _ in SERVICE_MINUTES], size, p=[share for _, share in SERVICE_MINUTES])
+    light = rng.random(size) < LIGHT_SHARE
+    weight = np.where(light, np.exp(rng.uniform(np.log(0.3), np.log(10.0), size)),
+                      10.0 + 490.0 * rng.beta(1.1, 1.8, size))
+
+    number = np.zeros(size, dtype=np.int64)  # running number of every customer within its pincode
+    for p in np.unique(pincode):
+        members = pincode == p
+        number[members] = np.arange(1, members.sum() + 1)
+    return pd.DataFrame({
+        "customer_id": [f"c_{FIRST_PINCODE + p}_{n}" for p, n in zip(pincode.tolist(), number.tolist())],
+        "buyer_lat": np.round(centre_lat[pincode] + rng.normal(0.0, CUSTOMER_SPREAD, size), 8),
+        "buyer_long": np.round(centre_long[pincode] + rng.normal(0.0, CUSTOMER_SPREAD, size), 8),
+        "weight(Kg)": np.round(weight, 2),
+        "transaction_time(mins)": service,
+        "delivery_slot_start": starts,
+        "delivery_slot_end": ends,
+        "customer_no": np.arange(1, size + 1),
+        "E": slot_minutes(starts),
+        "L": slot_minutes(ends),
+    })
+
+
+def generate_vehicles(vehicle_data, size):
+    """Returns vehicle_data, a Vehicle_Data.csv frame, with every vehicle replicated once per BASE_SIZE customers."""
+    copies = math.ceil(size / BASE_SIZE)
+    kind = vehicle_data["Vehicle Type"].str.rsplit("_", n=1).str[0]
+    fleet = pd.concat([vehicle_data] * copies, ignore_index=True)
+    fleet_kind = pd.concat([kind] * copies, ignore_index=True)
+    fleet["Vehicle Type"] = fleet_kind + "_" + (fleet.groupby(fleet_kind).cumcount() + 1).astype(str)
+    return fleet
+
+
+def instance_paths(size, seed=0, directory=INSTANCE_DIR, vehicle_csv=os.path.join(REPO_DIR, "Vehicle_Data.csv")):
+    """Returns the customer and vehicle CSV of an instance, writing them the first time."""
+    os.makedirs(directory, exist_ok=True)
+    customer_csv = os.path.join(directory, f"customers_{size}_{seed}.csv")
+    vehicle_out = os.path.join(directory, f"vehicles_{size}.csv")
+    if not os.path.exists(customer_csv):
+        generate_customers(size, seed).to_csv(customer_csv, index=False)
+    if not os.path.exists(vehicle_out):
+        generate_vehicles(pd.read_csv(vehicle_csv), size).to_csv(vehicle_out, index=False)
+    return customer_csv, vehicle_out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 250, 1000, 5000, 20000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--directory", default=INSTANCE_DIR)
+    parser.add_argument("--vehicles", default=os.path.join(REPO_DIR, "Vehicle_Data.csv"))
+    args = parser.parse_args()
+    for size in args.sizes:
+        print(*instance_paths(size, args.seed, args.directory, args.vehicles))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Load time and memory of Customer_Data.csv through pandas against the typed .npz loader of instance_data.py.
+
+Instances of every size are resampled from Customer_Data.csv (see benchmarks.decomposition)
+and written as CSV files. Per size the benchmark times pd.read_csv, the first load of the
+loader (parse, check and store the .npz) and a repeat load, which runs in a fresh
+interpreter so that it shows whether pandas gets imported at all. Memory is the peak
+traced by tracemalloc during a second, traced run of every load and the size of the
+loaded columns.
+
+    python -m benchmarks.instance_loading --sizes 250 50000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from benchmarks.decomposition import REPO_DIR, synthetic_customers
+from instance_data import load_customers
+
+REPEAT_LOAD = """
+import json, sys, time, tracemalloc
+sys.path.insert(0, {repo!r})
+from instance_data import load_customers
+started = time.perf_counter()
+columns = load_customers({path!r}, {cache_dir!r})
+seconds = time.perf_counter() - started
+tracemalloc.start()
+load_customers({path!r}, {cache_dir!r})
+print(json.dumps({{"seconds": seconds, "peak_bytes": tracemalloc.get_traced_memory()[1],
+                  "bytes": sum(c.nbytes for c in columns.values()), "pandas_imported": "pandas" in sys.modules}}))
+"""
+
+
+def measure(load):
+    """Returns (result, seconds, tracemalloc peak bytes) of load(0), tracing a second call load(1)."""
+    started = time.perf_counter()
+    result = load(0)
+    seconds = time.perf_counter() - started
+    tracemalloc.start()
+    load(1)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def run(path, cache_dir):
+    frame, pandas_seconds, pandas_peak = measure(lambda run: pd.read_csv(path))
+    # the traced first load gets a cache directory of its own, so it converts the CSV again
+    columns, first_seconds, first_peak = measure(
+        lambda run: load_customers(path, cache_dir if run == 0 else cache_dir + "-traced"))
+    repeat = json.loads(subprocess.run([sys.executable, "-c", REPEAT_LOAD.format(
+        repo=REPO_DIR, path=path, cache_dir=cache_dir)], capture_output=True, text=True, check=True).stdout)
+    return {"csv_bytes": os.path.getsize(path),
+            "pandas": {"seconds": pandas_seconds, "peak_bytes": pandas_peak,
+                       "bytes": int(frame.memory_usage(deep=True).sum())},
+            "first_load": {"seconds": first_seconds, "peak_bytes": first_peak,
+                           "bytes": sum(c.nbytes for c in columns.values())},
+            "repeat_load": repeat}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[250, 50000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--customers", default=os.path.join(REPO_DIR, "Customer_Data.csv"))
+    parser.add_argument("--output", default="instance_loading.json")
+    args = parser.parse_args()
+
+    customer_data = pd.read_csv(args.customers)
+    print("{:>7} {:>10} {:>10} {:>10} {:>10} {:>10} {:>10} {:>7}".format(
+        "size", "pandas s", "first s", "repeat s", "pandas MB", "arrays MB", "repeat MB", "pandas"))
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            path = os.path.join(directory, f"customers_{size}.csv")
+            synthetic_customers(customer_data, size, args.seed).to_csv(path, index=False)
+            result = dict(size=size, **run(path, os.path.join(directory, "cache")))
+            results.append(result)
+            print("{:>7} {:>10.4f} {:>10.4f} {:>10.4f} {:>10.2f} {:>10.2f} {:>10.2f} {:>7}".format(
+                size, result["pandas"]["seconds"], result["first_load"]["seconds"],
+                result["repeat_load"]["seconds"], result["pandas"]["bytes"] / 1e6,
+                result["first_load"]["bytes"] / 1e6, result["repeat_load"]["peak_bytes"] / 1e6,
+                "yes" if result["repeat_load"]["pandas_imported"] else "no"))
+
+    with open(args.output, "w") as f:
+        json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
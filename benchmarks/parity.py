@@ -0,0 +1,82 @@
+"""Plans of the OR-Tools model of cvrptw_routing.py against the MIP of CVRP_GUROBI.py on small instances.
+
+Every instance is resampled from Customer_Data.csv (see benchmarks.decomposition) and
+solved by both: the MIP through the sparse HiGHS backend of sparse_model.py, the OR-Tools
+model under a short time limit. Both plans are scored by evaluator.py on the business
+cost of the MIP, so a relative gap near zero means OR-Tools finds the plans of the MIP.
+The OR-Tools model may use arcs outside the MIP's candidate arcs and can come out cheaper.
+
+    python -m benchmarks.parity --sizes 8 12 16 --seeds 0 1 2 --time-limit 2
+"""
+
+import argparse
+import json
+import os
+import time
+
+import pandas as pd
+
+from benchmarks.decomposition import REPO_DIR, synthetic_customers
+from CVRP_GUROBI import model_data
+from cvrptw_routing import solve_routing
+from evaluator import Instance, evaluate_plans
+from fleet import assign_vehicles, vehicle_types
+from sparse_model import build_sparse_model, extract_routes, solve_highs
+
+
+def score(data, routes):
+    _, _, totals = evaluate_plans(Instance.from_data(data), [routes])
+    return float(totals['cost'][0]), bool(totals['feasible'][0])
+
+
+def compare(data, time_limit, mip_time_limit):
+    started = time.perf_counter()
+    model = build_sparse_model(data)
+    status, _, values = solve_highs(model, time_limit=mip_time_limit, mip_gap=0)
+    mip = {'status': status, 'seconds': time.perf_counter() - started}
+    if values is not None:
+        mip['cost'], mip['feasible'] = score(data, extract_routes(data, model, values))
+
+    started = time.perf_counter()
+    routes_by_type, dropped = solve_routing(data, time_limit)
+    routing = {'seconds': time.perf_counter() - started, 'dropped': len(dropped or [])}
+    if routes_by_type is not None:
+        routing['cost'], routing['feasible'] = score(data, assign_vehicles(routes_by_type, data['types']))
+    if 'cost' in mip and 'cost' in routing and not dropped:
+        routing['gap'] = (routing['cost'] - mip['cost']) / mip['cost']
+    return {'mip': mip, 'routing': routing}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[8, 12, 16])
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0, 1, 2])
+    parser.add_argument("--time-limit", type=float, default=2, help="seconds of the OR-Tools search")
+    parser.add_argument("--mip-time-limit", type=float, default=300, help="seconds of the MIP")
+    parser.add_argument("--customers", default=os.path.join(REPO_DIR, "Customer_Data.csv"))
+    parser.add_argument("--vehicles", default=os.path.join(REPO_DIR, "Vehicle_Data.csv"))
+    parser.add_argument("--output", default="parity.json")
+    args = parser.parse_args()
+
+    customer_data = pd.read_csv(args.customers)
+    types = vehicle_types(pd.read_csv(args.vehicles))
+    print("{:>5} {:>5} {:>10} {:>10} {:>8} {:>10} {:>8} {:>8} {:>8}".format(
+        "size", "seed", "mip", "mip cost", "mip s", "ort cost", "ort s", "dropped", "gap"))
+    results = []
+    for size in args.sizes:
+        for seed in args.seeds:
+            data = model_data(synthetic_customers(customer_data, size, seed), types)
+            result = dict(size=size, seed=seed, **compare(data, args.time_limit, args.mip_time_limit))
+            results.append(result)
+            mip, routing = result['mip'], result['routing']
+            print("{:>5} {:>5} {:>10} {:>10} {:>8.1f} {:>10} {:>8.1f} {:>8} {:>8}".format(
+                size, seed, mip['status'][:10], f"{mip['cost']:.2f}" if 'cost' in mip else "-", mip['seconds'],
+                f"{routing['cost']:.2f}" if 'cost' in routing else "-", routing['seconds'], routing['dropped'],
+                f"{routing['gap']:.2%}" if 'gap' in routing else "-"))
+
+    with open(args.output, "w") as f:
+        json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Model size and LP bound of the sparse MIP before and after the time window presolve.
+
+Instances come from benchmarks.generator with --fleet-copies times its fleet, as in
+benchmarks.column_generation. Like warm_start.py, the candidate arcs get the arcs of a
+short OR-Tools plan, so both models have an integer solution and the LP bounds compare
+with its cost. Both are built with sparse_model.build_sparse_model and their LP
+relaxations solved with HiGHS; results go to a JSON file.
+
+    python -m benchmarks.presolve --sizes 50 100 250 --fleet-copies 3
+"""
+
+import argparse
+import dataclasses
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.decomposition import REPO_DIR
+from benchmarks.generator import INSTANCE_DIR, generate_vehicles, instance_paths
+from CVRP_GUROBI import add_arcs, model_data
+from fleet import vehicle_types
+from presolve import presolve
+from sparse_model import build_sparse_model, solve_highs
+from warm_start import heuristic_routes, mip_start_values
+
+
+def model_size(data):
+    """Returns the size of the sparse model of data and the objective and seconds of its LP relaxation."""
+    model = build_sparse_model(data)
+    started = time.perf_counter()
+    status, objective, _ = solve_highs(dataclasses.replace(model, integrality=np.zeros_like(model.integrality)))
+    return {'rows': model.A.shape[0], 'columns': model.A.shape[1],
+            'free_columns': int((model.col_upper > model.col_lower).sum()), 'nonzeros': int(model.A.nnz),
+            'lp_status': status, 'lp_bound': objective, 'lp_seconds': time.perf_counter() - started}
+
+
+def plan_cost(data, routes_by_type):
+    """Returns the MIP objective of routes by type name."""
+    values = mip_start_values(data, routes_by_type)
+    types = {t.name: t for t in data['types']}
+    return (sum(types[name].fixed_cost * used for name, used in values['vehicle_use'].items())
+            + sum(types[name].variable_cost * km for (_, name), km in values['extra_kms'].items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 100, 250])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fleet-copies", type=int, default=3, help="copies of the generated fleet")
+    parser.add_argument("--heuristic-time", type=float, default=5, help="seconds of the OR-Tools plan")
+    parser.add_argument("--instances", default=INSTANCE_DIR, help="directory of the generated instances")
+    parser.add_argument("--vehicles", default=os.path.join(REPO_DIR, "Vehicle_Data.csv"))
+    parser.add_argument("--output", default="presolve.json")
+    args = parser.parse_args()
+
+    vehicle_data = pd.read_csv(args.vehicles)
+    print("{:>6} {:>9} {:>9} {:>9} {:>9} {:>11} {:>11} {:>12} {:>12} {:>12} {:>9}".format(
+        "size", "rows", "rows'", "free", "free'", "nonzeros", "nonzeros'", "plan", "LP", "LP'", "presolve"))
+    results = []
+    for size in args.sizes:
+        customer_csv, _ = instance_paths(size, args.seed, args.instances, args.vehicles)
+        types = vehicle_types(generate_vehicles(vehicle_data, size * args.fleet_copies))
+        data = model_data(pd.read_csv(customer_csv), types)
+        routes_by_type = heuristic_routes(data, args.heuristic_time)
+        cost = None
+        if routes_by_type is not None:
+            add_arcs(data, [(i, j) for routes in routes_by_type.values() for r in routes for i, j in zip(r, r[1:])])
+            cost = plan_cost(data, routes_by_type)
+        before = model_size(data)
+        started = time.perf_counter()
+        report = presolve(data)
+        seconds = time.perf_counter() - started
+        after = model_size(data)
+        results.append({'size': size, 'plan_cost': cost, 'before': before, 'after': after, 'presolve': report,
+                        'presolve_seconds': seconds})
+        print("{:>6} {:>9} {:>9} {:>9} {:>9} {:>11} {:>11} {:>12} {:>12} {:>12} {:>9.2f}".format(
+            size, before['rows'], after['rows'], before['free_columns'], after['free_columns'], before['nonzeros'],
+            after['nonzeros'], "-" if cost is None else f"{cost:.1f}",
+            *(lp['lp_status'] if lp['lp_bound'] is None else f"{lp['lp_bound']:.1f}" for lp in (before, after)),
+            seconds))
+
+    with open(args.output, "w") as f:
+        json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
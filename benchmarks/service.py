@@ -0,0 +1,86 @@
+"""Latency of the solver service of solver_service.py under concurrent clients.
+
+The service runs in this process on a free localhost port. Every client thread sends its
+requests one after the other over HTTP, alternating solve requests with evaluate requests
+of the plan it got back, and the benchmark prints the latency percentiles seen by the
+clients next to the ones the service reports in /stats.
+
+    python -m benchmarks.service --workers 4 --clients 8 --requests 10 --rows 100
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+from benchmarks.decomposition import REPO_DIR
+from solver_service import SolverClient, SolverService, percentiles, serve
+
+
+def client_run(client, instance, requests, budget, latencies):
+    plan = None
+    for r in range(requests):
+        started = time.perf_counter()
+        if plan is not None and r % 2:
+            kind, result = "evaluate", client.evaluate(instance, [plan], budget)
+        else:
+            kind, result = "solve", client.solve(instance, budget)
+            plan = result.get('routes', plan)
+        latencies[kind].append(time.perf_counter() - started)
+        if result['status'] in ('error', 'expired'):
+            latencies[kind + " errors"].append(result['error'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--clients", type=int, default=4, help="client threads sending requests at the same time")
+    parser.add_argument("--requests", type=int, default=10, help="requests per client")
+    parser.add_argument("--budget", type=float, default=2, help="seconds per request, queue time included")
+    parser.add_argument("--rows", type=int, default=100, help="customers of Customer_Data.csv in the instance")
+    parser.add_argument("--customers", default=os.path.join(REPO_DIR, "Customer_Data.csv"))
+    parser.add_argument("--vehicles", default=os.path.join(REPO_DIR, "Vehicle_Data.csv"))
+    parser.add_argument("--output", default="service.json")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    service = SolverService(args.workers)
+    server = serve(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = SolverClient(f"http://127.0.0.1:{server.server_address[1]}")
+    client.load("bench", args.customers, args.vehicles, rows=args.rows)
+    print(f"service up with {args.workers} workers in {time.perf_counter() - started:.2f} s")
+
+    latencies = defaultdict(list)
+    threads = [threading.Thread(target=client_run, args=(client, "bench", args.requests, args.budget, latencies))
+               for _ in range(args.clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - started
+
+    stats = client.stats()
+    server.shutdown()
+    service.close()
+    print(f"{args.clients * args.requests} requests from {args.clients} clients in {seconds:.1f} s")
+    print("{:>9} {:>6} {:>7} {:>8} {:>8} {:>8} {:>10}".format("request", "count", "errors", "p50 s", "p90 s",
+                                                                "p99 s", "queue p50"))
+    for kind, row in stats['requests'].items():
+        print("{:>9} {:>6} {:>7} {:>8.3f} {:>8.3f} {:>8.3f} {:>10.3f}".format(
+            kind, row['count'], row['errors'], row['latency']['p50'], row['latency']['p90'], row['latency']['p99'],
+            row['queue']['p50']))
+
+    with open(args.output, "w") as f:
+        json.dump({"args": vars(args), "seconds": seconds, "service": stats,
+                   "clients": {kind: percentiles(values) for kind, values in latencies.items()
+                               if not kind.endswith("errors")},
+                   "errors": {kind: values for kind, values in latencies.items() if kind.endswith("errors")}},
+                  f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
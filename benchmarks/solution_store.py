@@ -0,0 +1,101 @@
+"""Time to target quality of warm starts from the solution store against cold starts, over simulated days.
+
+Every day keeps all but --churn of the customers of the day before and adds as many new
+ones, drawn from one seeded benchmarks.generator pool; the fleet has --fleet-copies times
+the generated fleet. From the second day on each day is solved cold with
+cvrptw_routing.solve_routing and warm with solution_store.solve_with_store, which starts
+from the stored plan of the day before; the target is the cold objective plus --gap. The
+day is then asked for again, which the store answers without solving. Results go to a
+JSON file.
+
+    python -m benchmarks.solution_store --size 250 --days 5 --churn 0.1 --time-limit 10
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.decomposition import REPO_DIR
+from benchmarks.generator import generate_customers, generate_vehicles
+from CVRP_GUROBI import model_data
+from cvrptw_routing import solve_routing
+from fleet import vehicle_types
+from instrumentation import Trace
+from solution_store import TARGET_GAP, SolutionStore, solve_with_store, time_to_target
+
+
+def simulate_days(size, days, churn, seed=0):
+    """Yields the customer frame of every day: churn of the customers of the day before replaced by new ones."""
+    changed = round(size * churn)
+    pool = generate_customers(size + (days - 1) * changed, seed)
+    rng = np.random.default_rng(seed)
+    today = np.arange(size)
+    for day in range(days):
+        yield pool.iloc[today].reset_index(drop=True)
+        kept = np.sort(rng.choice(today, len(today) - changed, replace=False))
+        today = np.concatenate((kept, np.arange(size + day * changed, size + (day + 1) * changed)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=250)
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--churn", type=float, default=0.1, help="share of the customers replaced every day")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fleet-copies", type=int, default=3, help="copies of the generated fleet")
+    parser.add_argument("--time-limit", type=float, default=10, help="seconds per solve")
+    parser.add_argument("--gap", type=float, default=TARGET_GAP, help="target quality above the cold objective")
+    parser.add_argument("--vehicles", default=os.path.join(REPO_DIR, "Vehicle_Data.csv"))
+    parser.add_argument("--output", default="solution_store.json")
+    args = parser.parse_args()
+
+    types = vehicle_types(generate_vehicles(pd.read_csv(args.vehicles), args.size * args.fleet_copies))
+    params = {'time_limit': args.time_limit}
+    print("{:>4} {:>7} {:>14} {:>14} {:>9} {:>9} {:>9}".format(
+        "day", "shared", "cold", "warm", "cold ttt", "warm ttt", "cached"))
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        store = SolutionStore(directory)
+        for day, customer_data in enumerate(simulate_days(args.size, args.days, args.churn, args.seed)):
+            data = model_data(customer_data, types)
+            if day == 0:
+                solve_with_store(data, store, args.time_limit, params)
+                continue
+            cold = Trace()
+            solve_routing(data, args.time_limit, trace=cold)
+            warm = Trace()
+            _, _, info = solve_with_store(data, store, args.time_limit, params, warm)
+            started = time.perf_counter()
+            _, _, cached = solve_with_store(data, store, args.time_limit, params)
+            cached_seconds = time.perf_counter() - started
+
+            cold_trajectory, warm_trajectory = cold.trajectory(), warm.trajectory()
+            result = {'day': day, 'start': info['start'], 'shared': info['shared'], 'inserted': info['inserted'],
+                      'cold_objective': cold_trajectory[-1][1] if cold_trajectory else None,
+                      'warm_objective': info['objective'], 'cached_start': cached['start'],
+                      'cached_seconds': cached_seconds}
+            if cold_trajectory:
+                target = cold_trajectory[-1][1] * (1 + args.gap)
+                result.update(target=target, cold_seconds_to_target=time_to_target(cold_trajectory, target),
+                              warm_seconds_to_target=time_to_target(warm_trajectory, target))
+            results.append(result)
+            print("{:>4} {:>7.2f} {:>14} {:>14} {:>9} {:>9} {:>9.4f}".format(
+                day, info['shared'], *("-" if value is None else value for value in
+                                       (result['cold_objective'], result['warm_objective'])),
+                *("-" if result.get(name) is None else f"{result[name]:.2f}"
+                  for name in ("cold_seconds_to_target", "warm_seconds_to_target")),
+                cached_seconds))
+        summary = store.summary()
+    print(json.dumps(summary))
+
+    with open(args.output, "w") as f:
+        json.dump({"args": vars(args), "results": results, "store": summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""Wall time per stage, peak RSS, objective and feasibility of every solver on synthetic instances.
+
+Instances come from benchmarks.generator (seeded, so every commit sees the same ones).
+Every solver and size runs in a fresh process, so peak RSS is its own, and is stopped
+after --timeout seconds. The solvers:
+
+- cvrp: main.py, the OR-Tools CVRP on a metre matrix (capacities only)
+- vrptw: VRPTW_ORTOOLS.py, the OR-Tools VRPTW on a time matrix (time windows only)
+- mip: CVRP_GUROBI.py with the sparse model solved by HiGHS
+- cvrptw: the batch pipeline, the OR-Tools model of cvrptw_routing.py on model_data
+- decomposed: decomposition.py, partitions solved in parallel with boundary repair
+- colgen: column_generation.py, set partitioning over routes from OR-Tools and pricing, with a lower bound
+
+Objectives are in each solver's own units (metres, minutes, cost); feasibility and cost
+of the CVRPTW plans are checked by evaluator.py. Solvers are skipped above their
+--max-size, where their dense matrices no longer fit in memory.
+
+    python -m benchmarks.suite --sizes 100 250 1000 --output base.json
+    python -m benchmarks.suite --compare base.json head.json --tolerance 0.1
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+from benchmarks.decomposition import REPO_DIR
+from benchmarks.generator import INSTANCE_DIR, instance_paths
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SOLVERS = ["cvrp", "vrptw", "mip", "cvrptw", "decomposed", "colgen"]
+MAX_SIZE = {"cvrp": 2500, "vrptw": 2500, "mip": 60, "cvrptw": 2500, "decomposed": 20000, "colgen": 2500}
+MIP_GAP = 0.05
+MIN_SLOWDOWN = 0.5  # seconds, --compare ignores smaller slowdowns as noise
+
+
+@contextmanager
+def stage(stages, name):
+    started = time.perf_counter()
+    yield
+    stages[name] = time.perf_counter() - started
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and of its finished children, in MB."""
+    if resource is None:
+        return None, None
+    scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss is in bytes on macOS, KB elsewhere
+    return tuple(resource.getrusage(who).ru_maxrss * scale / 2 ** 20
+                 for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+
+
+def score(data, routes):
+    from evaluator import Instance, evaluate_plans
+
+    _, _, totals = evaluate_plans(Instance.from_data(data), [routes])
+    return float(totals['cost'][0]), bool(totals['feasible'][0])
+
+
+def run_cvrp(customer_csv, vehicle_csv, size, time_limit, stages):
+    import main as cvrp
+
+    with stage(stages, "data"):
+        data = cvrp.create_data_model(customer_csv=customer_csv, vehicle_csv=vehicle_csv, customers=size,
+                                      vehicles=None)
+    with stage(stages, "model"):
+        manager, routing = cvrp.create_routing_model(data)
+        parameters = cvrp.create_search_parameters(data, time_limit)
+    with stage(stages, "solve"):
+        solution = routing.SolveWithParameters(parameters)
+    if solution is None:
+        return {'objective': None, 'feasible': False}
+    return {'objective': solution.ObjectiveValue(), 'feasible': True}
+
+
+def run_vrptw(customer_csv, vehicle_csv, size, time_limit, stages):
+    import pandas as pd
+
+    import VRPTW_ORTOOLS as vrptw
+
+    vehicles = len(pd.read_csv(vehicle_csv))
+    with stage(stages, "data"):
+        data = vrptw.create_data_model_1(customer_csv=customer_csv, vehicle_csv=vehicle_csv, vehicles=vehicles)
+    with stage(stages, "model"):
+        manager, routing = vrptw.create_routing_model(data)
+        parameters = vrptw.create_search_parameters(data, time_limit)
+    with stage(stages, "solve"):
+        solution = routing.SolveWithParameters(parameters)
+    if solution is None:
+        return {'objective': None, 'feasible': False}
+    return {'objective': solution.ObjectiveValue(), 'feasible': True}
+
+
+def run_mip(customer_csv, vehicle_csv, size, time_limit, stages):
+    from CVRP_GUROBI import create_data_model
+    from sparse_model import build_sparse_model, extract_routes, solve_highs
+
+    with stage(stages, "data"):
+        data = create_data_model(size - 1, customer_csv=customer_csv, vehicle_csv=vehicle_csv)
+    with stage(stages, "model"):
+        model = build_sparse_model(data)
+    with stage(stages, "solve"):
+        status, objective, values = solve_highs(model, time_limit=time_limit, mip_gap=MIP_GAP)
+    result = {'solver_status': status, 'objective': objective, 'feasible': False}
+    if values is not None:
+        with stage(stages, "evaluate"):
+            result['cost'], result['feasible'] = score(data, extract_routes(data, model, values))
+    return result
+
+
+def run_cvrptw(customer_csv, vehicle_csv, size, time_limit, stages):
+    from CVRP_GUROBI import model_data
+    from cvrptw_routing import solve_routing
+    from fleet import assign_vehicles, vehicle_types
+    from instance_data import load_customers, load_vehicles
+
+    with stage(stages, "load"):
+        customer_data = load_customers(customer_csv)
+        types = vehicle_types(load_vehicles(vehicle_csv))
+    with stage(stages, "data"):
+        data = model_data(customer_data, types)
+    with stage(stages, "solve"):
+        routes_by_type, dropped = solve_routing(data, time_limit)
+    result = {'objective': None, 'feasible': False, 'dropped': len(dropped or [])}
+    if routes_by_type is not None:
+        with stage(stages, "evaluate"):
+            result['objective'], result['feasible'] = score(data, assign_vehicles(routes_by_type, types))
+    return result
+
+
+def run_decomposed(customer_csv, vehicle_csv, size, time_limit, stages):
+    import pandas as pd
+
+    from decomposition import solve_decomposed
+    from fleet import vehicle_types
+
+    with stage(stages, "load"):
+        customer_data = pd.read_csv(customer_csv)
+        types = vehicle_types(pd.read_csv(vehicle_csv))
+    result = solve_decomposed(customer_data, types, time_limit=time_limit, repair_time=time_limit)
+    stages.update(result['seconds'])
+    return {'objective': result['cost'], 'feasible': not result['dropped'], 'dropped': len(result['dropped'])}
+
+
+def run_colgen(customer_csv, vehicle_csv, size, time_limit, stages):
+    from CVRP_GUROBI import model_data
+    from column_generation import solve_column_generation
+    from fleet import vehicle_types
+    from instance_data import load_customers, load_vehicles
+
+    with stage(stages, "load"):
+        customer_data = load_customers(customer_csv)
+        types = vehicle_types(load_vehicles(vehicle_csv))
+    with stage(stages, "data"):
+        data = model_data(customer_data, types)
+    result = solve_column_generation(data, time_limit=time_limit, mip_time=time_limit)
+    stages.update(result['seconds'])
+    record = {'solver_status': result['status'], 'objective': result['objective'], 'feasible': False,
+              'dropped': len(result['dropped']), 'lower_bound': result['lower_bound'], 'gap': result['gap']}
+    if result['routes']:
+        with stage(stages, "evaluate"):
+            record['cost'], feasible = score(data, result['routes'])
+        record['feasible'] = feasible and not result['dropped']
+    return record
+
+
+RUNNERS = {"cvrp": run_cvrp, "vrptw": run_vrptw, "mip": run_mip, "cvrptw": run_cvrptw,
+           "decomposed": run_decomposed, "colgen": run_colgen}
+
+
+def child(conn, solver, customer_csv, vehicle_csv, size, time_limit):
+    """Runs one solver in this (fresh) process and sends back its record."""
+    rss_start, _ = peak_rss_mb()
+    stages = {}
+    started = time.perf_counter()
+    try:
+        record = {'status': 'ok', **RUNNERS[solver](customer_csv, vehicle_csv, size, time_limit, stages)}
+    except Exception as error:
+        record = {'status': 'error', 'error': repr(error)}
+    record['seconds'] = time.perf_counter() - started
+    record['stages'] = stages
+    record['rss_start_mb'] = rss_start
+    record['peak_rss_mb'], record['peak_children_rss_mb'] = peak_rss_mb()
+    conn.send(record)
+
+
+def run(solver, customer_csv, vehicle_csv, size, time_limit, timeout):
+    context = multiprocessing.get_context("spawn")
+    receive, send = context.Pipe(duplex=False)
+    process = context.Process(target=child, args=(send, solver, customer_csv, vehicle_csv, size, time_limit))
+    started = time.perf_counter()
+    process.start()
+    while not receive.poll(1) and process.is_alive() and time.perf_counter() - started < timeout:
+        pass
+    if receive.poll():
+        record = receive.recv()
+    elif process.is_alive():
+        record = {'status': 'timeout', 'seconds': time.perf_counter() - started}
+        process.terminate()
+    else:  # killed, e.g. out of memory
+        record = {'status': f'exit {process.exitcode}', 'seconds': time.perf_counter() - started}
+    process.join()
+    return record
+
+
+def environment():
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=REPO_DIR, capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    return {'commit': git("rev-parse", "HEAD"), 'dirty': bool(git("status", "--porcelain", "--untracked-files=no")),
+            'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()}
+
+
+def record_key(record):
+    return record['solver'], record['size'], record['seed']
+
+
+def compare(base_path, head_path, tolerance):
+    """Prints head against base for every run both have; returns the regressions found."""
+    with open(base_path) as f:
+        base = {record_key(r): r for r in json.load(f)['results']}
+    with open(head_path) as f:
+        head = {record_key(r): r for r in json.load(f)['results']}
+    print("{:>10} {:>6} {:>10} {:>10} {:>8} {:>10} {:>10} {:>8} {:>13} {}".format(
+        "solver", "size", "base s", "head s", "change", "base MB", "head MB", "change", "objective", "flags"))
+    regressions = []
+    for key in sorted(base.keys() & head.keys()):
+        b, h = base[key], head[key]
+        flags = []
+        if b['status'] == 'ok' and h['status'] != 'ok':
+            flags.append(h['status'])
+        if b.get('feasible') and not h.get('feasible'):
+            flags.append("infeasible")
+        seconds = h['seconds'] / b['seconds'] - 1
+        if seconds > tolerance and h['seconds'] - b['seconds'] > MIN_SLOWDOWN:
+            flags.append("slower")
+        rss = None
+        if b.get('peak_rss_mb') and h.get('peak_rss_mb'):
+            rss = h['peak_rss_mb'] / b['peak_rss_mb'] - 1
+            if rss > tolerance:
+                flags.append("memory")
+        objective = None
+        if b.get('objective') and h.get('objective') is not None:
+            objective = h['objective'] / b['objective'] - 1
+            if objective > tolerance:
+                flags.append("worse")
+        if flags:
+            regressions.append((key, flags))
+        print("{:>10} {:>6} {:>10.2f} {:>10.2f} {:>8.1%} {:>10} {:>10} {:>8} {:>13} {}".format(
+            key[0], key[1], b['seconds'], h['seconds'], seconds, f"{b.get('peak_rss_mb') or 0:.0f}",
+            f"{h.get('peak_rss_mb') or 0:.0f}", f"{rss:.1%}" if rss is not None else "-",
+            f"{objective:+.2%}" if objective is not None else "-", ",".join(flags)))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 250, 1000])
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0])
+    parser.add_argument("--solvers", nargs="+", choices=SOLVERS, default=SOLVERS)
+    parser.add_argument("--max-size", nargs="*", default=[], metavar="SOLVER=SIZE",
+                        help=f"largest instance of a solver, defaults {MAX_SIZE}")
+    parser.add_argument("--time-limit", type=int, default=5, help="seconds of every solve")
+    parser.add_argument("--timeout", type=float, default=600, help="seconds before a run is stopped")
+    parser.add_argument("--instances", default=INSTANCE_DIR, help="directory of the generated instances")
+    parser.add_argument("--vehicles", default=os.path.join(REPO_DIR, "Vehicle_Data.csv"),
+                        help="Vehicle_Data.csv the generated fleets replicate")
+    parser.add_argument("--output", default="suite.json")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "HEAD"),
+                        help="compare two result files instead of running, exit status 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative change flagged by --compare")
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare(*args.compare, args.tolerance)
+        print(f"{len(regressions)} regressions above {args.tolerance:.0%}")
+        sys.exit(1 if regressions else 0)
+
+    max_size = dict(MAX_SIZE, **{s: int(n) for s, n in (item.split("=") for item in args.max_size)})
+    results = []
+    print("{:>10} {:>6} {:>5} {:>8} {:>9} {:>8} {:>14} {:>9}  {}".format(
+        "solver", "size", "seed", "status", "seconds", "peak MB", "objective", "feasible", "stages"))
+    for size in args.sizes:
+        for seed in args.seeds:
+            customer_csv, vehicle_csv = instance_paths(size, seed, args.instances, args.vehicles)
+            for solver in args.solvers:
+                if size > max_size[solver]:
+                    continue
+                record = dict(solver=solver, size=size, seed=seed,
+                              **run(solver, customer_csv, vehicle_csv, size, args.time_limit, args.timeout))
+                results.append(record)
+                objective = record.get('objective')
+                print("{:>10} {:>6} {:>5} {:>8} {:>9.2f} {:>8} {:>14} {:>9}  {}".format(
+                    solver, size, seed, record['status'], record['seconds'],
+                    f"{record['peak_rss_mb']:.0f}" if record.get('peak_rss_mb') else "-",
+                    f"{objective:.2f}" if objective is not None else "-", str(record.get('feasible', '-')),
+                    " ".join(f"{name} {seconds:.2f}" for name, seconds in record.get('stages', {}).items())))
+
+    with open(args.output, "w") as f:
+        json.dump({"args": vars(args), "environment": environment(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
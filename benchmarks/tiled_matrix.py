@@ -0,0 +1,90 @@
+"""Peak memory and seconds of the dense haversine matrix against matrix.TiledMatrix as the node count grows.
+
+Nodes come from benchmarks.generator. For every size the TiledMatrix answers what the
+models ask of a matrix: the KMs of the candidate arcs of neighbours.py, the rows of the
+first --rows nodes as a block through the tiles and then one by one from the cached
+tiles, the full rows of --rows random nodes and the --k nearest neighbours of every node
+and of those nodes. The
+dense matrix is built up to --max-dense nodes. Peaks are tracemalloc peaks of the step
+alone, in MB; results go to a JSON file.
+
+    python -m benchmarks.tiled_matrix --sizes 1000 5000 10000 30000 --max-dense 10000
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.generator import generate_customers
+from CVRP_GUROBI import HUB_LAT, HUB_LONG
+from matrix import haversine_matrix, node_coordinates, TILE_CACHE_BYTES, TILE_SIZE, TiledMatrix
+from neighbours import candidate_arcs, DEFAULT_K
+
+
+def measure(step):
+    """Runs step(); returns its seconds and tracemalloc peak in MB."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    step()
+    seconds = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def tiled_workload(lat, long, rows, k, tile, max_bytes, seed=0):
+    """Runs the matrix accesses of the models on a TiledMatrix; returns its tile hits and misses."""
+    matrix = TiledMatrix(lat, long, tile, max_bytes)
+    arcs = np.asarray(candidate_arcs(lat, long, k))
+    matrix[arcs[:, 0], arcs[:, 1]]
+    window = np.arange(min(rows, len(lat)))
+    matrix.rows(window)
+    for i in window.tolist():
+        matrix.row(i)
+    for i in np.random.default_rng(seed).choice(len(lat), min(rows, len(lat)), replace=False).tolist():
+        matrix.row(i)
+        matrix.nearest(i, k)
+    matrix.neighbours(k)
+    return matrix.hits, matrix.misses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 10000, 30000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-dense", type=int, default=10000, help="largest size the dense matrix is built for")
+    parser.add_argument("--rows", type=int, default=200, help="full rows read per size")
+    parser.add_argument("--k", type=int, default=DEFAULT_K)
+    parser.add_argument("--tile", type=int, default=TILE_SIZE)
+    parser.add_argument("--max-bytes", type=int, default=TILE_CACHE_BYTES, help="tile cache size")
+    parser.add_argument("--output", default="tiled_matrix.json")
+    args = parser.parse_args()
+
+    print("{:>7} {:>10} {:>10} {:>10} {:>10} {:>9} {:>9}".format(
+        "nodes", "dense s", "dense MB", "tiled s", "tiled MB", "hits", "misses"))
+    results = []
+    for size in args.sizes:
+        customers = generate_customers(size, args.seed)
+        lat, long = node_coordinates(HUB_LAT, HUB_LONG, customers["buyer_lat"], customers["buyer_long"])
+        result = {'nodes': len(lat)}
+        if size <= args.max_dense:
+            result['dense_seconds'], result['dense_peak_mb'] = measure(lambda: haversine_matrix(lat, long, unit="km"))
+        counts = {}
+        result['tiled_seconds'], result['tiled_peak_mb'] = measure(lambda: counts.update(zip(
+            ("hits", "misses"), tiled_workload(lat, long, args.rows, args.k, args.tile, args.max_bytes, args.seed))))
+        result.update(counts)
+        results.append(result)
+        print("{:>7} {:>10} {:>10} {:>10.2f} {:>10.1f} {:>9} {:>9}".format(
+            len(lat), *("-" if name not in result else f"{result[name]:.{places}f}"
+                        for name, places in (("dense_seconds", 2), ("dense_peak_mb", 1))),
+            result['tiled_seconds'], result['tiled_peak_mb'], result['hits'], result['misses']))
+
+    with open(args.output, "w") as f:
+        json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Python callback transits against native matrix/vector transits in the CVRP of main.py.
+
+Both variants solve the same model with PATH_CHEAPEST_ARC and GUIDED_LOCAL_SEARCH under
+the same time limit; the solver counters show how much more search the native one does.
+
+    python -m benchmarks.transits --time-limit 5
+"""
+
+import argparse
+import os
+
+from ortools.constraint_solver import pywrapcp
+from ortools.constraint_solver import routing_enums_pb2
+
+from main import create_data_model
+from neighbours import limit_local_search
+from routing_setup import register_matrix_transit, register_vector_transit
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_model(data, native):
+    manager = pywrapcp.RoutingIndexManager(len(data['distance_matrix']),
+                                           data['num_vehicles'], data['depot'])
+    routing = pywrapcp.RoutingModel(manager)
+    if native:
+        transit_index = register_matrix_transit(routing, data['distance_matrix'])
+        demand_index = register_vector_transit(routing, data['demands'])
+    else:
+        def distance_callback(from_index, to_index):
+            return data['distance_matrix'][manager.IndexToNode(from_index)][manager.IndexToNode(to_index)]
+
+        def demand_callback(from_index):
+            return data['demands'][manager.IndexToNode(from_index)]
+
+        transit_index = routing.RegisterTransitCallback(distance_callback)
+        demand_index = routing.RegisterUnaryTransitCallback(demand_callback)
+    routing.SetArcCostEvaluatorOfAllVehicles(transit_index)
+    routing.AddDimensionWithVehicleCapacity(demand_index, 0, data['vehicle_capacities'], True, 'Capacity')
+    return manager, routing
+
+
+def run(data, native, time_limit):
+    manager, routing = build_model(data, native)
+    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+    search_parameters.first_solution_strategy = (
+        routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC)
+    search_parameters.local_search_metaheuristic = (
+        routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH)
+    search_parameters.time_limit.FromSeconds(time_limit)
+    limit_local_search(search_parameters, data['k'], len(data['distance_matrix']))
+    solution = routing.SolveWithParameters(search_parameters)
+    solver = routing.solver()
+    seconds = solver.WallTime() / 1000
+    return {"transits": "native" if native else "callback",
+            "objective": solution.ObjectiveValue() if solution else None,
+            "seconds": seconds,
+            "accepted_neighbours": solver.AcceptedNeighbors(),
+            "neighbours_per_second": solver.AcceptedNeighbors() / seconds if seconds else 0.0,
+            "branches_per_second": solver.Branches() / seconds if seconds else 0.0,
+            "solutions": solver.Solutions()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--time-limit", type=int, default=1, help="seconds per solve (main.py uses 1)")
+    parser.add_argument("--customers", default=os.path.join(REPO_DIR, "Customer_Data.csv"))
+    parser.add_argument("--vehicles", default=os.path.join(REPO_DIR, "Vehicle_Data.csv"))
+    args = parser.parse_args()
+
+    data = create_data_model(customer_csv=args.customers, vehicle_csv=args.vehicles)
+    rows = [run(data, native, args.time_limit) for native in (False, True)]
+    print("{:<10} {:>12} {:>10} {:>14} {:>14} {:>10}".format(
+        "transits", "objective", "seconds", "neighbours/s", "branches/s", "solutions"))
+    for row in rows:
+        print("{transits:<10} {objective:>12} {seconds:>10.2f} {neighbours_per_second:>14.0f} "
+              "{branches_per_second:>14.0f} {solutions:>10}".format(**row))
+    if rows[0]["neighbours_per_second"]:
+        print("native/callback accepted neighbours per second: {:.2f}x".format(
+            rows[1]["neighbours_per_second"] / rows[0]["neighbours_per_second"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Time of a road-network travel-time matrix against the haversine one, on a synthetic road grid.
+
+The road network is a jittered grid over the area of Customer_Data.csv with every eighth
+street an arterial (road class 1, twice the speed of the local streets) and a tenth of the
+local streets missing, so fastest paths detour. Nodes are resampled customers (see
+benchmarks.decomposition) plus the hub. The benchmark times contracting the hierarchies
+(once per graph and profile, then read from disk), the distance and travel-time matrices
+of RoadNetworkProvider with an evening profile for the 4:00 PM slot, and checks a sample
+of rows against plain Dijkstra over the whole graph.
+
+    python -m benchmarks.travel_times --grid 100 --size 1000
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.decomposition import REPO_DIR, synthetic_customers
+from CVRP_GUROBI import HUB_LAT, HUB_LONG
+from instance_data import slot_minutes
+from matrix import haversine_km, node_coordinates
+from road_network import RoadGraph, dijkstra_many_to_many, load_hierarchy
+from travel_times import HaversineProvider, RoadNetworkProvider
+
+LOCAL_SPEED = 0.4  # km/min
+ARTERIAL_SPEED = 0.8
+ARTERIAL_EVERY = 8
+SPEEDS = [0.5, 0.7]  # km/min of two speed classes
+
+
+def synthetic_road_network(lat, long, grid, seed=0, margin=0.01):
+    """Returns a grid x grid RoadGraph of two-way streets covering the points, with arterials."""
+    rng = np.random.default_rng(seed)
+    rows = np.linspace(lat.min() - margin, lat.max() + margin, grid)
+    cols = np.linspace(long.min() - margin, long.max() + margin, grid)
+    spacing = (rows[1] - rows[0]) * 0.1
+    node_lat = np.repeat(rows, grid) + rng.normal(0.0, spacing, grid * grid)
+    node_long = np.tile(cols, grid) + rng.normal(0.0, spacing, grid * grid)
+    index = np.arange(grid * grid).reshape(grid, grid)
+    a = np.concatenate((index[:, :-1].ravel(), index[:-1, :].ravel()))
+    b = np.concatenate((index[:, 1:].ravel(), index[1:, :].ravel()))
+    arterial = np.concatenate((((index[:, :-1] // grid) % ARTERIAL_EVERY == 0).ravel(),
+                               ((index[:-1, :] % grid) % ARTERIAL_EVERY == 0).ravel()))
+    keep = arterial | (rng.random(len(a)) > 0.1)
+    a, b, arterial = a[keep], b[keep], arterial[keep]
+    km = haversine_km(node_lat[a], node_long[a], node_lat[b], node_long[b])
+    speed = np.where(arterial, ARTERIAL_SPEED, LOCAL_SPEED)
+    return RoadGraph(node_lat, node_long, np.concatenate((a, b)), np.concatenate((b, a)), np.concatenate((km, km)),
+                     np.concatenate((speed, speed)), np.concatenate((arterial, arterial)).astype(np.int64))
+
+
+def timed(results, stage, call, *args):
+    started = time.perf_counter()
+    value = call(*args)
+    results[stage] = time.perf_counter() - started
+    print(f"{stage:>24}: {results[stage]:8.2f} s")
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--grid", type=int, default=100, help="road grid of grid x grid nodes")
+    parser.add_argument("--size", type=int, default=1000, help="customers, the matrices have one more node")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--check-rows", type=int, default=50, help="rows checked against plain Dijkstra")
+    parser.add_argument("--network", default="road_network.npz", help="where the synthetic road network is written")
+    parser.add_argument("--customers", default=os.path.join(REPO_DIR, "Customer_Data.csv"))
+    parser.add_argument("--output", default="travel_times.json")
+    args = parser.parse_args()
+
+    customers = synthetic_customers(pd.read_csv(args.customers), args.size, args.seed)
+    lat, long = node_coordinates(HUB_LAT, HUB_LONG, customers["buyer_lat"], customers["buyer_long"])
+    slots = np.concatenate(([-1], customers["E"].to_numpy()))
+    evening = int(slot_minutes(["4:00 PM"])[0])
+    profiles = {evening: {1: 0.5, 0: 0.8}}
+
+    graph = synthetic_road_network(lat, long, args.grid, args.seed)
+    for stale in glob.glob(f"{os.path.splitext(args.network)[0]}.ch-*.npz"):
+        os.remove(stale)  # contract afresh, the timings below include it
+    graph.save(args.network)
+    print(f"road network: {graph.n_nodes} nodes, {len(graph.tail)} edges; {len(lat)} matrix nodes")
+
+    results = {}
+    provider = RoadNetworkProvider(args.network, profiles)
+    timed(results, "contract free flow", load_hierarchy, graph, args.network, None)
+    timed(results, "contract evening", load_hierarchy, graph, args.network, profiles[evening])
+    distance_km = timed(results, "road distance matrix", provider.distance_km, lat, long)
+    minutes = timed(results, "road travel minutes", provider.travel_minutes, lat, long, SPEEDS, slots)
+    provider = RoadNetworkProvider(args.network, profiles)  # a new process: hierarchies read from disk
+    timed(results, "both, hierarchies stored", lambda: (provider.distance_km(lat, long),
+                                                         provider.travel_minutes(lat, long, SPEEDS, slots)))
+    haversine = HaversineProvider()
+    straight_km = timed(results, "haversine distance", haversine.distance_km, lat, long)
+    timed(results, "haversine travel minutes", haversine.travel_minutes, lat, long, SPEEDS)
+
+    # plain Dijkstra over the whole graph on a sample of rows, free flow
+    node, access_km = graph.nearest_nodes(lat, long)
+    rows = np.random.default_rng(args.seed).choice(len(lat), min(args.check_rows, len(lat)), replace=False)
+    _, check_km = dijkstra_many_to_many(graph, None, node[rows], node)
+    check_km = check_km + access_km[rows, None] + access_km[None, :]
+    check_km[np.arange(len(rows)), rows] = 0.0
+    results["max_km_error"] = float(np.abs(check_km - distance_km[rows]).max())
+    off_diagonal = ~np.eye(len(lat), dtype=bool)
+    results["road_over_haversine_km"] = float(np.median(distance_km[off_diagonal] / straight_km[off_diagonal]))
+    in_evening = slots == evening
+    free_flow = RoadNetworkProvider(args.network).travel_minutes(lat, long, SPEEDS)
+    results["evening_over_free_flow_minutes"] = float(
+        np.median(minutes[0][:, in_evening][off_diagonal[:, in_evening]]
+                  / free_flow[0][:, in_evening][off_diagonal[:, in_evening]]))
+    print(f"max KM error against plain Dijkstra: {results['max_km_error']:.2e}; road / haversine KMs "
+          f"{results['road_over_haversine_km']:.2f}; evening / free-flow minutes "
+          f"{results['evening_over_free_flow_minutes']:.2f}")
+
+    with open(args.output, "w") as f:
+        json.dump({"args": vars(args), "nodes": graph.n_nodes, "edges": len(graph.tail), "results": results}, f,
+                  indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,416 @@
+"""Column generation for the CVRPTW of CVRP_GUROBI.py: a set partitioning master over routes.
+
+Every column of the master is one feasible route of one vehicle type, costed like the MIP:
+the fixed cost plus the variable cost of the KMs beyond the free KMs. Every customer is
+covered and no type runs more routes than it has vehicles; a slack column per customer at
+a prohibitive cost keeps the master feasible. The master starts from the routes of an
+OR-Tools solve (cvrptw_routing.py) and a route to every customer alone, and its LP
+relaxation is solved with HiGHS. Its duals price new routes: for every type a randomised
+insertion heuristic grows routes from customers drawn by their duals, keeping capacity,
+time windows with service times and waiting, max customers, max KMs and the demand range
+of the type, and the routes of negative reduced cost join the master. Once no more are
+found, the master is solved as a MIP over all the routes generated (every customer on
+exactly one route), started from the OR-Tools plan.
+
+The heuristic cannot prove that no route of negative reduced cost is left, so the master
+LP is no bound. The lower bound comes from a relaxation of the whole problem instead (see
+fleet_bound): how many routes of each type run, with every limit of a route summed over
+them. Its route counts are integer and, the fixed costs dominating, it is close to the
+plans found; the gap of the result is the gap between the two.
+"""
+
+import time
+from dataclasses import dataclass
+
+import numpy as np
+from scipy import sparse
+
+from cvrptw_routing import solve_routing
+from evaluator import Instance, evaluate_routes
+from fleet import assign_vehicles
+from instrumentation import phase
+
+PRICING_ROUTES = 20  # routes grown per type and iteration
+NOISE = 0.2  # relative noise on the insertion scores, routes grown from the same customer differ
+MIN_REDUCED_COST = -1e-6  # routes must improve the master LP by more than this
+
+
+@dataclass
+class Column:
+    """A route of the master: its type index, node positions (depot first and last) and cost."""
+    vehicle_type: int
+    nodes: tuple
+    cost: float
+
+    @property
+    def customers(self):
+        return self.nodes[1:-1]
+
+
+class RouteSpace:
+    """Full node x node KMs and per type minutes of an instance, the arrays routes are priced on."""
+
+    def __init__(self, instance):
+        self.instance = instance
+        self.n = n = len(instance.labels)
+        a, b = np.divmod(np.arange(n * n), n)
+        km = np.asarray(instance.arc_km(a, b), dtype=np.float64)
+        self.km = km.reshape(n, n)
+        types = instance.types
+        self.minutes = [np.asarray(instance.arc_minutes(a, b, np.full(n * n, t), km)).reshape(n, n)
+                        for t in range(len(types))]
+        customer = np.arange(n) > 0
+        # customers whose demand a type may carry, and those it can serve alone
+        demand = instance.demand
+        self.eligible = [np.flatnonzero(customer & (demand >= t.min_demand) & (demand <= t.max_demand)) for t in types]
+        self.alone = [e[(self.km[0, e] + self.km[e, 0] <= t.max_km) & (self.minutes[p][0, e] <= instance.latest[e])]
+                      for p, (t, e) in enumerate(zip(types, self.eligible))]
+
+    def cost(self, t, km):
+        vehicle_type = self.instance.types[t]
+        return vehicle_type.fixed_cost + vehicle_type.variable_cost * max(km - vehicle_type.free_km, 0.0)
+
+
+def service_starts(space, t, route):
+    """Service start of every stop of a route and the latest start that keeps the rest of the route on time."""
+    instance, minutes = space.instance, space.minutes[t]
+    start = np.zeros(len(route))
+    for k in range(1, len(route)):
+        arrival = start[k - 1] + instance.service[route[k - 1]] + minutes[route[k - 1], route[k]]
+        start[k] = max(arrival, instance.earliest[route[k]])
+    latest = np.full(len(route), np.inf)  # no deadline back at the depot
+    for k in range(len(route) - 2, 0, -1):
+        latest[k] = min(instance.latest[route[k]],
+                        latest[k + 1] - instance.service[route[k]] - minutes[route[k], route[k + 1]])
+    return start, latest
+
+
+def grow_route(space, t, prize, seed, rng, noise=NOISE, by_load=False):
+    """Grows a route of type index t from customer seed, inserting the customer of the best score at a time.
+
+    A customer j at its cheapest feasible position scores prize[j] minus the variable cost
+    of the KMs it adds, times noise; by_load divides the score by the share of the capacity
+    and max customers j takes up, which packs full vehicles better. Returns (cost minus
+    prize, node positions, cost) of the best route on the way.
+    """
+    instance, km = space.instance, space.km
+    vehicle_type = instance.types[t]
+    minutes = space.minutes[t]
+    eligible = space.eligible[t]
+    candidates = eligible[prize[eligible] > 0]
+    route = [0, seed, 0]
+    in_route = np.zeros(space.n, dtype=bool)
+    in_route[seed] = True
+    load, length, collected = instance.demand[seed], km[0, seed] + km[seed, 0], prize[seed]
+    cost = space.cost(t, length)
+    best = (cost - collected, tuple(route), cost)
+    while len(route) - 2 < vehicle_type.max_customers:
+        open_ = candidates[~in_route[candidates] & (load + instance.demand[candidates] <= vehicle_type.capacity)]
+        if not len(open_):
+            break
+        nodes = np.array(route)
+        prev, succ = nodes[:-1], nodes[1:]
+        start, latest = service_starts(space, t, route)
+        added = km[prev][:, open_] + km[open_][:, succ].T - km[prev, succ][:, None]  # gaps x candidates
+        begin = np.maximum(start[:-1, None] + instance.service[prev][:, None] + minutes[prev][:, open_],
+                           instance.earliest[open_])
+        feasible = ((begin <= instance.latest[open_])
+                    & (begin + instance.service[open_] + minutes[open_][:, succ].T <= latest[1:, None])
+                    & (length + added <= vehicle_type.max_km))
+        score = (prize[open_] - vehicle_type.variable_cost * added) * rng.uniform(1 - noise, 1 + noise, added.shape)
+        if by_load:
+            score = score / (instance.demand[open_] / vehicle_type.capacity + 1.0 / vehicle_type.max_customers)
+        score = np.where(feasible, score, -np.inf)
+        gap, c = np.unravel_index(np.argmax(score), score.shape)
+        if not score[gap, c] > 0:
+            break
+        j = open_[c]
+        route.insert(gap + 1, j)
+        in_route[j] = True
+        load, length, collected = load + instance.demand[j], length + added[gap, c], collected + prize[j]
+        cost = space.cost(t, length)
+        if cost - collected < best[0]:
+            best = (cost - collected, tuple(route), cost)
+    return best
+
+
+def price_routes(space, t, prize, fleet_dual, rng, routes=PRICING_ROUTES):
+    """Routes of type index t with a negative reduced cost, grown from customers drawn in proportion to prize.
+
+    Every other route is grown by_load.
+    """
+    seeds = space.alone[t][prize[space.alone[t]] > 0]
+    if not len(seeds):
+        return []
+    weights = prize[seeds] / prize[seeds].sum()
+    columns = []
+    for k, seed in enumerate(rng.choice(seeds, size=min(routes, len(seeds)), replace=False, p=weights)):
+        value, nodes, cost = grow_route(space, t, prize, seed, rng, by_load=k % 2 == 1)
+        if value - fleet_dual < MIN_REDUCED_COST:
+            columns.append(Column(t, nodes, cost))
+    return columns
+
+
+def arcs_in(space, t, nodes):
+    """KMs and minutes of type index t of the shortest arc into each of nodes from the depot or another of them."""
+    source = np.concatenate(([0], nodes))
+    own = (np.arange(1, len(source)), np.arange(len(nodes)))
+    km = space.km[np.ix_(source, nodes)]
+    minutes = space.minutes[t][np.ix_(source, nodes)]
+    km[own] = minutes[own] = np.inf
+    return km.min(axis=0), minutes.min(axis=0)
+
+
+def fleet_bound(space, penalty=None):
+    """Lower bound on the cost of any plan plus penalty per customer it leaves unserved.
+
+    Without a penalty every customer must be served and the bound is inf when no plan can.
+    Solves a relaxation that only decides how many routes y_t of every type run and which
+    share x_jt of customer j they serve, summing the limits of a route over the y_t routes:
+    capacity, max customers, and max KMs and the KMs beyond the free KMs, where a customer
+    adds at least the KMs of its shortest arc in. The customers with time windows inside
+    [A, D] fit their service and shortest arc minutes into D - A plus one service and one
+    arc per route. y_t is integer, which is what makes the bound tight: the fixed costs
+    dominate the objective.
+    """
+    from sparse_model import SparseModel, solve_highs
+
+    instance = space.instance
+    n = space.n - 1
+    rows, cols, vals, upper = [], [], [], []
+
+    def add_row(columns, values, limit):
+        rows.append(np.full(len(columns), len(upper)))
+        cols.append(np.asarray(columns))
+        vals.append(np.asarray(values, dtype=np.float64))
+        upper.append(limit)
+
+    cost, col_upper, integrality, cover = [], [], [], [[] for _ in range(n)]
+    for t, vehicle_type in enumerate(instance.types):
+        nodes = space.eligible[t]
+        if not len(nodes) or not vehicle_type.count:
+            continue
+        y, e, x = len(cost), len(cost) + 1, len(cost) + 2 + np.arange(len(nodes))
+        cost += [vehicle_type.fixed_cost, vehicle_type.variable_cost] + [0.0] * len(nodes)
+        col_upper += [vehicle_type.count, np.inf] + [1.0] * len(nodes)
+        integrality += [True, False] + [False] * len(nodes)
+        for j, column in zip(nodes, x):
+            cover[j - 1].append(column)
+            add_row([column, y], [1.0, -1.0], 0.0)  # only served by a type that runs a route
+
+        km_in, minutes_in = arcs_in(space, t, nodes)
+        back = space.km[nodes, 0].min()
+        service, earliest, latest = instance.service[nodes], instance.earliest[nodes], instance.latest[nodes]
+        columns = np.append(x, y)
+        add_row(columns, np.append(instance.demand[nodes], -vehicle_type.capacity), 0.0)
+        add_row(columns, np.append(np.ones(len(nodes)), -vehicle_type.max_customers), 0.0)
+        add_row(columns, np.append(km_in, back - vehicle_type.max_km), 0.0)
+        add_row(np.append(columns, e), np.concatenate((km_in, [back - vehicle_type.free_km, -1.0])), 0.0)
+        for a in np.unique(np.concatenate(([0.0], earliest))):
+            for d in np.unique(latest[latest > a]):
+                inside = np.flatnonzero((earliest >= a) & (latest <= d))
+                if len(inside):
+                    per_route = d - a + service[inside].max() + minutes_in[inside].max()
+                    add_row(np.append(x[inside], y), np.append(service[inside] + minutes_in[inside], -per_route), 0.0)
+    if penalty is not None:
+        for c in cover:
+            c.append(len(cost))
+            cost.append(penalty)
+            col_upper.append(1.0)
+            integrality.append(False)
+    elif any(not c for c in cover):
+        return np.inf  # a customer no type may serve
+    lower = [-np.inf] * len(upper) + [1.0] * n
+    for c in cover:
+        add_row(c, np.ones(len(c)), 1.0)
+
+    A = sparse.csr_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+                          shape=(len(upper), len(cost)))
+    model = SparseModel(cost=np.array(cost), A=A, row_lower=np.array(lower), row_upper=np.array(upper),
+                        col_lower=np.zeros(len(cost)), col_upper=np.array(col_upper, dtype=np.float64),
+                        integrality=np.array(integrality), offsets={}, shape={})
+    status, objective, _ = solve_highs(model, mip_gap=0.0)
+    return objective if status == "Optimal" else np.inf
+
+
+class Master:
+    """The restricted master in HiGHS: a covering row per customer, a fleet row per type and a slack per customer."""
+
+    def __init__(self, space, penalty):
+        import highspy
+
+        self.highspy = highspy
+        self.space = space
+        self.penalty = penalty
+        self.n = n = space.n - 1
+        types = space.instance.types
+        self.h = h = highspy.Highs()
+        h.setOptionValue("output_flag", False)
+        inf = highspy.kHighsInf
+        h.addRows(n, np.ones(n), np.full(n, inf), 0, np.zeros(n, dtype=np.int32), np.zeros(0, dtype=np.int32),
+                  np.zeros(0))
+        h.addRows(len(types), np.full(len(types), -inf), np.array([float(t.count) for t in types]), 0,
+                  np.zeros(len(types), dtype=np.int32), np.zeros(0, dtype=np.int32), np.zeros(0))
+        rows = np.arange(n, dtype=np.int32)
+        h.addCols(n, np.full(n, float(penalty)), np.zeros(n), np.ones(n), n, rows, rows, np.ones(n))
+        self.columns = []
+        self._index = {}  # (type, customers in order of position) -> column number
+
+    def add(self, columns):
+        """Adds the routes not in the master yet, lowering the cost of known ones; returns the number added."""
+        new = []
+        for column in columns:
+            key = (column.vehicle_type, tuple(sorted(column.customers)))
+            known = self._index.get(key)
+            if known is None:
+                self._index[key] = len(self.columns) + len(new)
+                new.append(column)
+            elif known >= len(self.columns):
+                if column.cost < new[known - len(self.columns)].cost:
+                    new[known - len(self.columns)] = column
+            elif column.cost < self.columns[known].cost - 1e-9:
+                self.columns[known] = column
+                self.h.changeColCost(self.n + known, column.cost)
+        if new:
+            indices = [np.append(np.sort(np.asarray(c.customers)) - 1, self.n + c.vehicle_type) for c in new]
+            starts = np.cumsum([0] + [len(i) for i in indices[:-1]]).astype(np.int32)
+            indices = np.concatenate(indices).astype(np.int32)
+            self.h.addCols(len(new), np.array([c.cost for c in new]), np.zeros(len(new)),
+                           np.full(len(new), self.highspy.kHighsInf), len(indices), starts, indices,
+                           np.ones(len(indices)))
+            self.columns.extend(new)
+        return len(new)
+
+    def solve_lp(self):
+        """Solves the LP relaxation; returns (objective, customer duals by node position, fleet duals by type)."""
+        self.h.run()
+        row_dual = np.asarray(self.h.getSolution().row_dual)
+        duals = np.concatenate(([0.0], row_dual[:self.n]))
+        return self.h.getInfo().objective_function_value, duals, row_dual[self.n:]
+
+    def solve_mip(self, time_limit=None, mip_gap=None, start=None):
+        """Solves the master as a MIP, every customer on exactly one route; start lists route column numbers.
+
+        Returns (status string, chosen Columns, node positions of the customers left unserved).
+        """
+        highspy, h = self.highspy, self.h
+        routes = len(self.columns)
+        h.changeColsIntegrality(routes, np.arange(self.n, self.n + routes, dtype=np.int32),
+                                np.array([highspy.HighsVarType.kInteger] * routes))
+        for row in range(self.n):
+            h.changeRowBounds(row, 1.0, 1.0)
+        if time_limit is not None:
+            h.setOptionValue("time_limit", float(time_limit))
+        if mip_gap is not None:
+            h.setOptionValue("mip_rel_gap", float(mip_gap))
+        if start is not None:
+            values = np.zeros(self.n + routes)
+            values[self.n + np.asarray(start, dtype=np.int64)] = 1.0
+            covered = np.zeros(self.n + 1, dtype=bool)
+            for c in start:
+                covered[list(self.columns[c].customers)] = True
+            values[:self.n] = ~covered[1:]
+            solution = highspy.HighsSolution()
+            solution.col_value = values
+            solution.value_valid = True
+            h.setSolution(solution)
+        h.run()
+        status = h.modelStatusToString(h.getModelStatus())
+        if h.getInfo().primal_solution_status == 0:
+            return status, [], np.arange(1, self.n + 1)
+        values = np.asarray(h.getSolution().col_value)
+        chosen = [self.columns[c] for c in np.flatnonzero(values[self.n:] > 0.5)]
+        return status, chosen, np.flatnonzero(values[:self.n] > 0.5) + 1
+
+
+def seed_columns(space, routes_by_type):
+    """Columns of the feasible routes among routes by type name (node label lists)."""
+    instance = space.instance
+    type_index = {t.name: p for p, t in enumerate(instance.types)}
+    routes = [(type_index[name], instance.positions(route)) for name, rs in routes_by_type.items() for route in rs]
+    if not routes:
+        return []
+    offsets = np.concatenate(([0], np.cumsum([len(nodes) for _, nodes in routes])))
+    scored, _ = evaluate_routes(instance, np.concatenate([nodes for _, nodes in routes]), offsets,
+                                np.array([t for t, _ in routes]))
+    return [Column(t, tuple(nodes.tolist()), float(r["cost"]))
+            for (t, nodes), r in zip(routes, scored) if r["feasible"]]
+
+
+def single_columns(space):
+    """A route to every customer alone for every type that can serve it that way."""
+    return [Column(t, (0, int(j), 0), space.cost(t, space.km[0, j] + space.km[j, 0]))
+            for t in range(len(space.instance.types)) for j in space.alone[t]]
+
+
+def solve_column_generation(data, heuristic_time=1, time_limit=120, mip_time=60, mip_gap=0.01,
+                            routes_per_type=PRICING_ROUTES, seed=0, trace=None):
+    """Solves a CVRP_GUROBI.model_data instance by column generation.
+
+    heuristic_time is the OR-Tools budget of the seed routes, time_limit the seconds of
+    pricing and master LPs and mip_time those of the final MIP. Returns a dict with the
+    status, objective and routes by vehicle ID of the best plan, the customers it leaves
+    unserved and the penalty of each, the lower bound and the relative gap, the cost and
+    unserved customers of the seed plan, the last LP objective, the number of iterations
+    and columns and the seconds of each stage. Like the objective of OR-Tools, the bound
+    and the gap count the penalty of every unserved customer, so that they stay meaningful
+    on instances the fleet cannot serve completely. trace (an instrumentation.Trace) gets
+    the stages as phases and both plans as solutions.
+    """
+    seconds = {}
+    started = time.perf_counter()
+    instance = Instance.from_data(data)
+    space = RouteSpace(instance)
+    rng = np.random.default_rng(seed)
+    penalty = 10.0 * max(t.fixed_cost + t.variable_cost * t.max_km for t in instance.types)
+    master = Master(space, penalty)
+
+    with phase(trace, "seed"):
+        routes_by_type, dropped = solve_routing(data, heuristic_time)
+        seeds = seed_columns(space, routes_by_type or {})
+        master.add(seeds + single_columns(space))
+    start = seed_objective = seed_dropped = None
+    if routes_by_type is not None and len(seeds) == sum(map(len, routes_by_type.values())):
+        start, seed_objective, seed_dropped = list(range(len(seeds))), sum(c.cost for c in seeds), dropped
+        if trace is not None:
+            trace.solution(seed_objective + penalty * len(dropped), "seed")
+    seconds['seed'] = time.perf_counter() - started
+
+    stage = time.perf_counter()
+    iterations = 0
+    while True:
+        iterations += 1
+        with phase(trace, "master"):
+            lp_objective, duals, fleet_duals = master.solve_lp()
+        if time.perf_counter() - stage > time_limit:
+            break
+        with phase(trace, "pricing"):
+            columns = [c for t in range(len(instance.types))
+                       for c in price_routes(space, t, duals, fleet_duals[t], rng, routes_per_type)]
+        if not master.add(columns):
+            break
+    seconds['generation'] = time.perf_counter() - stage
+
+    stage = time.perf_counter()
+    with phase(trace, "bound"):
+        bound = fleet_bound(space, penalty)
+    seconds['bound'] = time.perf_counter() - stage
+
+    stage = time.perf_counter()
+    with phase(trace, "mip"):
+        status, chosen, unserved = master.solve_mip(mip_time, mip_gap, start)
+    seconds['mip'] = time.perf_counter() - stage
+    seconds['total'] = time.perf_counter() - started
+
+    objective = float(sum(c.cost for c in chosen))
+    routes_by_type = {t.name: [] for t in instance.types}
+    for c in chosen:
+        routes_by_type[instance.types[c.vehicle_type].name].append(instance.labels[list(c.nodes)].tolist())
+    total = objective + penalty * len(unserved)
+    gap = (total - bound) / total if chosen else None
+    if trace is not None and chosen:
+        trace.solution(total, "column generation", bound=bound, gap=gap)
+    return {'status': status, 'objective': objective, 'routes': assign_vehicles(routes_by_type, instance.types),
+            'dropped': instance.labels[unserved].tolist(), 'penalty': penalty, 'lower_bound': bound, 'gap': gap,
+            'seed_objective': seed_objective, 'seed_dropped': seed_dropped, 'lp_objective': lp_objective,
+            'iterations': iterations, 'columns': len(master.columns), 'seconds': seconds}
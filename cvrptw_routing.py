@@ -0,0 +1,200 @@
+"""OR-Tools routing model of the CVRPTW of CVRP_GUROBI.py, with one vehicle per concrete vehicle.
+
+The model is built on the data of CVRP_GUROBI.create_data_model (or model_data) and
+enforces all of the hard constraints of the MIP: capacity, time windows with service
+times and per type speeds, customers per trip, max kms and the demand range each type
+accepts. Travel times and distances are rounded up so that the routes it returns stay
+feasible for the MIP. The objective is the MIP's: fixed costs of the vehicles used and the
+variable cost of the KMs beyond the free KMs of every route, a soft upper bound on the
+route's distance, plus a small cost per metre (ARC_COST) that guides the search and
+breaks ties between plans of equal cost. Unlike the MIP it may use any arc, not only the
+candidate arcs, and vehicles must be back at the depot by the end of the day. Customers
+may be dropped at a prohibitive cost so that the first solution heuristics do not dead-end
+on tight instances; callers see which ones were.
+"""
+
+import math
+
+from ortools.constraint_solver import routing_enums_pb2
+from ortools.constraint_solver import pywrapcp
+import numpy as np
+
+from anytime import CURRENT_VALUES
+from CVRP_GUROBI import HORIZON
+from instrumentation import watch_routing
+from matrix import travel_time_matrix, unique_speeds
+from presolve import remove_closed_arcs
+from routing_setup import register_matrix_transit, register_vector_transit, scale_demands
+
+DROP_PENALTY = 10 ** 12  # cost of leaving a customer out of the plan
+COST_SCALE = 100000  # objective units per currency unit
+ARC_COST = 1  # objective units per metre driven, 0.01 per KM at COST_SCALE
+
+
+def routing_fleet(types):
+    """Returns the vehicle type of every OR-Tools vehicle, one vehicle per concrete vehicle ID."""
+    return [t for t in types for _ in range(t.count)]
+
+
+def build_routing(data):
+    """Builds the routing model of data; returns (manager, routing, fleet), fleet listing the type of each vehicle.
+
+    Vehicles start at the depot at time zero unless data has a 'vehicle_start' entry: a
+    dict of per vehicle lists giving the start 'node' position and the 'load', 'customers',
+    'km' and 'time' already used up by the stops served before it.
+    """
+    nodes = data['nodes']
+    types = data['types']
+    depot = data['depot']
+    fleet = routing_fleet(types)
+    start = data.get('vehicle_start') or {'node': [depot] * len(fleet)}
+    start_nodes = set(start['node']) - {depot}
+    distance_km = np.asarray(data['distance_km'])
+    speeds, _ = unique_speeds([t.speed for t in types])
+    service = np.array([data['service_time'][i] for i in nodes], dtype=np.float64)
+    # minutes rounded up, including the service time at the node left; a provider's times when model_data had one
+    minutes = data.get('travel_minutes')
+    if minutes is None:
+        minutes = travel_time_matrix(distance_km, speeds)
+    travel = np.ceil(minutes + service[None, :, None])
+    metres = np.ceil(distance_km * 1000)
+
+    manager = pywrapcp.RoutingIndexManager(len(nodes), len(fleet), start['node'], [depot] * len(fleet))
+    routing = pywrapcp.RoutingModel(manager)
+
+    # costs in 1/COST_SCALE of a currency unit: the fixed cost of every vehicle used, and the
+    # variable cost of the KMs beyond the free KMs as a soft upper bound on the Distance dimension
+    # below; the arcs only cost ARC_COST per metre so that the search is guided by distance
+    metre_transit = register_matrix_transit(routing, metres)
+    routing.SetArcCostEvaluatorOfAllVehicles(
+        metre_transit if ARC_COST == 1 else register_matrix_transit(routing, metres * ARC_COST))
+    for v, t in enumerate(fleet):
+        routing.SetFixedCostOfVehicle(round(t.fixed_cost * COST_SCALE), v)
+
+    demands = scale_demands([0] + [data['demand'][c] for c in data['customers']])
+    routing.AddDimensionWithVehicleCapacity(
+        register_vector_transit(routing, demands), 0, scale_demands([t.capacity for t in fleet]), False, 'Capacity')
+    routing.AddDimensionWithVehicleCapacity(
+        register_vector_transit(routing, [int(p != depot and p not in start_nodes) for p in range(len(nodes))]), 0,
+        [t.max_customers for t in fleet], False, 'Customers')
+    routing.AddDimensionWithVehicleCapacity(
+        metre_transit, 0, [int(t.max_km * 1000) for t in fleet], False, 'Distance')
+    distance_dimension = routing.GetDimensionOrDie('Distance')
+    for v, t in enumerate(fleet):
+        distance_dimension.SetCumulVarSoftUpperBound(
+            routing.End(v), int(t.free_km * 1000), round(t.variable_cost * COST_SCALE / 1000))
+
+    time_transits = [register_matrix_transit(routing, travel[c]) for c in range(len(speeds))]
+    routing.AddDimensionWithVehicleTransits(
+        [time_transits[data['speed_class'][t.name]] for t in fleet], HORIZON, HORIZON, False, 'Time')
+    time_dimension = routing.GetDimensionOrDie('Time')
+
+    # every vehicle starts with what it has used up so far, nothing for a vehicle leaving the depot
+    zeros = [0] * len(fleet)
+    used = {'Capacity': scale_demands(start.get('load', zeros)),
+            'Customers': [int(c) for c in start.get('customers', zeros)],
+            'Distance': [math.ceil(km * 1000) for km in start.get('km', zeros)],
+            'Time': [math.ceil(t) for t in start.get('time', zeros)]}
+    for name, values in used.items():
+        dimension = routing.GetDimensionOrDie(name)
+        for v, value in enumerate(values):
+            dimension.CumulVar(routing.Start(v)).SetValue(value)
+
+    for p, c in enumerate(data['customers'], start=1):
+        if p in start_nodes:
+            continue
+        index = manager.NodeToIndex(p)
+        time_dimension.CumulVar(index).SetRange(int(data['earliest'][c]), int(data['latest'][c]))
+        ineligible = [v for v, t in enumerate(fleet)
+                      if not t.min_demand <= data['demand'][c] <= t.max_demand]
+        if ineligible:
+            routing.VehicleVar(index).RemoveValues(ineligible)
+        routing.AddDisjunction([index], DROP_PENALTY)
+    # arcs between customers that no vehicle can use, when presolve.py ran on data
+    if data.get('open_arcs') is not None:
+        remove_closed_arcs(manager, routing, data['open_arcs'], start_nodes)
+    return manager, routing, fleet
+
+
+def read_vehicle_routes(data, manager, routing, solution):
+    """Returns the route of every vehicle as node labels from its start to the depot ([] when unused), and the dropped customers."""
+    nodes = data['nodes']
+    routes = []
+    for v in range(routing.vehicles()):
+        index = routing.Start(v)
+        if routing.IsEnd(solution.Value(routing.NextVar(index))):
+            routes.append([])
+            continue
+        route = []
+        while not routing.IsEnd(index):
+            route.append(nodes[manager.IndexToNode(index)])
+            index = solution.Value(routing.NextVar(index))
+        routes.append(route + [nodes[manager.IndexToNode(index)]])
+    dropped = [nodes[p] for p in range(1, len(nodes))
+               if not routing.IsStart(manager.NodeToIndex(p))
+               and solution.Value(routing.NextVar(manager.NodeToIndex(p))) == manager.NodeToIndex(p)]
+    return routes, dropped
+
+
+def solve_vehicle_routes(data, time_limit=1, initial=None, trace=None, monitor=None):
+    """Solves the routing model of data within time_limit seconds.
+
+    initial, a list with the customers each vehicle visits in order, seeds the search from
+    that assignment. Returns the route of every vehicle and the dropped customers as
+    read_vehicle_routes does, or (None, None) when no solution is found. Every solution
+    found is recorded in trace (an instrumentation.Trace) when one is given; monitor (an
+    anytime.ConvergenceMonitor) gets the routes of every improving one and may stop the search.
+    """
+    manager, routing, fleet = build_routing(data)
+    if trace is not None:
+        watch_routing(trace, routing)
+    if monitor is not None:
+        monitor.watch_routing(routing, lambda: read_vehicle_routes(data, manager, routing, CURRENT_VALUES))
+    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+    search_parameters.first_solution_strategy = (
+        routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC)
+    search_parameters.local_search_metaheuristic = (
+        routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH)
+    search_parameters.time_limit.FromMilliseconds(max(int(time_limit * 1000), 1))
+
+    assignment = None
+    if initial and any(initial):
+        position = {i: p for p, i in enumerate(data['nodes'])}
+        routing.CloseModelWithParameters(search_parameters)
+        assignment = routing.ReadAssignmentFromRoutes(
+            [[manager.NodeToIndex(position[i]) for i in customers] for customers in initial], True)
+    if assignment is not None:
+        solution = routing.SolveFromAssignmentWithParameters(assignment, search_parameters)
+    else:
+        solution = routing.SolveWithParameters(search_parameters)
+    if not solution:
+        return None, None
+    return read_vehicle_routes(data, manager, routing, solution)
+
+
+def solve_routing(data, time_limit=1, initial_routes=None, trace=None, monitor=None):
+    """Solves the routing model of data within time_limit seconds.
+
+    initial_routes, routes by type name like the ones returned, seeds the search; the
+    routes of each type go to its vehicles in order. Returns (routes by type name as node
+    label lists [depot, ..., depot], dropped customers), or (None, None) when no solution
+    is found. trace and monitor are passed on to solve_vehicle_routes.
+    """
+    fleet = routing_fleet(data['types'])
+    initial = None
+    if initial_routes:
+        pending = {name: list(routes) for name, routes in initial_routes.items()}
+        initial = [pending[t.name].pop(0)[1:-1] if pending.get(t.name) else [] for t in fleet]
+    routes, dropped = solve_vehicle_routes(data, time_limit, initial, trace, monitor)
+    if routes is None:
+        return None, None
+    return type_routes(data, routes, fleet), dropped
+
+
+def type_routes(data, routes, fleet=None):
+    """Returns the route of every vehicle of fleet (routing_fleet of data) by type name, leaving out the unused ones."""
+    routes_by_type = {t.name: [] for t in data['types']}
+    for t, route in zip(fleet or routing_fleet(data['types']), routes):
+        if route:
+            routes_by_type[t.name].append(route)
+    return routes_by_type
@@ -0,0 +1,284 @@
+"""Cluster-first, route-second decomposition of large CVRPTW instances.
+
+The customers are grouped by delivery slot (E, L) and each slot group is split by
+geography around the hub, into angular sweep sectors or with k-means, into partitions of
+at most max_size customers. Every partition gets a share of each vehicle type in
+proportion to the demand it has that the type may carry, and the partitions are solved in
+parallel with the OR-Tools model of cvrptw_routing.py on their own small matrices.
+
+Partition boundaries are then repaired. For each pair of partitions whose customers are
+among each other's nearest neighbours, the routes through those boundary customers, the
+customers of the pair left unserved and the idle vehicles of both partitions are
+re-solved together, starting from the current routes. The result is kept when it serves
+more customers or costs less. Pairs that share no partition and no vehicle are repaired
+in parallel.
+"""
+
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+
+import numpy as np
+from scipy.cluster.vq import kmeans2
+
+from CVRP_GUROBI import HUB_LAT, HUB_LONG, model_data
+from cvrptw_routing import solve_routing
+from evaluator import Instance, evaluate_plans
+from fleet import assign_vehicles
+from matrix import EARTH_RADIUS_KM
+from neighbours import DEFAULT_K, nearest_neighbours
+
+DEFAULT_PARTITION_SIZE = 200  # customers per partition, a size OR-Tools solves well within a second
+PARTITION_METHODS = ("sweep", "kmeans")
+
+
+def local_xy(lat, long, hub_lat=HUB_LAT, hub_long=HUB_LONG):
+    """Projects lat/long onto a plane around the hub; returns KMs east and north of it."""
+    x = np.radians(np.asarray(long, dtype=np.float64) - hub_long) * math.cos(math.radians(hub_lat))
+    y = np.radians(np.asarray(lat, dtype=np.float64) - hub_lat)
+    return x * EARTH_RADIUS_KM, y * EARTH_RADIUS_KM
+
+
+def slot_groups(customer_data):
+    """Returns the row positions of the customers of every delivery slot (E, L), earliest slot first."""
+    _, slot = np.unique(customer_data.loc[:, ["E", "L"]].to_numpy(), axis=0, return_inverse=True)
+    slot = slot.ravel()
+    return [np.flatnonzero(slot == s) for s in range(slot.max() + 1)] if len(slot) else []
+
+
+def sweep_sectors(x, y, parts):
+    """Splits points into parts angular sectors around the origin with equal numbers of points.
+
+    The sweep starts at the widest angular gap between two points, so that no sector
+    straddles a dense area just because the angle wraps around there.
+    """
+    angle = np.arctan2(y, x)
+    order = np.argsort(angle, kind="stable")
+    if len(order) > 1:
+        sorted_angle = angle[order]
+        gaps = np.diff(np.append(sorted_angle, sorted_angle[0] + 2 * math.pi))
+        order = np.roll(order, -(int(np.argmax(gaps)) + 1))
+    return np.array_split(order, parts)
+
+
+def kmeans_clusters(x, y, parts, max_size, seed=0):
+    """Clusters points with k-means into parts clusters; clusters above max_size are split into sweep sectors."""
+    points = np.column_stack((x, y))
+    if parts <= 1:
+        return [np.arange(len(points))]
+    _, labels = kmeans2(points, parts, minit="++", seed=seed)
+    clusters = []
+    for c in range(parts):
+        members = np.flatnonzero(labels == c)
+        if len(members) > max_size:
+            centre = points[members].mean(axis=0)
+            sectors = sweep_sectors(*(points[members] - centre).T, math.ceil(len(members) / max_size))
+            clusters.extend(members[s] for s in sectors)
+        elif len(members):
+            clusters.append(members)
+    return clusters
+
+
+def partition_customers(customer_data, max_size=DEFAULT_PARTITION_SIZE, method="sweep", by_slot=True,
+                        hub_lat=HUB_LAT, hub_long=HUB_LONG, seed=0):
+    """Partitions the rows of a Customer_Data.csv frame; returns the row positions of each partition.
+
+    method is "sweep" (angular sectors around the hub) or "kmeans". With by_slot the
+    customers of different delivery slots never share a partition.
+    """
+    if method not in PARTITION_METHODS:
+        raise ValueError(f"unknown partition method {method!r}, expected one of {PARTITION_METHODS}")
+    x, y = local_xy(customer_data.loc[:, "buyer_lat"], customer_data.loc[:, "buyer_long"], hub_lat, hub_long)
+    groups = slot_groups(customer_data) if by_slot else [np.arange(len(customer_data))]
+    partitions = []
+    for group in groups:
+        parts = math.ceil(len(group) / max_size)
+        if method == "sweep":
+            pieces = sweep_sectors(x[group], y[group], parts)
+        else:
+            pieces = kmeans_clusters(x[group], y[group], parts, max_size, seed)
+        partitions.extend(group[p] for p in pieces if len(p))
+    return partitions
+
+
+def allocate_fleet(customer_data, partitions, types):
+    """Splits the vehicles of every type over the partitions.
+
+    Each partition gets a share of a type in proportion to the demand of its customers
+    that the type may carry (largest remainder rounding). Returns, for every partition,
+    copies of the types holding the vehicle IDs given to it.
+    """
+    demand = customer_data.loc[:, "weight(Kg)"].to_numpy(dtype=np.float64)
+    fleets = [[] for _ in partitions]
+    for t in types:
+        eligible = np.where((demand >= t.min_demand) & (demand <= t.max_demand), demand, 0.0)
+        share = np.array([eligible[p].sum() for p in partitions])
+        counts = np.zeros(len(partitions), dtype=np.int64)
+        if share.sum() > 0:
+            quota = t.count * share / share.sum()
+            counts = np.floor(quota).astype(np.int64)
+            counts[np.argsort(counts - quota, kind="stable")[:t.count - counts.sum()]] += 1
+        ids = iter(t.vehicle_ids)
+        for fleet, count in zip(fleets, counts.tolist()):
+            if count:
+                fleet.append(replace(t, vehicle_ids=[next(ids) for _ in range(count)]))
+    return fleets
+
+
+def solve_subproblem(customer_data, types, time_limit, k=DEFAULT_K, initial_routes=None):
+    """Solves the customer rows with the vehicles of types; returns (routes by vehicle ID, dropped customers).
+
+    initial_routes are routes by type name, matched in order to the vehicle IDs of each type.
+    """
+    customers = list(customer_data.loc[:, "customer_no"])
+    if not any(t.count for t in types):
+        return {}, customers
+    data = model_data(customer_data, types, k)
+    routes_by_type, dropped = solve_routing(data, time_limit, initial_routes)
+    if routes_by_type is None:
+        return {}, customers
+    return assign_vehicles(routes_by_type, types), dropped
+
+
+def plan_cost(customer_data, types, routes, hub_lat=HUB_LAT, hub_long=HUB_LONG):
+    """Returns the total cost (fixed cost plus variable cost beyond the free KMs) and KMs of routes by vehicle ID."""
+    _, _, totals = evaluate_plans(Instance.from_frame(customer_data, types, hub_lat, hub_long), [routes])
+    return float(totals["cost"][0]), float(totals["km"][0])
+
+
+def boundary_pairs(customer_data, partitions, k=DEFAULT_K):
+    """Returns {(a, b): customers} for every pair of partitions a < b joined by nearest neighbour edges.
+
+    The customers are the labels at either end of those edges; pairs come in decreasing
+    order of their number of boundary customers.
+    """
+    label = np.empty(len(customer_data), dtype=np.int64)
+    for p, members in enumerate(partitions):
+        label[members] = p
+    neighbours = nearest_neighbours(customer_data.loc[:, "buyer_lat"], customer_data.loc[:, "buyer_long"], k)
+    src = np.repeat(np.arange(len(label)), neighbours.shape[1])
+    dst = neighbours.ravel()
+    cross = label[src] != label[dst]
+    customers = customer_data.loc[:, "customer_no"].to_numpy()
+    pairs = {}
+    for i, j in zip(src[cross].tolist(), dst[cross].tolist()):
+        a, b = sorted((int(label[i]), int(label[j])))
+        pairs.setdefault((a, b), set()).update((customers[i].item(), customers[j].item()))
+    return dict(sorted(pairs.items(), key=lambda item: -len(item[1])))
+
+
+def repair_job(customer_data, types, fleets, routes, dropped, home, pair, boundary):
+    """Collects the sub-instance that re-solves the boundary between the two partitions of pair.
+
+    Returns (customer rows, types holding its vehicles, initial routes by type name, the
+    vehicles whose routes it replaces, the dropped customers it takes in), or None when the
+    pair has nothing to repair.
+    """
+    vehicles = [v for v, route in routes.items() if not boundary.isdisjoint(route)]
+    pending = [c for c in dropped if home[c] in pair]
+    if not vehicles and not pending:
+        return None
+    idle = [v for p in pair for t in fleets[p] for v in t.vehicle_ids if v not in routes]
+    job_types = []
+    initial_routes = {}
+    for t in types:
+        ids = [v for v in vehicles if v in t.vehicle_ids]
+        if ids:
+            initial_routes[t.name] = [routes[v] for v in ids]
+        ids += [v for v in idle if v in t.vehicle_ids]
+        if ids:
+            job_types.append(replace(t, vehicle_ids=ids))
+    served = {i for v in vehicles for i in routes[v][1:-1]}
+    rows = customer_data[customer_data["customer_no"].isin(served | set(pending))]
+    return rows, job_types, initial_routes, vehicles, pending
+
+
+def repair_boundaries(customer_data, types, partitions, fleets, routes, dropped, executor, time_limit,
+                      k=DEFAULT_K):
+    """Re-solves the boundaries between adjacent partitions in rounds of independent pairs.
+
+    routes (by vehicle ID) and dropped (a set of customers) are updated in place.
+    Returns the number of pairs whose repair was kept.
+    """
+    labels = customer_data.loc[:, "customer_no"].to_numpy()
+    home = {c.item(): p for p, members in enumerate(partitions) for c in labels[members]}
+    pending = list(boundary_pairs(customer_data, partitions, k).items())
+    kept = 0
+    while pending:
+        claimed_partitions, claimed_vehicles, deferred, jobs = set(), set(), [], []
+        for pair, boundary in pending:
+            job = repair_job(customer_data, types, fleets, routes, dropped, home, pair, boundary)
+            if job is None:
+                continue
+            if claimed_partitions.intersection(pair) or claimed_vehicles.intersection(job[3]):
+                deferred.append((pair, boundary))
+                continue
+            claimed_partitions.update(pair)
+            claimed_vehicles.update(job[3])
+            jobs.append(job)
+        futures = [executor.submit(solve_subproblem, rows, job_types, time_limit, k, initial_routes)
+                   for rows, job_types, initial_routes, _, _ in jobs]
+        for (rows, job_types, _, vehicles, taken), future in zip(jobs, futures):
+            new_routes, new_dropped = future.result()
+            old_routes = {v: routes[v] for v in vehicles}
+            old = (len(taken), plan_cost(rows, job_types, old_routes)[0])
+            new = (len(new_dropped), plan_cost(rows, job_types, new_routes)[0])
+            if new < old:
+                for v in vehicles:
+                    del routes[v]
+                routes.update(new_routes)
+                dropped.difference_update(taken)
+                dropped.update(new_dropped)
+                kept += 1
+        pending = deferred
+    return kept
+
+
+def solve_decomposed(customer_data, types, max_size=DEFAULT_PARTITION_SIZE, method="sweep", by_slot=True,
+                     time_limit=1, repair_time=1, workers=None, k=DEFAULT_K, seed=0):
+    """Solves an instance by partitioning it, solving the partitions in parallel and repairing their boundaries.
+
+    time_limit and repair_time are the seconds of every partition and every boundary solve.
+    Returns a dict with the routes by vehicle ID, the dropped customers, cost, KMs, the
+    number of partitions and repaired boundaries and the seconds of each stage.
+    """
+    seconds = {}
+    started = time.perf_counter()
+    partitions = partition_customers(customer_data, max_size, method, by_slot, seed=seed)
+    fleets = allocate_fleet(customer_data, partitions, types)
+    seconds['partition'] = time.perf_counter() - started
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        stage = time.perf_counter()
+        futures = [executor.submit(solve_subproblem, customer_data.iloc[members], fleet, time_limit, k)
+                   for members, fleet in zip(partitions, fleets)]
+        routes, dropped = {}, set()
+        for future in futures:
+            partition_routes, partition_dropped = future.result()
+            routes.update(partition_routes)
+            dropped.update(partition_dropped)
+        seconds['solve'] = time.perf_counter() - stage
+
+        stage = time.perf_counter()
+        repaired = 0
+        if repair_time > 0 and len(partitions) > 1:
+            repaired = repair_boundaries(customer_data, types, partitions, fleets, routes, dropped, executor,
+                                         repair_time, k)
+        seconds['repair'] = time.perf_counter() - stage
+    seconds['total'] = time.perf_counter() - started
+
+    cost, km = plan_cost(customer_data, types, routes)
+    return {'routes': routes, 'dropped': sorted(dropped), 'cost': cost, 'km': km, 'partitions': len(partitions),
+            'repaired': repaired, 'seconds': seconds}
+
+
+def solve_monolithic(customer_data, types, time_limit=1, k=DEFAULT_K):
+    """Solves the whole instance as one OR-Tools model; returns a dict like solve_decomposed."""
+    started = time.perf_counter()
+    routes, dropped = solve_subproblem(customer_data, types, time_limit, k)
+    seconds = {'total': time.perf_counter() - started}
+    cost, km = plan_cost(customer_data, types, routes)
+    return {'routes': routes, 'dropped': sorted(dropped), 'cost': cost, 'km': km, 'partitions': 1,
+            'repaired': 0, 'seconds': seconds}
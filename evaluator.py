@@ -0,0 +1,255 @@
+"""Vectorized evaluation of routing plans on the business model of CVRP_GUROBI.py.
+
+Routes are flat integer arrays of node positions, depot first and last, with an offsets
+array marking where every route starts, so any number of routes of any number of plans is
+scored with a handful of NumPy operations. Per route the evaluator computes the KMs, load,
+customers, return time, time window lateness, the limits of its vehicle type that it
+breaks (capacity, max KMs, max customers, the demand range of the type) and the MIP
+objective: the fixed cost plus the variable cost of the KMs beyond the free KMs. Service
+start times follow the MIP as well: a vehicle leaves the depot at time zero, waits for the
+earliest time of a customer and leaves it after its service time.
+
+Results are structured arrays; format_routes turns them into text when needed.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from CVRP_GUROBI import HORIZON, HUB_LAT, HUB_LONG
+from matrix import haversine_km, node_coordinates, unique_speeds
+
+ROUTE_DTYPE = np.dtype([
+    ("plan", np.int64),
+    ("vehicle_type", np.int64),
+    ("customers", np.int64),
+    ("km", np.float64),
+    ("load", np.float64),
+    ("end", np.float64),  # time back at the depot
+    ("late_stops", np.int64),
+    ("lateness", np.float64),  # minutes past the latest times, summed over the stops
+    ("over_capacity", np.float64),
+    ("over_km", np.float64),
+    ("over_customers", np.int64),
+    ("ineligible", np.int64),  # customers whose demand the vehicle type may not carry
+    ("cost", np.float64),
+    ("feasible", np.bool_),
+])
+
+STOP_DTYPE = np.dtype([
+    ("route", np.int64),
+    ("node", np.int64),
+    ("arrival", np.float64),
+    ("start", np.float64),  # service start, the arrival or the earliest time if later
+    ("lateness", np.float64),
+])
+
+PLAN_DTYPE = np.dtype([
+    ("plan", np.int64),
+    ("routes", np.int64),
+    ("customers", np.int64),
+    ("km", np.float64),
+    ("cost", np.float64),
+    ("infeasible_routes", np.int64),
+    ("feasible", np.bool_),
+])
+
+
+@dataclass
+class Instance:
+    """Node arrays of an instance, indexed by node position with the depot at 0, and its vehicle types.
+
+    distance_km is an optional node x node matrix, an array or a matrix.TiledMatrix; without
+    one the KMs of the arcs are computed from the coordinates with the haversine formula,
+    like the matrix itself.
+    travel_minutes, the speed class x node x node matrices of a travel-time provider,
+    replaces KMs / speed as the travel time when given.
+    """
+    labels: np.ndarray
+    lat: np.ndarray
+    long: np.ndarray
+    demand: np.ndarray
+    service: np.ndarray
+    earliest: np.ndarray
+    latest: np.ndarray
+    types: list
+    distance_km: np.ndarray = None
+    travel_minutes: np.ndarray = None
+
+    @classmethod
+    def from_data(cls, data):
+        """Builds the instance of a CVRP_GUROBI.create_data_model (or model_data) dict."""
+        customers = data['customers']
+        return cls(labels=np.asarray(data['nodes']),
+                   lat=np.asarray(data['lat']),
+                   long=np.asarray(data['long']),
+                   demand=np.array([0.0] + [data['demand'][c] for c in customers]),
+                   service=np.array([data['service_time'][i] for i in data['nodes']], dtype=np.float64),
+                   earliest=np.array([0.0] + [data['earliest'][c] for c in customers]),
+                   latest=np.array([float(HORIZON)] + [data['latest'][c] for c in customers]),
+                   types=data['types'],
+                   distance_km=data['distance_km'],
+                   travel_minutes=data.get('travel_minutes'))
+
+    @classmethod
+    def from_frame(cls, customer_data, types, hub_lat=HUB_LAT, hub_long=HUB_LONG):
+        """Builds the instance of Customer_Data.csv rows (frame or instance_data columns), without a distance matrix."""
+        lat, long = node_coordinates(hub_lat, hub_long, customer_data["buyer_lat"], customer_data["buyer_long"])
+
+        def column(name, depot_value):
+            return np.concatenate(([depot_value], np.asarray(customer_data[name], dtype=np.float64)))
+
+        return cls(labels=np.concatenate(([0], np.asarray(customer_data["customer_no"]))),
+                   lat=lat, long=long,
+                   demand=column("weight(Kg)", 0.0),
+                   service=column("transaction_time(mins)", 0.0),
+                   earliest=column("E", 0.0),
+                   latest=column("L", float(HORIZON)),
+                   types=types)
+
+    def positions(self, labels):
+        """Maps node labels to node positions."""
+        if not hasattr(self, "_position"):
+            self._position = {label: p for p, label in enumerate(self.labels.tolist())}
+        return np.fromiter((self._position[label] for label in labels), dtype=np.int64)
+
+    def arc_km(self, a, b):
+        """KMs of the arcs from positions a to positions b."""
+        if self.distance_km is not None:
+            return self.distance_km[a, b]
+        return haversine_km(self.lat[a], self.long[a], self.lat[b], self.long[b])
+
+    def arc_minutes(self, a, b, vehicle_type, km):
+        """Travel minutes of the arcs from positions a to positions b, km long, for type indices vehicle_type."""
+        if self.travel_minutes is not None:
+            _, speed_class = unique_speeds(self.type_array("speed"))
+            return np.asarray(self.travel_minutes)[speed_class[vehicle_type], a, b]
+        return km / self.type_array("speed")[vehicle_type]
+
+    def type_array(self, attribute):
+        return np.array([getattr(t, attribute) for t in self.types], dtype=np.float64)
+
+
+def flatten_plans(instance, plans):
+    """Turns plans, dicts of vehicle ID to route labels, into the flat arrays evaluate_routes takes.
+
+    Returns (nodes, offsets, vehicle_type, plan): the node positions of all routes one
+    after the other, the start of every route in nodes plus its end, and the type index
+    and plan index of every route.
+    """
+    type_of = {v: p for p, t in enumerate(instance.types) for v in t.vehicle_ids}
+    labels, lengths, vehicle_type, plan = [], [], [], []
+    for p, routes in enumerate(plans):
+        for vehicle_id, route in routes.items():
+            labels.extend(route)
+            lengths.append(len(route))
+            vehicle_type.append(type_of[vehicle_id])
+            plan.append(p)
+    offsets = np.concatenate(([0], np.cumsum(lengths, dtype=np.int64)))
+    return (instance.positions(labels), offsets, np.array(vehicle_type, dtype=np.int64),
+            np.array(plan, dtype=np.int64))
+
+
+def evaluate_routes(instance, nodes, offsets, vehicle_type, plan=None):
+    """Scores flat routes; returns a ROUTE_DTYPE array with one row per route and a STOP_DTYPE array per node."""
+    nodes = np.asarray(nodes, dtype=np.int64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    vehicle_type = np.asarray(vehicle_type, dtype=np.int64)
+    lengths = np.diff(offsets)
+    n_routes = len(lengths)
+    route_of = np.repeat(np.arange(n_routes), lengths)
+    step = np.arange(len(nodes)) - offsets[route_of]  # position of every node within its route
+
+    # arcs between consecutive nodes of the same route
+    same_route = route_of[:-1] == route_of[1:]
+    arc_km = np.where(same_route, instance.arc_km(nodes[:-1], nodes[1:]), 0.0)
+    km = np.bincount(route_of[:-1], weights=arc_km, minlength=n_routes)
+    demand = instance.demand[nodes]
+    load = np.bincount(route_of, weights=demand, minlength=n_routes)
+    customers = np.maximum(lengths - 2, 0)
+
+    # service start times, one route position at a time but for all routes at once
+    width = int(lengths.max()) if n_routes else 0
+    padded = np.zeros((n_routes, width), dtype=np.int64)
+    padded[route_of, step] = nodes
+    travel = np.zeros((n_routes, width))
+    arc_route = route_of[1:][same_route]
+    travel[arc_route, step[1:][same_route]] = instance.arc_minutes(nodes[:-1][same_route], nodes[1:][same_route],
+                                                                   vehicle_type[arc_route], arc_km[same_route])
+    arrival = np.zeros((n_routes, width))
+    start = np.zeros((n_routes, width))
+    for k in range(1, width):
+        arrival[:, k] = start[:, k - 1] + instance.service[padded[:, k - 1]] + travel[:, k]
+        start[:, k] = np.maximum(arrival[:, k], instance.earliest[padded[:, k]])
+    stop_arrival = arrival[route_of, step]
+    stop_start = start[route_of, step]
+    is_customer = (step > 0) & (step < lengths[route_of] - 1)
+    lateness = np.where(is_customer, np.maximum(stop_start - instance.latest[nodes], 0.0), 0.0)
+
+    min_demand = instance.type_array("min_demand")[vehicle_type][route_of]
+    max_demand = instance.type_array("max_demand")[vehicle_type][route_of]
+    ineligible = is_customer & ((demand < min_demand) | (demand > max_demand))
+
+    result = np.zeros(n_routes, dtype=ROUTE_DTYPE)
+    result["plan"] = 0 if plan is None else plan
+    result["vehicle_type"] = vehicle_type
+    result["customers"] = customers
+    result["km"] = km
+    result["load"] = load
+    result["end"] = start[np.arange(n_routes), np.maximum(lengths - 1, 0)] if n_routes else 0.0
+    result["late_stops"] = np.bincount(route_of, weights=lateness > 0, minlength=n_routes)
+    result["lateness"] = np.bincount(route_of, weights=lateness, minlength=n_routes)
+    result["over_capacity"] = np.maximum(load - instance.type_array("capacity")[vehicle_type], 0.0)
+    result["over_km"] = np.maximum(km - instance.type_array("max_km")[vehicle_type], 0.0)
+    result["over_customers"] = np.maximum(customers - instance.type_array("max_customers")[vehicle_type], 0)
+    result["ineligible"] = np.bincount(route_of, weights=ineligible, minlength=n_routes)
+    extra_km = np.maximum(km - instance.type_array("free_km")[vehicle_type], 0.0)
+    result["cost"] = np.where(customers > 0, instance.type_array("fixed_cost")[vehicle_type]
+                              + instance.type_array("variable_cost")[vehicle_type] * extra_km, 0.0)
+    result["feasible"] = ((result["late_stops"] == 0) & (result["over_capacity"] == 0) & (result["over_km"] == 0)
+                          & (result["over_customers"] == 0) & (result["ineligible"] == 0))
+
+    stops = np.zeros(len(nodes), dtype=STOP_DTYPE)
+    stops["route"] = route_of
+    stops["node"] = nodes
+    stops["arrival"] = stop_arrival
+    stops["start"] = stop_start
+    stops["lateness"] = lateness
+    return result, stops
+
+
+def plan_totals(routes, n_plans=None):
+    """Sums a ROUTE_DTYPE array per plan; returns a PLAN_DTYPE array."""
+    n_plans = n_plans if n_plans is not None else (int(routes["plan"].max()) + 1 if len(routes) else 0)
+    used = routes["customers"] > 0
+
+    def total(values):
+        return np.bincount(routes["plan"], weights=values, minlength=n_plans)
+
+    totals = np.zeros(n_plans, dtype=PLAN_DTYPE)
+    totals["plan"] = np.arange(n_plans)
+    totals["routes"] = total(used)
+    totals["customers"] = total(routes["customers"])
+    totals["km"] = total(routes["km"])
+    totals["cost"] = total(routes["cost"])
+    totals["infeasible_routes"] = total(~routes["feasible"])
+    totals["feasible"] = totals["infeasible_routes"] == 0
+    return totals
+
+
+def evaluate_plans(instance, plans):
+    """Scores plans given as dicts of vehicle ID to route labels; returns (per route, per stop, per plan) arrays."""
+    nodes, offsets, vehicle_type, plan = flatten_plans(instance, plans)
+    routes, stops = evaluate_routes(instance, nodes, offsets, vehicle_type, plan)
+    return routes, stops, plan_totals(routes, len(plans))
+
+
+def format_routes(instance, routes):
+    """Returns a ROUTE_DTYPE array as a printable table."""
+    lines = ["{:>5} {:>10} {:>9} {:>9} {:>9} {:>7} {:>9} {:>10} {:>9}".format(
+        "plan", "type", "customers", "km", "load", "end", "late", "cost", "feasible")]
+    for r in routes:
+        lines.append("{:>5} {:>10} {:>9} {:>9.2f} {:>9.2f} {:>7.1f} {:>9} {:>10.2f} {:>9}".format(
+            r["plan"], instance.types[r["vehicle_type"]].name, r["customers"], r["km"], r["load"], r["end"],
+            r["late_stops"], r["cost"], "yes" if r["feasible"] else "no"))
+    return "\n".join(lines)
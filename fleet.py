@@ -0,0 +1,81 @@
+"""Groups identical vehicles of Vehicle_Data.csv into vehicle types with counts."""
+
+import re
+from dataclasses import dataclass, field
+
+import numpy as np
+
+# Vehicle_Data.csv column for every VehicleType attribute
+VEHICLE_COLUMNS = {
+    "max_customers": "Max Buyers/Customers (in a trip)",
+    "fixed_cost": "Fixed Cost",
+    "variable_cost": "Variable Cost",
+    "capacity": "Capacity(Kg)",
+    "free_km": "Free KMs",
+    "max_km": "Max KMs (per day)",
+    "min_demand": "Min Weight per Buyer/Customer",
+    "max_demand": "Max Weight per Buyer/Customer",
+    "max_time": "Max Time(hrs)",
+    "speed": "uniform speed (km/min)",
+}
+
+
+@dataclass
+class VehicleType:
+    """Parameters shared by a group of identical vehicles and the IDs of those vehicles."""
+    name: str
+    max_customers: int
+    fixed_cost: float
+    variable_cost: float
+    capacity: float
+    free_km: float
+    max_km: float
+    min_demand: float
+    max_demand: float
+    max_time: float
+    speed: float
+    vehicle_ids: list = field(default_factory=list)
+
+    @property
+    def count(self):
+        return len(self.vehicle_ids)
+
+
+def vehicle_types(data_vehicle):
+    """Returns the vehicle types of a Vehicle_Data.csv frame in order of first appearance.
+
+    Vehicles are grouped when every parameter column matches. A type is named after the
+    vehicle IDs without their _<number> suffix, e.g. "bolero"; a second type with the same
+    prefix but other parameters becomes "bolero-2". The column arrays of
+    instance_data.load_vehicles work as well as the frame.
+    """
+    types = {}
+    names = set()
+    columns = [np.asarray(data_vehicle[column]).tolist() for column in VEHICLE_COLUMNS.values()]
+    for vehicle_id, *values in zip(np.asarray(data_vehicle["Vehicle Type"]).tolist(), *columns):
+        params = dict(zip(VEHICLE_COLUMNS, values))
+        key = tuple(params.values())
+        if key not in types:
+            prefix = re.sub(r"_\d+$", "", str(vehicle_id))
+            name, suffix = prefix, 1
+            while name in names:
+                suffix += 1
+                name = f"{prefix}-{suffix}"
+            names.add(name)
+            types[key] = VehicleType(name, **params)
+        types[key].vehicle_ids.append(vehicle_id)
+    return list(types.values())
+
+
+def assign_vehicles(routes_by_type, types):
+    """Maps the routes found for each type name onto concrete vehicle IDs of that type.
+
+    Returns a dict of vehicle ID to route; vehicles that were not used are left out.
+    """
+    ids = {t.name: t.vehicle_ids for t in types}
+    assigned = {}
+    for name, routes in routes_by_type.items():
+        if len(routes) > len(ids[name]):
+            raise ValueError(f"{len(routes)} routes for type {name!r} but only {len(ids[name])} vehicles")
+        assigned.update(zip(ids[name], routes))
+    return assigned
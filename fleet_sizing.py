@@ -0,0 +1,205 @@
+"""Fleet pre-sizing: bounds on the number of vehicles of every type and a trimmed fleet to build the models with.
+
+A customer is eligible for a vehicle type when its demand is in the demand range of the
+type, the round trip from the depot fits in the max KMs of the type and a vehicle driving
+straight from the depot arrives before the latest time. For a set of customers the number
+of vehicles of one type is bounded from below by
+
+- capacity: the demand of the set over the capacity,
+- customer count: the size of the set over the max customers per trip,
+- slots: per time window, the customers in it over the customers one vehicle can start
+  serving inside it (one per shortest service time),
+- distance: the KMs needed to enter every customer once, from its nearest node among the
+  candidate arcs, over the max KMs.
+
+The lower bound of a type applies these to the customers only that type can serve. The
+upper bound is the bound for all its eligible customers plus slack, never more than the
+vehicles of the type or its eligible customers: beyond that many vehicles the type could
+carry all it may carry on its own. The trimmed fleet keeps the first upper bound vehicles
+of every type and drops the types with none, so OR-Tools gets fewer vehicles and the MIP
+tighter vehicle use bounds and fewer type blocks.
+
+Since the upper bound is a sizing rule rather than a proof, solve_presized adds vehicles
+back when the trimmed fleet leaves customers unserved or the model infeasible: the types
+eligible for the unserved customers are doubled, up to the full fleet.
+"""
+
+import math
+from dataclasses import dataclass, replace
+
+import numpy as np
+
+from evaluator import Instance
+
+SLACK = 0.25  # upper bounds are the bound for all eligible customers times 1 + SLACK
+
+
+@dataclass
+class TypeBounds:
+    """Pre-sizing result of one vehicle type."""
+    name: str
+    count: int
+    eligible: int  # customers the type may serve
+    exclusive: int  # customers only this type may serve
+    lower: int
+    upper: int
+
+
+def eligibility(data):
+    """Returns a types x customers bool array of the customers every type may serve."""
+    instance = Instance.from_data(data)
+    depot_km = np.asarray(instance.arc_km(np.zeros(len(instance.labels) - 1, dtype=np.int64),
+                                          np.arange(1, len(instance.labels))))
+    demand, latest = instance.demand[1:], instance.latest[1:]
+    return np.array([(demand >= t.min_demand) & (demand <= t.max_demand) & (2 * depot_km <= t.max_km)
+                     & (depot_km / t.speed <= latest) for t in data['types']]).reshape(len(data['types']), -1)
+
+
+def entry_km(data):
+    """KMs of the shortest candidate arc into every customer."""
+    return np.array([min(data['distance'][a] for a in data['in_arcs'][c]) for c in data['customers']])
+
+
+def slot_bound(earliest, latest, service):
+    """Vehicles needed to start serving every customer inside its time window, taken per distinct window."""
+    if not len(earliest):
+        return 0
+    windows, slot = np.unique(np.column_stack((earliest, latest)), axis=0, return_inverse=True)
+    slot = slot.ravel()
+    bound = 0
+    for s, (start, end) in enumerate(windows.tolist()):
+        shortest = service[slot == s].min()
+        per_vehicle = math.floor((end - start) / shortest) + 1 if shortest > 0 else math.inf
+        bound = max(bound, math.ceil(np.count_nonzero(slot == s) / per_vehicle))
+    return bound
+
+
+def vehicles_needed(vehicle_type, mask, demand, service, earliest, latest, km):
+    """Lower bound on the vehicles of a type serving the customers in mask on their own."""
+    if not mask.any():
+        return 0
+    return max(math.ceil(demand[mask].sum() / vehicle_type.capacity - 1e-9),
+               math.ceil(np.count_nonzero(mask) / vehicle_type.max_customers),
+               slot_bound(earliest[mask], latest[mask], service[mask]),
+               math.ceil(km[mask].sum() / vehicle_type.max_km - 1e-9))
+
+
+def customer_arrays(data):
+    """Returns the demand, service time, earliest and latest time and entry KMs of the customers as arrays."""
+    customers = data['customers']
+
+    def column(name):
+        return np.array([data[name][c] for c in customers], dtype=np.float64)
+
+    return column('demand'), column('service_time'), column('earliest'), column('latest'), entry_km(data)
+
+
+def fleet_bounds(data, slack=SLACK):
+    """Returns the TypeBounds of every vehicle type of a CVRP_GUROBI.model_data dict."""
+    arrays = customer_arrays(data)
+    eligible = eligibility(data)
+    exclusive = eligible & (eligible.sum(axis=0) == 1)
+
+    bounds = []
+    for t, may, only in zip(data['types'], eligible, exclusive):
+        lower = min(t.count, vehicles_needed(t, only, *arrays))
+        upper = math.ceil((1 + slack) * vehicles_needed(t, may, *arrays))
+        upper = min(t.count, int(np.count_nonzero(may)), max(upper, lower))
+        bounds.append(TypeBounds(t.name, t.count, int(np.count_nonzero(may)), int(np.count_nonzero(only)),
+                                 lower, upper))
+    return bounds
+
+
+def fleet_lower_bound(data, bounds):
+    """Lower bound on the vehicles of the whole fleet, at least the sum of the type lower bounds.
+
+    All customers are packed into vehicles with the largest capacity, max customers and
+    max KMs of any type.
+    """
+    types = data['types']
+    best = replace(types[0], capacity=max(t.capacity for t in types),
+                   max_customers=max(t.max_customers for t in types), max_km=max(t.max_km for t in types))
+    everyone = np.ones(len(data['customers']), dtype=bool)
+    return max(vehicles_needed(best, everyone, *customer_arrays(data)), sum(b.lower for b in bounds))
+
+
+def trim_fleet(types, bounds):
+    """Keeps the first upper bound vehicles of every type, leaving out the types with none."""
+    upper = {b.name: b.upper for b in bounds}
+    return [replace(t, vehicle_ids=t.vehicle_ids[:upper[t.name]]) for t in types if upper[t.name]]
+
+
+def grow_fleet(types, full_types, names):
+    """Doubles the vehicles of the named types, up to their full count.
+
+    Returns the grown fleet, or None when none of the named types has vehicles left to add.
+    """
+    current = {t.name: t.count for t in types}
+    grown, added = [], False
+    for t in full_types:
+        count = current.get(t.name, 0)
+        if t.name in names and count < t.count:
+            count = min(t.count, max(1, 2 * count))
+            added = True
+        if count:
+            grown.append(replace(t, vehicle_ids=t.vehicle_ids[:count]))
+    return grown if added else None
+
+
+def format_bounds(bounds, fleet_lower=None):
+    lines = ["{:>10} {:>6} {:>9} {:>10} {:>6} {:>6}".format(
+        "type", "count", "eligible", "exclusive", "lower", "upper")]
+    for b in bounds:
+        lines.append("{:>10} {:>6} {:>9} {:>10} {:>6} {:>6}".format(
+            b.name, b.count, b.eligible, b.exclusive, b.lower, b.upper))
+    if fleet_lower is None:
+        fleet_lower = sum(b.lower for b in bounds)
+    lines.append("vehicles: at least {}, trimmed fleet {} of {}".format(
+        fleet_lower, sum(b.upper for b in bounds), sum(b.count for b in bounds)))
+    return "\n".join(lines)
+
+
+def dropped_customers(data, result):
+    """unserved of solve_presized for the (routes by type, dropped) results of cvrptw_routing.solve_routing."""
+    routes_by_type, dropped = result
+    return data['customers'] if routes_by_type is None else dropped
+
+
+def infeasible_customers(data, result):
+    """unserved of solve_presized for (status, objective, routes by vehicle ID) MIP results.
+
+    A MIP serves every customer or none: without routes, whether it was infeasible or
+    stopped at its time limit before a solution, all of them count as unserved.
+    """
+    return data['customers'] if not result[2] else []
+
+
+def unrouted_customers(data, result):
+    """unserved of solve_presized for (status, objective, routes by vehicle ID) results that leave customers out."""
+    served = {i for route in result[2].values() for i in route}
+    return [c for c in data['customers'] if c not in served]
+
+
+def solve_presized(data, solve, unserved, slack=SLACK):
+    """Solves with the trimmed fleet and adds vehicles back until the result serves what it can.
+
+    solve takes a model_data dict and returns a result; unserved takes the dict and the
+    result and returns the customers left unserved, e.g. dropped_customers or
+    infeasible_customers. Returns (result, fleet it was solved with, bounds).
+    """
+    full_types = data['types']
+    bounds = fleet_bounds(data, slack)
+    types = trim_fleet(full_types, bounds)
+    eligible = eligibility(data)
+    column = {c: p for p, c in enumerate(data['customers'])}
+    while True:
+        sized = dict(data, types=types)
+        result = solve(sized)
+        missing = [column[c] for c in unserved(sized, result)]
+        if not missing:
+            return result, types, bounds
+        names = {t.name for t, may in zip(full_types, eligible) if may[missing].any()}
+        grown = grow_fleet(types, full_types, names)
+        if grown is None:
+            return result, types, bounds
+        types = grown
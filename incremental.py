@@ -0,0 +1,95 @@
+"""Intra-day re-optimization of a running plan when new orders arrive.
+
+The stops a vehicle has already served are fixed: they leave the model, and the vehicle
+starts from its current position with the load, customers, KMs and time those stops used
+up. Vehicles still at the depot start there at the current time. The distance matrix comes
+from the matrix cache, which reuses the stored matrix of the morning plan and computes only
+the rows of the new customers and the vehicle positions. OR-Tools is seeded with the
+remaining stops of every vehicle (read into an assignment and solved from it), so the
+search starts from the current plan and only has to insert the new orders.
+"""
+
+import time
+from dataclasses import dataclass, field, replace
+
+import pandas as pd
+
+from CVRP_GUROBI import HORIZON, HUB_LAT, HUB_LONG, model_data
+from cvrptw_routing import solve_vehicle_routes
+from matrix_cache import MatrixCache
+from neighbours import DEFAULT_K
+
+
+@dataclass
+class VehicleState:
+    """Where a vehicle is at the time of re-optimization and what it has done so far.
+
+    lat/long are None while the vehicle is at the depot; a vehicle back at the depot after
+    serving stops has finished its trip and keeps its route.
+    """
+    lat: float = None
+    long: float = None
+    time: float = 0.0
+    served: list = field(default_factory=list)
+    km: float = 0.0
+
+    @property
+    def at_depot(self):
+        return self.lat is None
+
+
+def position_rows(states):
+    """Returns pseudo customer rows for the vehicle positions, labelled -1, -2, ... in order."""
+    return pd.DataFrame({"customer_no": [-(p + 1) for p in range(len(states))],
+                         "buyer_lat": [s.lat for s in states],
+                         "buyer_long": [s.long for s in states],
+                         "weight(Kg)": 0.0,
+                         "transaction_time(mins)": 0,
+                         "E": 0,
+                         "L": HORIZON})
+
+
+def reoptimize(customer_data, types, routes, states, new_customers, now, time_limit=0.5, k=DEFAULT_K,
+               cache=None, hub_lat=HUB_LAT, hub_long=HUB_LONG):
+    """Inserts new customers into a running plan and re-optimizes the stops not yet served.
+
+    routes is the current plan by vehicle ID as [depot, ..., depot] label lists, states a
+    {vehicle ID: VehicleState} for the vehicles that have left the depot and now the time in
+    minutes. Returns the new plan by vehicle ID (served stops first, unchanged), the dropped
+    customers and the seconds it took.
+    """
+    started = time.perf_counter()
+    cache = cache or MatrixCache()
+    all_customers = pd.concat([customer_data, new_customers], ignore_index=True)
+    served = {c for s in states.values() for c in s.served}
+    finished = {v for v, s in states.items() if s.at_depot and s.served}
+    fleet_types = [replace(t, vehicle_ids=[v for v in t.vehicle_ids if v not in finished]) for t in types]
+    fleet_types = [t for t in fleet_types if t.count]
+    vehicle_ids = [v for t in fleet_types for v in t.vehicle_ids]
+    demand = dict(zip(all_customers["customer_no"], all_customers["weight(Kg)"]))
+
+    on_road = [v for v in vehicle_ids if v in states and not states[v].at_depot]
+    rows = pd.concat([all_customers[~all_customers["customer_no"].isin(served)],
+                      position_rows([states[v] for v in on_road])], ignore_index=True)
+    data = model_data(rows, fleet_types, k, cache, hub_lat, hub_long)
+    position = {i: p for p, i in enumerate(data['nodes'])}
+    label = {v: -(p + 1) for p, v in enumerate(on_road)}
+    state = [states.get(v, VehicleState(time=now)) for v in vehicle_ids]
+    data['vehicle_start'] = {
+        'node': [position[label[v]] if v in label else data['depot'] for v in vehicle_ids],
+        'load': [sum(demand[c] for c in s.served) for s in state],
+        'customers': [len(s.served) for s in state],
+        'km': [s.km for s in state],
+        'time': [max(s.time, now) for s in state],
+    }
+    initial = [[c for c in routes.get(v, [])[1:-1] if c not in served] for v in vehicle_ids]
+
+    new_routes, dropped = solve_vehicle_routes(data, time_limit, initial)
+    if new_routes is None:
+        raise ValueError("no feasible plan from the current vehicle states")
+    plan = {v: routes[v] for v in finished}
+    for v, s, route in zip(vehicle_ids, state, new_routes):
+        if route or s.served:
+            # the route starts at the vehicle's position node, which stands for the stops it served
+            plan[v] = [data['depot']] + list(s.served) + (route[1:] if route else [data['depot']])
+    return plan, dropped, time.perf_counter() - started
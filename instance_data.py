@@ -0,0 +1,146 @@
+"""Typed loader of Customer_Data.csv and Vehicle_Data.csv with a binary .npz cache.
+
+A file is read as a dict of NumPy column arrays keyed by its CSV column names, so that
+the column arrays stand in for the pandas frame wherever a column is read by name (e.g.
+CVRP_GUROBI.model_data and fleet.vehicle_types). The first load parses the CSV, checks
+every column and stores the arrays as an uncompressed .npz keyed by the path, size and
+modification time of the CSV; later loads only read the .npz, without pandas.
+
+The delivery slots are parsed from delivery_slot_start/delivery_slot_end ("7:00 AM") into
+minutes from the start of the working day, which become the E and L columns. When the
+CSV has E and L columns too they must agree with the slots.
+"""
+
+import hashlib
+import os
+import re
+
+import numpy as np
+
+from fleet import VEHICLE_COLUMNS
+
+INSTANCE_CACHE_DIR = os.environ.get("INSTANCE_CACHE_DIR", ".instance_cache")
+DAY_START = 7 * 60  # 7:00 AM, minute 0 of the model's working day
+
+CUSTOMER_DTYPES = {
+    "customer_id": np.str_,
+    "customer_no": np.int64,
+    "buyer_lat": np.float64,
+    "buyer_long": np.float64,
+    "weight(Kg)": np.float64,
+    "transaction_time(mins)": np.int64,
+}
+VEHICLE_DTYPES = {"Vehicle Type": np.str_, **{column: np.float64 for column in VEHICLE_COLUMNS.values()},
+                  VEHICLE_COLUMNS["max_customers"]: np.int64}
+
+SLOT_PATTERN = re.compile(r"^\s*(\d{1,2}):(\d{2})\s*([AaPp][Mm])\s*$")
+
+
+def slot_minutes(slots):
+    """Converts "h:mm AM/PM" strings to minutes from DAY_START; every distinct string is parsed once."""
+    values, inverse = np.unique(np.asarray(slots, dtype=np.str_), return_inverse=True)
+    minutes = np.empty(len(values), dtype=np.int64)
+    for p, value in enumerate(values.tolist()):
+        match = SLOT_PATTERN.match(value)
+        if not match or not 1 <= int(match.group(1)) <= 12 or int(match.group(2)) > 59:
+            raise ValueError(f"invalid delivery slot {value!r}, expected e.g. '7:00 AM'")
+        hour = int(match.group(1)) % 12 + (12 if match.group(3).upper() == "PM" else 0)
+        minutes[p] = hour * 60 + int(match.group(2)) - DAY_START
+    return minutes[inverse.ravel()]
+
+
+def typed_columns(frame, dtypes, path):
+    """Returns the columns of frame cast to dtypes, raising ValueError on missing or empty values."""
+    missing = [column for column in dtypes if column not in frame.columns]
+    if missing:
+        raise ValueError(f"{path}: missing columns {missing}")
+    columns = {}
+    for column, dtype in dtypes.items():
+        values = frame[column]
+        if values.isna().any():
+            raise ValueError(f"{path}: column {column!r} has empty values in rows "
+                             f"{values.index[values.isna()].tolist()[:10]}")
+        try:
+            columns[column] = values.to_numpy().astype(dtype)
+        except ValueError as error:
+            raise ValueError(f"{path}: column {column!r} is not {np.dtype(dtype).name}: {error}") from None
+    return columns
+
+
+def check(condition, path, message):
+    if not np.all(condition):
+        raise ValueError(f"{path}: {message}")
+
+
+def convert_customers(path):
+    """Reads and checks a Customer_Data.csv; returns its column arrays with E and L from the slots."""
+    import pandas as pd
+
+    frame = pd.read_csv(path)
+    columns = typed_columns(frame, dict(CUSTOMER_DTYPES, delivery_slot_start=np.str_, delivery_slot_end=np.str_),
+                            path)
+    earliest = slot_minutes(columns.pop("delivery_slot_start"))
+    latest = slot_minutes(columns.pop("delivery_slot_end"))
+    if {"E", "L"}.issubset(frame.columns):
+        check((frame["E"].to_numpy() == earliest) & (frame["L"].to_numpy() == latest), path,
+              "columns E and L do not match the delivery slots")
+    check(earliest <= latest, path, "delivery slots end before they start")
+    check(np.abs(columns["buyer_lat"]) <= 90, path, "buyer_lat out of range")
+    check(np.abs(columns["buyer_long"]) <= 180, path, "buyer_long out of range")
+    check(columns["weight(Kg)"] >= 0, path, "negative weights")
+    check(columns["transaction_time(mins)"] >= 0, path, "negative transaction times")
+    check(len(np.unique(columns["customer_no"])) == len(columns["customer_no"]), path, "duplicate customer_no")
+    columns["E"], columns["L"] = earliest, latest
+    return columns
+
+
+def convert_vehicles(path):
+    """Reads and checks a Vehicle_Data.csv; returns its column arrays."""
+    import pandas as pd
+
+    columns = typed_columns(pd.read_csv(path), VEHICLE_DTYPES, path)
+    check(columns[VEHICLE_COLUMNS["capacity"]] > 0, path, "capacities must be positive")
+    check(columns[VEHICLE_COLUMNS["speed"]] > 0, path, "speeds must be positive")
+    check(columns[VEHICLE_COLUMNS["max_customers"]] > 0, path, "max customers must be positive")
+    check(columns[VEHICLE_COLUMNS["min_demand"]] <= columns[VEHICLE_COLUMNS["max_demand"]], path,
+          "min weight per customer above the max weight")
+    return columns
+
+
+def cache_path(path, cache_dir):
+    """Returns the .npz path of a CSV, keyed by its absolute path, size and modification time."""
+    stat = os.stat(path)
+    key = hashlib.sha1(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, f"{name}-{key[:16]}.npz")
+
+
+def load_columns(path, convert, cache_dir=INSTANCE_CACHE_DIR):
+    """Returns the column arrays of a CSV from its .npz, converting the CSV first if it has none."""
+    npz_path = cache_path(path, cache_dir)
+    try:
+        with np.load(npz_path) as stored:
+            return {column: stored[column] for column in stored.files}
+    except OSError:
+        pass
+    columns = convert(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{npz_path}.{os.getpid()}.tmp.npz"  # processes converting the same CSV do not share it
+    np.savez(tmp_path, **columns)
+    os.replace(tmp_path, npz_path)
+    return columns
+
+
+def load_customers(path, cache_dir=INSTANCE_CACHE_DIR):
+    """Returns the column arrays of a Customer_Data.csv."""
+    return load_columns(path, convert_customers, cache_dir)
+
+
+def load_vehicles(path, cache_dir=INSTANCE_CACHE_DIR):
+    """Returns the column arrays of a Vehicle_Data.csv."""
+    return load_columns(path, convert_vehicles, cache_dir)
+
+
+def head(columns, rows):
+    """Returns the first rows of every column."""
+    return {column: values[:rows] for column, values in columns.items()}
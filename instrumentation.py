@@ -0,0 +1,161 @@
+"""Phase timers, memory peaks and solver progress of a run, written as a JSON Lines trace.
+
+A Trace times named phases (CSV load, matrices, model construction, writeLP, the solve,
+printing), counts the solutions the solver finds and keeps its objective trajectory.
+Every event is one JSON object per line with the seconds since the trace started:
+
+    {"event": "phase", "t": 0.41, "name": "data", "seconds": 0.38}
+    {"event": "solution", "t": 1.02, "source": "ortools", "objective": 564022, "count": 1, "improved": true}
+
+Solutions come from an OR-Tools solution callback (watch_routing), a HiGHS improving
+solution callback (watch_highs) or, for Gurobi behind PuLP, from its log file after the
+solve (gurobi_log_solutions). Without a path nothing is written and the events are only
+kept in memory. Timers and callbacks cost microseconds, so a trace can stay on in
+production, e.g. through the ROUTING_TRACE environment variable; tracemalloc (memory=True)
+slows Python allocations down noticeably and is meant for profiling runs only.
+"""
+
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+TRACE_ENV = "ROUTING_TRACE"  # trace file of runs started without --trace
+GUROBI_INCUMBENT = re.compile(r"^\s*[H*]\s*\d+\s+\d+")  # branch-and-bound log line of a new incumbent
+GUROBI_HEURISTIC = re.compile(r"^Found heuristic solution: objective\s+(\S+)")
+
+
+class Trace:
+    """Events of one run; a context manager that writes the closing summary on exit."""
+
+    def __init__(self, path=None, memory=False, run=None):
+        self.path = path
+        self.memory = memory and not tracemalloc.is_tracing()
+        self.started = time.perf_counter()
+        self.events = []
+        self.solutions = 0
+        self.best = None
+        self._callbacks = []  # solver callbacks must outlive the solve
+        self._file = open(path, "a", buffering=1) if path else None  # line buffered, one event per line
+        if self.memory:
+            tracemalloc.start()
+        self.emit("start", run=run, pid=os.getpid(), argv=sys.argv, memory=self.memory)
+
+    def emit(self, event, **fields):
+        record = {'event': event, 't': time.perf_counter() - self.started, **fields}
+        self.events.append(record)
+        if self._file is not None:
+            self._file.write(json.dumps(record, default=str) + "\n")
+        return record
+
+    @contextmanager
+    def phase(self, name):
+        """Times the block; with memory also its tracemalloc peak and the MB it left allocated."""
+        if self.memory:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            fields = {'seconds': time.perf_counter() - started}
+            if self.memory:
+                current, peak = tracemalloc.get_traced_memory()
+                fields.update(peak_mb=peak / 2 ** 20, allocated_mb=(current - before) / 2 ** 20)
+            self.emit("phase", name=name, **fields)
+
+    def solution(self, objective, source, **fields):
+        """Records a solution of a minimisation with its objective."""
+        self.solutions += 1
+        improved = self.best is None or objective < self.best
+        if improved:
+            self.best = objective
+        self.emit("solution", source=source, objective=objective, count=self.solutions, improved=improved, **fields)
+
+    def phases(self):
+        """Seconds per phase name, summed over repeated phases."""
+        seconds = {}
+        for event in self.events:
+            if event['event'] == "phase":
+                seconds[event['name']] = seconds.get(event['name'], 0.0) + event['seconds']
+        return seconds
+
+    def trajectory(self):
+        """(seconds, objective) of every improving solution."""
+        return [(event['t'], event['objective']) for event in self.events
+                if event['event'] == "solution" and event['improved']]
+
+    def close(self):
+        if self.events[-1]['event'] == "end":
+            return
+        self.emit("end", seconds=time.perf_counter() - self.started, solutions=self.solutions, best=self.best,
+                  phases=self.phases())
+        if self.memory:
+            tracemalloc.stop()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_trace(path=None, memory=False, run=None):
+    """Returns the Trace of a run, written to path or else to the file named by ROUTING_TRACE, if any."""
+    return Trace(path or os.environ.get(TRACE_ENV) or None, memory, run)
+
+
+def watch_routing(trace, routing):
+    """Records every solution an OR-Tools routing search finds in trace."""
+    def at_solution():
+        trace.solution(routing.CostVar().Max(), "ortools")
+
+    trace._callbacks.append(at_solution)
+    routing.AddAtSolutionCallback(at_solution)
+
+
+def watch_highs(trace, h):
+    """Records every improving MIP solution of a highspy.Highs instance in trace."""
+    def improving(event):
+        out = event.data_out
+        trace.solution(out.objective_function_value, "highs", bound=out.mip_dual_bound, gap=out.mip_gap,
+                       solver_seconds=out.running_time)
+
+    trace._callbacks.append(improving)
+    h.cbMipImprovingSolution.subscribe(improving)
+
+
+def gurobi_log_solutions(path):
+    """Reads the incumbents of a Gurobi log file; returns (solver seconds or None, objective, bound) tuples.
+
+    Heuristic solutions found before branching have no time in the log. Branch-and-bound
+    lines of new incumbents (marked H or *) end in incumbent, bound, gap, it/node and time.
+    """
+    solutions = []
+    try:
+        with open(path) as f:
+            lines = f.readlines()
+    except OSError:
+        return solutions
+    for line in lines:
+        heuristic = GUROBI_HEURISTIC.match(line)
+        if heuristic:
+            solutions.append((None, float(heuristic.group(1)), None))
+        elif GUROBI_INCUMBENT.match(line):
+            tokens = line.split()
+            try:
+                solutions.append((float(tokens[-1].rstrip("s")), float(tokens[-5]), float(tokens[-4])))
+            except (ValueError, IndexError):
+                continue
+    return solutions
+
+
+def phase(trace, name):
+    """trace.phase(name), or a no-op when trace is None."""
+    return trace.phase(name) if trace is not None else nullcontext()
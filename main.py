@@ -1,47 +1,51 @@
 """Capacited Vehicles Routing Problem (CVRP)."""
 
+import argparse
+
 from ortools.constraint_solver import routing_enums_pb2
 from ortools.constraint_solver import pywrapcp
-import haversine as hv
-import pandas as pd
+import numpy as np
+
+from anytime import Convergence, ConvergenceMonitor
+from instance_data import head, load_customers, load_vehicles
+from instrumentation import open_trace, phase, watch_routing
+from matrix import cast_matrix, node_coordinates
+from matrix_cache import MatrixCache
+from neighbours import DEFAULT_K, arc_report, candidate_arcs, format_arc_report, limit_local_search
+from routing_setup import DEMAND_SCALE, register_matrix_transit, register_vector_transit, scale_demands
 
-def distance_matrix(buyer_lat, buyer_long):
-    return (hv.haversine(buyer_lat, buyer_long, unit=hv.Unit.METERS))
+CUSTOMER_CSV = r"C:\Users\Rishi Mehdiratta\Desktop\Data\Customer_Data.csv"
+VEHICLE_CSV = r"C:\Users\Rishi Mehdiratta\Desktop\Data\Vehicle_Data.csv"
 
 
-def create_data_model():
-    """Stores the data for the problem."""
+def create_data_model(k=DEFAULT_K, customer_csv=CUSTOMER_CSV, vehicle_csv=VEHICLE_CSV, customers=250, vehicles=45,
+                      trace=None):
+    """Stores the data for the problem, the first customers and vehicles rows (None for all of them)."""
     data = {}
-    # reading vehicle and customer data
-    data_customer = pd.read_csv(
-        r"C:\Users\Rishi Mehdiratta\Desktop\Data\Customer_Data.csv")
-    data_vehicle = pd.read_csv(
-        r"C:\Users\Rishi Mehdiratta\Desktop\Data\Vehicle_Data.csv")
-    customers: str = data_customer.loc[0:249, "customer_id"]
-    customers_set = list(customers)
-    depot = 0
-    nodes_set = [depot] + customers_set
-    buyer_lat: float = data_customer.loc[0:249, "buyer_lat"]
-    buyer_long: float = data_customer.loc[0:249, "buyer_long"]
+    # reading vehicle and customer data, typed column arrays cached as .npz after the first read
+    with phase(trace, "load"):
+        data_customer = head(load_customers(customer_csv), customers)
+        data_vehicle = head(load_vehicles(vehicle_csv), vehicles)
+    buyer_lat: float = data_customer["buyer_lat"]
+    buyer_long: float = data_customer["buyer_long"]
     hub_lat: float = 28.65781432
     hub_long: float = 77.21996426
-    nodes_coordinates = {}
-    for i in range(len(customers_set)):
-        nodes_coordinates.update({customers[i]: (buyer_lat[i], buyer_long[i])})
-    nodes_coordinates[0] = (hub_lat, hub_long)
-    distance_nodes = {}
-    for n1 in nodes_set:
-        for n2 in nodes_set:
-            distance_nodes.update({(n1, n2): distance_matrix(nodes_coordinates[n1], nodes_coordinates[n2])})
-    list_nodes = list(distance_nodes.values())
-    dist_matx = [[list_nodes[n1] for n1 in range(len(nodes_set))] for n1 in range(len(nodes_set))]
-    demands = [0] + list(data_customer.loc[0:249, "weight(Kg)"])
-    veh_capacity = list(data_vehicle.loc[0:44, "Capacity(Kg)"])
+    # depot is node 0 followed by the customers, distances in whole metres
+    lat, long = node_coordinates(hub_lat, hub_long, buyer_lat, buyer_long)
+    with phase(trace, "matrix"):
+        dist_matx = cast_matrix(MatrixCache().get(lat, long), np.int32, scale=1000).tolist()
+        # k nearest neighbours of each node plus all depot arcs, the arcs local search works on
+        arcs = candidate_arcs(lat, long, k)
+    # weights in integer units of 1/DEMAND_SCALE kg
+    demands = scale_demands([0] + data_customer["weight(Kg)"].tolist())
+    veh_capacity = scale_demands(data_vehicle["Capacity(Kg)"])
 
     data['distance_matrix'] = dist_matx
+    data['k'] = k
+    data['arc_report'] = arc_report(len(dist_matx), arcs)
     data['demands'] = demands
     data['vehicle_capacities'] = veh_capacity
-    data['num_vehicles'] = 45
+    data['num_vehicles'] = len(veh_capacity)
     data['depot'] = 0
     return data
 
@@ -59,27 +63,37 @@ def print_solution(data, manager, routing, solution):
         while not routing.IsEnd(index):
             node_index = manager.IndexToNode(index)
             route_load += data['demands'][node_index]
-            plan_output += ' {0} Load({1}) -> '.format(node_index, route_load)
+            plan_output += ' {0} Load({1}) -> '.format(node_index, route_load / DEMAND_SCALE)
             previous_index = index
             index = solution.Value(routing.NextVar(index))
             route_distance += routing.GetArcCostForVehicle(
                 previous_index, index, vehicle_id)
         plan_output += ' {0} Load({1})\n'.format(manager.IndexToNode(index),
-                                                 route_load)
+                                                 route_load / DEMAND_SCALE)
         plan_output += 'Distance of the route: {}m\n'.format(route_distance)
-        plan_output += 'Load of the route: {}\n'.format(route_load)
+        plan_output += 'Load of the route: {}kg\n'.format(route_load / DEMAND_SCALE)
         print(plan_output)
         total_distance += route_distance
         total_load += route_load
     print('Total distance of all routes: {}m'.format(total_distance))
-    print('Total load of all routes: {}'.format(total_load))
+    print('Total load of all routes: {}kg'.format(total_load / DEMAND_SCALE))
+
 
+def print_routes(data, routes):
+    """Prints routes given as lists of nodes by vehicle, e.g. the best plan of a portfolio solve."""
+    total_distance = 0
+    for vehicle_id, route in routes.items():
+        route_distance = sum(data['distance_matrix'][i][j] for i, j in zip(route, route[1:]))
+        route_load = sum(data['demands'][i] for i in route)
+        print('Route for vehicle {}:\n {}'.format(vehicle_id, ' -> '.join(map(str, route))))
+        print('Distance of the route: {}m'.format(route_distance))
+        print('Load of the route: {}kg\n'.format(route_load / DEMAND_SCALE))
+        total_distance += route_distance
+    print('Total distance of all routes: {}m'.format(total_distance))
 
-def main():
-    """Solve the CVRP problem."""
-    # Instantiate the data problem.
-    data = create_data_model()
 
+def create_routing_model(data):
+    """Creates the index manager and the routing model with its costs and capacities."""
     # Create the routing index manager.
     manager = pywrapcp.RoutingIndexManager(len(data['distance_matrix']),
                                            data['num_vehicles'], data['depot'])
@@ -88,51 +102,89 @@ def main():
     routing = pywrapcp.RoutingModel(manager)
 
 
-    # Create and register a transit callback.
-    def distance_callback(from_index, to_index):
-        """Returns the distance between the two nodes."""
-        # Convert from routing variable Index to distance matrix NodeIndex.
-        from_node = manager.IndexToNode(from_index)
-        to_node = manager.IndexToNode(to_index)
-        return data['distance_matrix'][from_node][to_node]
-
-    transit_callback_index = routing.RegisterTransitCallback(distance_callback)
+    # Register the distance matrix as a native transit.
+    transit_callback_index = register_matrix_transit(routing, data['distance_matrix'])
 
     # Define cost of each arc.
     routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
 
 
     # Add Capacity constraint.
-    def demand_callback(from_index):
-        """Returns the demand of the node."""
-        # Convert from routing variable Index to demands NodeIndex.
-        from_node = manager.IndexToNode(from_index)
-        return data['demands'][from_node]
-
-    demand_callback_index = routing.RegisterUnaryTransitCallback(
-        demand_callback)
+    demand_callback_index = register_vector_transit(routing, data['demands'])
     routing.AddDimensionWithVehicleCapacity(
         demand_callback_index,
         0,  # null capacity slack
         data['vehicle_capacities'],  # vehicle maximum capacities
         True,  # start cumul to zero
         'Capacity')
+    return manager, routing
+
 
+def create_search_parameters(data, time_limit=1):
+    """Returns the search parameters of the single solve of main."""
     # Setting first solution heuristic.
     search_parameters = pywrapcp.DefaultRoutingSearchParameters()
     search_parameters.first_solution_strategy = (
         routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC)
     search_parameters.local_search_metaheuristic = (
         routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH)
-    search_parameters.time_limit.FromSeconds(1)
-
-    # Solve the problem.
-    solution = routing.SolveWithParameters(search_parameters)
-
-    # Print solution on console.
-    if solution:
-        print_solution(data, manager, routing, solution)
+    search_parameters.time_limit.FromMilliseconds(max(int(time_limit * 1000), 1))
+    # Restrict local search to the candidate arcs.
+    limit_local_search(search_parameters, data['k'], len(data['distance_matrix']))
+    return search_parameters
+
+
+def main(workers=1, time_limit=1, trace_path=None, trace_memory=False, stall=None):
+    """Solve the CVRP problem, with a portfolio of parallel solves if workers > 1.
+
+    Phase times and every solution found go to the trace file trace_path (see instrumentation.py).
+    With stall the single solve stops once it has not improved for stall seconds (see anytime.py).
+    """
+    with open_trace(trace_path, trace_memory, run="main") as trace:
+        # Instantiate the data problem.
+        data = create_data_model(trace=trace)
+        print(format_arc_report(data['arc_report']))
+
+        if workers > 1:
+            from portfolio import format_worker_stats, portfolio_configs, solve_portfolio
+
+            with trace.phase("solve"):
+                best, stats = solve_portfolio(data, create_routing_model, portfolio_configs(workers), time_limit)
+            if best is not None:
+                trace.solution(best['objective'], "portfolio", config=best['config'])
+            with trace.phase("print"):
+                print(format_worker_stats(stats))
+                if best is not None:
+                    print(f"best of {len(stats)} workers: {best['config']}")
+                    print_routes(data, best['routes'])
+            return
+
+        with trace.phase("model"):
+            manager, routing = create_routing_model(data)
+            search_parameters = create_search_parameters(data, time_limit)
+            watch_routing(trace, routing)
+            if stall is not None:
+                monitor = ConvergenceMonitor(Convergence(stall_seconds=stall))
+                monitor.watch_routing(routing)
+
+        # Solve the problem.
+        with trace.phase("solve"):
+            solution = routing.SolveWithParameters(search_parameters)
+
+        # Print solution on console.
+        with trace.phase("print"):
+            if solution:
+                print_solution(data, manager, routing, solution)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Capacitated Vehicle Routing Problem (OR-Tools)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of parallel solves with different strategies and seeds")
+    parser.add_argument("--time-limit", type=float, default=1, help="wall-clock budget in seconds")
+    parser.add_argument("--trace", help="JSON Lines trace file of phase times and solutions, appended to")
+    parser.add_argument("--trace-memory", action="store_true", help="also trace memory peaks with tracemalloc")
+    parser.add_argument("--stall", type=float, default=None, metavar="SECONDS",
+                        help="stop the search once it has not improved for this many seconds")
+    args = parser.parse_args()
+    main(args.workers, args.time_limit, args.trace, args.trace_memory, args.stall)
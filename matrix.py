@@ -0,0 +1,209 @@
+"""Distance and travel-time matrices shared by all the solvers."""
+
+from collections import OrderedDict
+
+import numpy as np
+
+from neighbours import nearest_neighbours
+
+EARTH_RADIUS_KM = 6371.0088  # mean earth radius, same value the haversine package uses
+DENSE_NODES = 4096  # model_data switches to a TiledMatrix above this many nodes, 128 MB of float64
+TILE_SIZE = 512  # nodes per side of a TiledMatrix tile, 2 MB of float64
+TILE_CACHE_BYTES = 128 * 2 ** 20
+
+DISTANCE_UNITS = {"km": 1.0, "m": 1000.0}
+
+
+def node_coordinates(hub_lat, hub_long, buyer_lat, buyer_long):
+    """Returns lat and long arrays with the depot (hub) as node 0 followed by the customers."""
+    lat = np.concatenate(([hub_lat], np.asarray(buyer_lat, dtype=np.float64)))
+    long = np.concatenate(([hub_long], np.asarray(buyer_long, dtype=np.float64)))
+    return lat, long
+
+
+def cast_matrix(values, dtype=np.float64, scale=1):
+    """Casts a float matrix to dtype, scaling and rounding first when dtype is an integer type."""
+    dtype = np.dtype(dtype)
+    if dtype.kind in "iu":
+        return np.rint(values * scale).astype(dtype)
+    return values.astype(dtype, copy=False)
+
+
+def haversine_km(lat_a, long_a, lat_b, long_b):
+    """Great circle distance in KMs between points a and b, elementwise with NumPy broadcasting."""
+    lat_a, long_a, lat_b, long_b = (np.radians(np.asarray(v, dtype=np.float64))
+                                    for v in (lat_a, long_a, lat_b, long_b))
+    a = (np.sin((lat_b - lat_a) * 0.5) ** 2
+         + np.cos(lat_a) * np.cos(lat_b) * np.sin((long_b - long_a) * 0.5) ** 2)
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def haversine_distances(lat_a, long_a, lat_b, long_b):
+    """Great circle distance in KMs between every point of a (rows) and every point of b (columns)."""
+    return haversine_km(np.asarray(lat_a)[:, None], np.asarray(long_a)[:, None],
+                        np.asarray(lat_b)[None, :], np.asarray(long_b)[None, :])
+
+
+def haversine_matrix(lat, long, unit="m", dtype=np.float64, scale=1):
+    """Returns the n x n haversine distance matrix between all the nodes.
+
+    unit is "m" or "km". For an integer dtype the distances are multiplied by scale and
+    rounded, e.g. unit="km", dtype=np.int32, scale=1000 gives whole metres.
+    """
+    if unit not in DISTANCE_UNITS:
+        raise ValueError(f"unknown distance unit {unit!r}, expected one of {sorted(DISTANCE_UNITS)}")
+    distance = haversine_distances(lat, long, lat, long)
+    if unit != "km":
+        distance *= DISTANCE_UNITS[unit]
+    return cast_matrix(distance, dtype, scale)
+
+
+def travel_time_matrix(distance_km, speed, dtype=np.float64, scale=1):
+    """Returns travel times in minutes for a distance matrix in KMs and a speed in km/min.
+
+    speed may be a scalar, giving an n x n matrix, or a sequence of speeds, giving one
+    n x n matrix per speed stacked along the first axis.
+    """
+    distance_km = np.asarray(distance_km, dtype=np.float64)
+    speed = np.asarray(speed, dtype=np.float64)
+    if speed.ndim == 0:
+        minutes = distance_km / speed
+    else:
+        minutes = distance_km[None, :, :] / speed[:, None, None]
+    return cast_matrix(minutes, dtype, scale)
+
+
+def unique_speeds(speeds):
+    """Returns the sorted distinct speeds and, for every entry of speeds, the index of its speed class."""
+    classes, speed_class = np.unique(np.asarray(speeds, dtype=np.float64), return_inverse=True)
+    return classes, speed_class
+
+
+class TiledMatrix:
+    """n x n haversine KMs computed on demand in square tiles, for instances whose dense matrix does not fit.
+
+    Only the tiles on and above the diagonal are computed, the ones below are their
+    transposes, and the least recently used tiles are dropped beyond max_bytes, so memory
+    stays flat however many nodes there are. It stands in for the dense matrix where that
+    is indexed: matrix[a, b] with index arrays gives the KMs of the pairs a, b, broadcast
+    like NumPy indexing and computed directly, which is cheaper than any tile; slices, row,
+    rows and block go through the tiles. np.asarray(matrix) builds the dense matrix for the
+    callers that need one, such as the OR-Tools transits.
+    """
+
+    def __init__(self, lat, long, tile=TILE_SIZE, max_bytes=TILE_CACHE_BYTES):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.long = np.asarray(long, dtype=np.float64)
+        self.n = len(self.lat)
+        self.tile = tile
+        self.max_bytes = max_bytes
+        self.shape = (self.n, self.n)
+        self.ndim = 2
+        self.dtype = np.dtype(np.float64)
+        self.hits = 0
+        self.misses = 0
+        self._tiles = OrderedDict()
+        self._bytes = 0
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, key):
+        a, b = key if isinstance(key, tuple) else (key, slice(None))
+        if isinstance(a, slice) and isinstance(b, slice):
+            return self.block(a, b)
+        if isinstance(a, slice) or isinstance(b, slice):
+            rows = np.arange(self.n)[a] if isinstance(a, slice) else np.asarray(a)
+            columns = np.arange(self.n)[b] if isinstance(b, slice) else np.asarray(b)
+            if rows.ndim == 0 or columns.ndim == 0:
+                return self[rows, columns]
+            return self[rows[:, None], columns[None, :]]
+        a, b = np.asarray(a), np.asarray(b)
+        return haversine_km(self.lat[a], self.long[a], self.lat[b], self.long[b])
+
+    def __array__(self, dtype=None, copy=None):
+        dense = self.block(slice(None), slice(None))
+        return dense if dtype is None else dense.astype(dtype, copy=False)
+
+    def block(self, rows, columns):
+        """KMs from the nodes of the slice rows (rows) to the nodes of the slice columns (columns); steps of 1 only."""
+        r0, r1, step = rows.indices(self.n)
+        c0, c1, column_step = columns.indices(self.n)
+        if step != 1 or column_step != 1:
+            raise ValueError("TiledMatrix blocks take slices with a step of 1")
+        t = self.tile
+        out = np.empty((max(r1 - r0, 0), max(c1 - c0, 0)))
+        for i in range(r0 // t, (r1 - 1) // t + 1 if r1 > r0 else 0):
+            top, bottom = max(r0, i * t), min(r1, (i + 1) * t)
+            for j in range(c0 // t, (c1 - 1) // t + 1 if c1 > c0 else 0):
+                left, right = max(c0, j * t), min(c1, (j + 1) * t)
+                piece = self._tile(i, j) if i <= j else self._tile(j, i).T
+                out[top - r0:bottom - r0, left - c0:right - c0] = piece[top - i * t:bottom - i * t,
+                                                                        left - j * t:right - j * t]
+        return out
+
+    def row(self, i):
+        """KMs from node i to every node, from the cached tiles where there are, computed directly elsewhere.
+
+        A row alone is cheaper to compute than the tiles it crosses, so it caches none.
+        """
+        t = self.tile
+        band = i // t
+        out = np.empty(self.n)
+        for j in range((self.n - 1) // t + 1):
+            key = (band, j) if band <= j else (j, band)
+            columns = slice(j * t, min((j + 1) * t, self.n))
+            if key in self._tiles:
+                self._tiles.move_to_end(key)
+                self.hits += 1
+                tile = self._tiles[key]
+                out[columns] = tile[i - band * t] if band <= j else tile[:, i - band * t]
+            else:
+                out[columns] = haversine_km(self.lat[i], self.long[i], self.lat[columns], self.long[columns])
+        return out
+
+    def rows(self, indices):
+        """KMs from each node of indices to every node, one row each, through the tiles of their bands."""
+        indices = np.asarray(indices, dtype=np.int64)
+        out = np.empty((len(indices), self.n))
+        t = self.tile
+        for band in np.unique(indices // t).tolist():
+            members = np.flatnonzero(indices // t == band)
+            offsets = indices[members] - band * t
+            for j in range((self.n - 1) // t + 1):
+                columns = slice(j * t, min((j + 1) * t, self.n))
+                out[members, columns] = (self._tile(band, j)[offsets] if band <= j
+                                         else self._tile(j, band)[:, offsets].T)
+        return out
+
+    def nearest(self, i, k):
+        """Returns the k nodes closest to node i, closest first, and their KMs."""
+        distance = self.row(i)
+        distance[i] = np.inf
+        k = min(k, self.n - 1)
+        closest = np.argpartition(distance, k)[:k] if k < self.n - 1 else np.flatnonzero(np.isfinite(distance))
+        closest = closest[np.argsort(distance[closest], kind="stable")]
+        return closest, distance[closest]
+
+    def neighbours(self, k):
+        """Returns the n x k nearest other nodes of every node, closest first, and the n x k KMs to them."""
+        closest = nearest_neighbours(self.lat, self.long, k)
+        return closest, self[np.arange(self.n)[:, None], closest]
+
+    def _tile(self, i, j):
+        """Tile i, j (i <= j) of the upper triangle, computed on first use."""
+        tile = self._tiles.get((i, j))
+        if tile is not None:
+            self._tiles.move_to_end((i, j))
+            self.hits += 1
+            return tile
+        self.misses += 1
+        t = self.tile
+        rows, columns = slice(i * t, (i + 1) * t), slice(j * t, (j + 1) * t)
+        tile = haversine_distances(self.lat[rows], self.long[rows], self.lat[columns], self.long[columns])
+        self._tiles[i, j] = tile
+        self._bytes += tile.nbytes
+        while self._bytes > self.max_bytes and len(self._tiles) > 1:
+            _, dropped = self._tiles.popitem(last=False)
+            self._bytes -= dropped.nbytes
+        return tile
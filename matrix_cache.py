@@ -0,0 +1,158 @@
+"""On-disk store of distance matrices keyed by the node coordinates.
+
+Every matrix is kept as a .npy file next to a .coords.npy file holding the (lat, long)
+pairs of its nodes. A warm lookup memory-maps the stored matrix read-only, so nothing is
+copied or recomputed. When the coordinates are new, the stored matrix sharing the most
+nodes is reused and only the rows and columns of the new nodes are computed. The least
+recently used matrices are deleted once the store grows past max_bytes.
+
+A read-only cache never writes to the store, so any number of worker processes can read
+the matrices one writer has stored; coordinates it does not find are computed in memory.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from matrix import DISTANCE_UNITS, haversine_distances, haversine_matrix
+
+MATRIX_CACHE_DIR = os.environ.get("MATRIX_CACHE_DIR", ".matrix_cache")
+INDEX_FILE = "index.json"
+
+
+def coordinates_key(lat, long, unit="km", dtype=np.float64):
+    """Returns the hash of the (lat, long) pairs together with the unit and dtype of the matrix."""
+    coords = np.column_stack((np.asarray(lat, dtype=np.float64), np.asarray(long, dtype=np.float64)))
+    digest = hashlib.sha1(f"{unit}:{np.dtype(dtype).str}:".encode())
+    digest.update(np.ascontiguousarray(coords).tobytes())
+    return digest.hexdigest()
+
+
+class MatrixCache:
+    """Coordinate keyed haversine matrices backed by memory-mapped .npy files."""
+
+    def __init__(self, directory=MATRIX_CACHE_DIR, max_bytes=2 * 1024 ** 3, unit="km", dtype=np.float64,
+                 read_only=False):
+        if unit not in DISTANCE_UNITS:
+            raise ValueError(f"unknown distance unit {unit!r}, expected one of {sorted(DISTANCE_UNITS)}")
+        if np.dtype(dtype).kind != "f":
+            raise ValueError("the matrix cache stores floating point distances only")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.unit = unit
+        self.dtype = np.dtype(dtype)
+        self.read_only = read_only
+        if not read_only:
+            os.makedirs(directory, exist_ok=True)
+        self.index = self._read_index()
+
+    def get(self, lat, long):
+        """Returns the read-only memory-mapped distance matrix for the nodes, building it if needed."""
+        key = coordinates_key(lat, long, self.unit, self.dtype)
+        if self.read_only:
+            try:
+                return np.load(self._path(key), mmap_mode="r")
+            except OSError:
+                return haversine_matrix(lat, long, self.unit, self.dtype)
+        if key not in self.index or not os.path.exists(self._path(key)):
+            self._build(key, lat, long)
+        self.index[key]["last_used"] = time.time()
+        self._write_index()
+        return np.load(self._path(key), mmap_mode="r")
+
+    def total_bytes(self):
+        return sum(entry["bytes"] for entry in self.index.values())
+
+    def _path(self, key, suffix=".npy"):
+        return os.path.join(self.directory, key + suffix)
+
+    def _read_index(self):
+        try:
+            with open(os.path.join(self.directory, INDEX_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self):
+        """Writes the index merged with the one on disk, so the matrices other processes stored are kept."""
+        for key, entry in self._read_index().items():
+            if key not in self.index and os.path.exists(self._path(key)):
+                self.index[key] = entry
+            elif key in self.index:
+                self.index[key]["last_used"] = max(self.index[key]["last_used"], entry["last_used"])
+        path = os.path.join(self.directory, INDEX_FILE)
+        tmp_path = f"{path}.{os.getpid()}.tmp"  # one per process, writers never share a file
+        with open(tmp_path, "w") as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, path)
+
+    def _best_base(self, coords):
+        """Returns the stored key sharing the most nodes with coords and the matching positions."""
+        position = {pair: p for p, pair in enumerate(map(tuple, coords.tolist()))}
+        best_key, best_new, best_old = None, None, None
+        for key in self.index:
+            try:
+                stored = np.load(self._path(key, ".coords.npy"), mmap_mode="r")
+            except OSError:
+                continue
+            old_idx, new_idx = [], []
+            for q, pair in enumerate(map(tuple, stored.tolist())):
+                p = position.get(pair)
+                if p is not None:
+                    old_idx.append(q)
+                    new_idx.append(p)
+            if new_idx and (best_new is None or len(new_idx) > len(best_new)):
+                best_key, best_new, best_old = key, new_idx, old_idx
+        return best_key, best_new, best_old
+
+    def _build(self, key, lat, long):
+        coords = np.column_stack((np.asarray(lat, dtype=np.float64), np.asarray(long, dtype=np.float64)))
+        n = len(coords)
+        scale = DISTANCE_UNITS[self.unit]
+        base_key, new_idx, old_idx = self._best_base(coords)
+
+        tmp_path = self._path(key, f".{os.getpid()}.tmp.npy")
+        matrix = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=self.dtype, shape=(n, n))
+        fresh = np.ones(n, dtype=bool)
+        if base_key is not None:
+            base = np.load(self._path(base_key), mmap_mode="r")
+            new_idx = np.asarray(new_idx)
+            old_idx = np.asarray(old_idx)
+            matrix[np.ix_(new_idx, new_idx)] = base[np.ix_(old_idx, old_idx)]
+            fresh[new_idx] = False
+            del base
+
+        # only the rows and columns of nodes missing from the base matrix are computed
+        rows = np.flatnonzero(fresh)
+        if len(rows):
+            block = haversine_distances(coords[rows, 0], coords[rows, 1], coords[:, 0], coords[:, 1]) * scale
+            matrix[rows, :] = block
+            matrix[:, rows] = block.T
+        matrix.flush()
+        del matrix
+
+        coords_path = self._path(key, f".{os.getpid()}.tmp.coords.npy")
+        np.save(coords_path, coords)
+        os.replace(coords_path, self._path(key, ".coords.npy"))
+        os.replace(tmp_path, self._path(key))
+        self.index[key] = {"n": n,
+                           "bytes": os.path.getsize(self._path(key)) + coords.nbytes,
+                           "last_used": time.time(),
+                           "computed_rows": int(len(rows))}
+        self._evict(keep=key)
+
+    def _evict(self, keep):
+        """Deletes the least recently used matrices until the store fits in max_bytes."""
+        by_age = sorted((k for k in self.index if k != keep), key=lambda k: self.index[k]["last_used"])
+        for key in by_age:
+            if self.total_bytes() <= self.max_bytes:
+                break
+            for suffix in (".npy", ".coords.npy"):
+                try:
+                    os.remove(self._path(key, suffix))
+                except OSError:
+                    pass
+            del self.index[key]
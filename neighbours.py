@@ -0,0 +1,72 @@
+"""Sparse candidate arc graph built from the k nearest neighbours of every node."""
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+DEFAULT_K = 10
+
+
+def unit_vectors(lat, long):
+    """Maps lat/long in degrees onto the unit sphere, where chord length orders pairs like haversine does."""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    long = np.radians(np.asarray(long, dtype=np.float64))
+    return np.column_stack((np.cos(lat) * np.cos(long), np.cos(lat) * np.sin(long), np.sin(lat)))
+
+
+def nearest_neighbours(lat, long, k=DEFAULT_K):
+    """Returns an n x k array with the k nearest other nodes of every node, closest first."""
+    points = unit_vectors(lat, long)
+    k = min(k, len(points) - 1)
+    if k <= 0:
+        return np.empty((len(points), 0), dtype=np.int64)
+    _, idx = cKDTree(points).query(points, k=k + 1)
+    # drop each node itself; with duplicate coordinates it is not always in column 0
+    rows = np.arange(len(points))[:, None]
+    keep = idx != rows
+    keep[keep.sum(axis=1) > k, -1] = False
+    return idx[keep].reshape(len(points), k)
+
+
+def candidate_arcs(lat, long, k=DEFAULT_K, depot=0, symmetric=True):
+    """Returns the sorted (i, j) node index pairs kept in the sparse graph.
+
+    An arc i->j is kept when j is one of the k nearest neighbours of i (or, with symmetric,
+    i is one of the k nearest neighbours of j). All arcs to and from the depot are kept.
+    """
+    n = len(lat)
+    neighbours = nearest_neighbours(lat, long, k)
+    src = np.repeat(np.arange(n), neighbours.shape[1])
+    dst = neighbours.ravel()
+    if symmetric:
+        src, dst = np.concatenate((src, dst)), np.concatenate((dst, src))
+    others = np.delete(np.arange(n), depot)
+    src = np.concatenate((src, np.full(len(others), depot), others))
+    dst = np.concatenate((dst, others, np.full(len(others), depot)))
+    pairs = np.unique(np.column_stack((src, dst)), axis=0)
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    return list(map(tuple, pairs.tolist()))
+
+
+def arc_report(n, arcs):
+    """Counts the arcs of the sparse graph against the complete graph on n nodes."""
+    full = n * (n - 1)
+    kept = len(arcs)
+    return {"nodes": n, "full_arcs": full, "kept_arcs": kept, "pruned_arcs": full - kept,
+            "pruned_share": (full - kept) / full if full else 0.0}
+
+
+def format_arc_report(report):
+    return ("Arcs kept: {kept_arcs} of {full_arcs} ({pruned_arcs} pruned, {share:.1%}) "
+            "over {nodes} nodes".format(share=report["pruned_share"], **report))
+
+
+def limit_local_search(search_parameters, k, num_nodes):
+    """Makes the OR-Tools local search operators consider only the k nearest neighbours of each node.
+
+    OR-Tools ranks neighbours by arc cost, which for these models is the haversine
+    distance (or a constant multiple of it), so the lists match nearest_neighbours. The
+    domains of the NextVars are left untouched: removing arcs outright makes the first
+    solution heuristics fail on instances where capacity is tight.
+    """
+    search_parameters.ls_operator_min_neighbors = k
+    search_parameters.ls_operator_neighbors_ratio = min(1.0, k / max(num_nodes - 1, 1))
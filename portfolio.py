@@ -0,0 +1,167 @@
+"""Parallel multi-start portfolio of OR-Tools routing solves.
+
+Every worker process builds the same routing model and searches it with its own first
+solution strategy, metaheuristic and seed; the seed shuffles the order of the vehicles, which
+changes how construction heuristics and local search break ties. The large read-only
+matrices are written once to .npy files that the workers memory-map, so the operating
+system shares one copy of their pages instead of pickling them into every process. All
+workers stop at a common wall-clock deadline and the ones that overrun it are terminated.
+"""
+
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import tempfile
+import time
+from dataclasses import dataclass
+
+from ortools.constraint_solver import routing_enums_pb2
+from ortools.constraint_solver import pywrapcp
+import numpy as np
+
+from neighbours import limit_local_search
+
+FIRST_SOLUTION_STRATEGIES = (
+    "PATH_CHEAPEST_ARC",
+    "SAVINGS",
+    "PARALLEL_CHEAPEST_INSERTION",
+    "LOCAL_CHEAPEST_INSERTION",
+    "GLOBAL_CHEAPEST_ARC",
+    "CHRISTOFIDES",
+    "PATH_MOST_CONSTRAINED_ARC",
+)
+METAHEURISTICS = ("GUIDED_LOCAL_SEARCH", "SIMULATED_ANNEALING", "TABU_SEARCH")
+GRACE_SECONDS = 2  # time past the deadline a worker gets to report before it is terminated
+
+
+@dataclass(frozen=True)
+class WorkerConfig:
+    """Search settings of one portfolio worker."""
+    first_solution: str
+    metaheuristic: str
+    seed: int = 0
+
+    def __str__(self):
+        return f"{self.first_solution}+{self.metaheuristic} seed {self.seed}"
+
+
+def portfolio_configs(workers=None, seeds=True):
+    """Returns one WorkerConfig per worker, os.cpu_count() workers by default.
+
+    The first config is the single-solve default (PATH_CHEAPEST_ARC with guided local
+    search, seed 0); the others walk every strategy and metaheuristic pair and start over
+    with the next seed once all pairs are taken. Without seeds, for models with no
+    vehicle_keys for a seed to reorder, there are at most as many workers as pairs, since
+    a second seed would repeat the same search.
+    """
+    workers = workers or os.cpu_count()
+    pairs = list(itertools.product(FIRST_SOLUTION_STRATEGIES, METAHEURISTICS))
+    pairs.remove(("PATH_CHEAPEST_ARC", "GUIDED_LOCAL_SEARCH"))
+    pairs.insert(0, ("PATH_CHEAPEST_ARC", "GUIDED_LOCAL_SEARCH"))
+    if not seeds:
+        workers = min(workers, len(pairs))
+    return [WorkerConfig(*pairs[w % len(pairs)], seed=w // len(pairs)) for w in range(workers)]
+
+
+def search_parameters(config, time_limit):
+    """Returns the routing search parameters of a worker config with a time limit in seconds."""
+    parameters = pywrapcp.DefaultRoutingSearchParameters()
+    parameters.first_solution_strategy = getattr(
+        routing_enums_pb2.FirstSolutionStrategy, config.first_solution)
+    parameters.local_search_metaheuristic = getattr(
+        routing_enums_pb2.LocalSearchMetaheuristic, config.metaheuristic)
+    parameters.time_limit.FromMilliseconds(max(int(time_limit * 1000), 1))
+    return parameters
+
+
+def _solve_worker(results, worker, data, build, config, deadline, shared, vehicle_keys):
+    """Process target: solves the model of data with one config and puts its stats on results."""
+    started = time.time()
+    stats = {'worker': worker, 'config': str(config), 'objective': None, 'routes': None}
+    try:
+        data = dict(data, **{key: np.load(path, mmap_mode='r') for key, path in shared.items()})
+        order = np.arange(data['num_vehicles'])
+        if config.seed:
+            order = np.random.default_rng(config.seed).permutation(order)
+            data.update({key: [data[key][v] for v in order] for key in vehicle_keys})
+        manager, routing = build(data)
+        parameters = search_parameters(config, deadline - time.time())
+        limit_local_search(parameters, data['k'], manager.GetNumberOfNodes())
+        solution = routing.SolveWithParameters(parameters)
+        if solution:
+            routes = {}
+            for v in range(data['num_vehicles']):
+                index = solution.Value(routing.NextVar(routing.Start(v)))
+                if routing.IsEnd(index):
+                    continue
+                route = [manager.IndexToNode(routing.Start(v))]
+                while not routing.IsEnd(index):
+                    route.append(manager.IndexToNode(index))
+                    index = solution.Value(routing.NextVar(index))
+                routes[int(order[v])] = route + [manager.IndexToNode(index)]
+            stats.update(status='solved', objective=solution.ObjectiveValue(), routes=routes)
+        else:
+            stats['status'] = 'no solution'
+    except Exception as error:
+        stats['status'] = f'error: {error!r}'
+    stats['seconds'] = time.time() - started
+    results.put(stats)
+
+
+def solve_portfolio(data, build, configs, time_limit, shared_keys=('distance_matrix',),
+                    vehicle_keys=('vehicle_capacities',)):
+    """Solves the model of data with one worker process per config within a global time limit.
+
+    build(data) must be a module level function returning (manager, routing) with the costs
+    and dimensions set up; the entries of data named in shared_keys are memory-mapped by the
+    workers and those in vehicle_keys are lists per vehicle that a seed reorders. Returns the
+    best result (config, objective, routes by vehicle) or None, and a stats dict per worker.
+    """
+    context = mp.get_context()
+    deadline = time.time() + time_limit
+    with tempfile.TemporaryDirectory() as directory:
+        shared = {}
+        for key in shared_keys:
+            shared[key] = os.path.join(directory, f"{key}.npy")
+            np.save(shared[key], np.asarray(data[key]))
+        light = {key: value for key, value in data.items() if key not in shared}
+        results = context.Queue()
+        processes = [context.Process(target=_solve_worker, daemon=True,
+                                     args=(results, w, light, build, config, deadline, shared, vehicle_keys))
+                     for w, config in enumerate(configs)]
+        for process in processes:
+            process.start()
+
+        stats = {}
+        while len(stats) < len(processes):
+            try:
+                worker_stats = results.get(timeout=max(deadline + GRACE_SECONDS - time.time(), 0))
+            except queue.Empty:
+                break
+            stats[worker_stats['worker']] = worker_stats
+        # cancel the workers still running once the budget is spent
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+    stats = [stats.get(w, {'worker': w, 'config': str(config), 'status': 'cancelled', 'objective': None,
+                           'routes': None, 'seconds': time_limit})
+             for w, config in enumerate(configs)]
+    solved = [s for s in stats if s['objective'] is not None]
+    best = min(solved, key=lambda s: s['objective']) if solved else None
+    if best is not None:
+        best = {key: best[key] for key in ('config', 'objective', 'routes')}
+    for s in stats:
+        s.pop('routes')
+    return best, stats
+
+
+def format_worker_stats(stats):
+    """Returns the per-worker stats of solve_portfolio as a printable table."""
+    lines = [f"{'worker':>6}  {'config':<52} {'status':<12} {'objective':>12} {'seconds':>8}"]
+    for s in stats:
+        objective = '' if s['objective'] is None else s['objective']
+        lines.append(f"{s['worker']:>6}  {s['config']:<52} {s['status']:<12} {objective:>12} {s['seconds']:>8.2f}")
+    return "\n".join(lines)
@@ -0,0 +1,158 @@
+"""Time window presolve of the CVRPTW of CVRP_GUROBI.py.
+
+Vehicles leave the depot at time zero and wait when they arrive before E, so no customer
+is started before a vehicle can reach it, and an arc i->j can never be used by a type when
+even the earliest start at i plus the service at i and the type's travel time misses L_j.
+presolve raises the earliest start times, removes the candidate arcs no type can use,
+records the ones only some types can use (also the ones into or out of a customer whose
+demand the type does not accept) and replaces the HORIZON big M of every time window
+constraint by the largest violation the bounds of the start times allow. The MIP builders
+and the OR-Tools models read the results from data.
+"""
+
+import numpy as np
+
+from CVRP_GUROBI import HORIZON
+from matrix import unique_speeds
+from neighbours import arc_report
+from travel_times import arc_minutes
+
+ROUNDS = 10  # propagation rounds of the earliest starts, every round gives valid bounds
+TOLERANCE = 1e-6  # minutes an arc may miss a window by and stay open, for rounding
+
+
+def earliest_starts(minutes, service, earliest, rounds=ROUNDS):
+    """Returns the earliest start of service at every node; node 0 is the depot, left at time 0 or later.
+
+    minutes is the n x n travel time matrix of one speed, service and earliest the service
+    times and the E of every node. The start of a node is the later of its E and the
+    earliest arrival from any other node; with travel times that obey the triangle
+    inequality (haversine KMs) this settles after the first round.
+    """
+    minutes = np.asarray(minutes, dtype=np.float64)
+    leave = np.broadcast_to(np.asarray(service, dtype=np.float64), (len(minutes),))
+    start = np.array(earliest, dtype=np.float64)
+    start[0] = 0.0
+    for _ in range(rounds):
+        arrival = (start + leave)[:, None] + minutes
+        np.fill_diagonal(arrival, np.inf)
+        raised = np.maximum(start, arrival.min(axis=0))
+        raised[0] = 0.0
+        if np.array_equal(raised, start):
+            break
+        start = raised
+    return start
+
+
+def open_arcs(minutes, service, start, latest):
+    """Returns the n x n mask of the arcs that reach the head within its L when leaving the tail at its start.
+
+    Arcs into the depot (node 0) are always open, vehicles need not be back by a deadline.
+    """
+    minutes = np.asarray(minutes, dtype=np.float64)
+    leave = np.broadcast_to(np.asarray(service, dtype=np.float64), (len(minutes),))
+    mask = (start + leave)[:, None] + minutes <= np.asarray(latest, dtype=np.float64)[None, :] + TOLERANCE
+    mask[:, 0] = True
+    np.fill_diagonal(mask, False)
+    return mask
+
+
+def presolve(data):
+    """Tightens the model_data dict data in place; returns a report of what changed.
+
+    data['earliest'] becomes the earliest start over every type, data['open_arcs'] is the
+    n x n mask of node position arcs some type can use, data['closed_arcs'] holds the
+    (i, j, type name) candidate arcs left that the type can not use and data['big_m'] the
+    big M of the time window constraint of every candidate arc into a customer, keyed
+    (i, j, speed class) like data['time']. Arcs added later with add_arcs keep HORIZON.
+    Every vehicle must leave the depot at time zero, data has no 'vehicle_start'.
+    """
+    nodes, depot, types = data['nodes'], data['depot'], data['types']
+    n = len(nodes)
+    speeds, _ = unique_speeds([t.speed for t in types])
+    service = np.array([data['service_time'][i] for i in nodes], dtype=np.float64)
+    earliest = np.array([0.0] + [data['earliest'][c] for c in data['customers']])
+    latest = np.array([np.inf] + [data['latest'][c] for c in data['customers']])
+    demand = np.array([0.0] + [data['demand'][c] for c in data['customers']])
+    everything = np.arange(n)
+
+    # earliest starts and reachable arcs of every speed class, then of every type
+    start, reach = [], []
+    for c in range(len(speeds)):
+        minutes = arc_minutes(data, c, everything[:, None], everything[None, :])
+        start.append(earliest_starts(minutes, service, earliest))
+        reach.append(open_arcs(minutes, service, start[-1], latest))
+    usable = {}
+    for t in types:
+        accepts = (demand >= t.min_demand) & (demand <= t.max_demand)
+        accepts[0] = True
+        usable[t.name] = reach[data['speed_class'][t.name]] & accepts[:, None] & accepts[None, :]
+    mask = np.logical_or.reduce(list(usable.values()))
+    mask[0, :] = True  # the depot arcs stay candidate arcs, closed per type where need be
+    np.fill_diagonal(mask, False)
+    lowest = np.min(start, axis=0)
+
+    report = {'arcs_before': len(data['arcs']), 'type_arcs_before': len(data['arcs']) * len(types),
+              'raised_starts': int((lowest[1:] > earliest[1:] + TOLERANCE).sum())}
+    positions = np.asarray(data['arc_positions'], dtype=np.int64)
+    keep = mask[positions[:, 0], positions[:, 1]].tolist()
+    for (i, j), kept in zip(data['arcs'], keep):
+        if not kept:
+            del data['distance'][i, j]
+            for c in range(len(speeds)):
+                del data['time'][i, j, c]
+    data['arcs'] = [a for a, kept in zip(data['arcs'], keep) if kept]
+    data['arc_positions'] = [p for p, kept in zip(data['arc_positions'], keep) if kept]
+    data['out_arcs'] = {i: [] for i in nodes}
+    data['in_arcs'] = {i: [] for i in nodes}
+    for i, j in data['arcs']:
+        data['out_arcs'][i].append((i, j))
+        data['in_arcs'][j].append((i, j))
+    data['arc_report'] = arc_report(n, data['arcs'])
+    data['earliest'] = {c: float(s) for c, s in zip(data['customers'], lowest[1:].tolist())}
+    data['open_arcs'] = mask
+
+    closed = set()
+    for t in types:
+        closed.update((i, j, t.name) for (i, j), (a, b) in zip(data['arcs'], data['arc_positions'])
+                      if not usable[t.name][a, b])
+    data['closed_arcs'] = closed
+
+    # M of start_i + s_i + t_ij <= start_j + M (1 - x): the largest left-hand side minus the smallest start_j
+    upper = np.array([0.0] + [data['latest'][c] for c in data['customers']])
+    big_m = {}
+    for (i, j), (a, b) in zip(data['arcs'], data['arc_positions']):
+        if j != depot:
+            for c in range(len(speeds)):
+                big_m[i, j, c] = max(0.0, upper[a] + service[a] + data['time'][i, j, c] - lowest[b])
+    data['big_m'] = big_m
+
+    time_rows = [m for (i, j, c), m in big_m.items() for t in types
+                 if data['speed_class'][t.name] == c and (i, j, t.name) not in closed]
+    report.update(arcs_after=len(data['arcs']), type_arcs_after=len(data['arcs']) * len(types) - len(closed),
+                  time_rows_before=sum(j != depot for _, j in positions.tolist()) * len(types),
+                  time_rows_after=int(sum(m > 0 for m in time_rows)),
+                  mean_big_m=float(np.mean(time_rows)) if time_rows else 0.0)
+    return report
+
+
+def format_presolve_report(report):
+    return ("Presolve: {arcs_after} of {arcs_before} arcs, {type_arcs_after} of {type_arcs_before} arc variables "
+            "and {time_rows_after} of {time_rows_before} time window rows left, mean big M {mean_big_m:.1f} "
+            "instead of {horizon}, {raised_starts} earliest starts raised".format(horizon=HORIZON, **report))
+
+
+def remove_closed_arcs(manager, routing, open_arcs, skip=()):
+    """Removes the customer to customer arcs that open_arcs rules out from the NextVars of an OR-Tools model.
+
+    open_arcs is indexed by node; nodes in skip (e.g. the starts of vehicles already on
+    their way) keep all of their arcs.
+    """
+    skip = set(skip)
+    for p in range(1, len(open_arcs)):
+        if p in skip:
+            continue
+        closed = [manager.NodeToIndex(q) for q in np.flatnonzero(~open_arcs[p]).tolist()
+                  if q != p and q != 0 and q not in skip]
+        if closed:
+            routing.NextVar(manager.NodeToIndex(p)).RemoveValues(closed)
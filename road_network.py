@@ -0,0 +1,318 @@
+"""Local road network with contraction hierarchies for bulk many-to-many travel times.
+
+A road network is a directed graph stored as an .npz file (see RoadGraph.save): node
+coordinates and, per edge, its tail and head node, length in KMs, free-flow speed in
+km/min and a road class. Two-way roads are two edges. Time-of-day profiles scale the
+speed of every road class, e.g. {0: 1.0, 1: 0.6} for arterials at 60% speed in the
+evening slot, and a vehicle slower than some roads caps the speed of every edge.
+
+Queries run on a contraction hierarchy of the graph for one profile. Contraction orders
+the nodes by edge difference (lazily updated) and adds the shortcuts that bounded witness
+searches cannot rule out; it runs once per graph, profile and speed cap and is stored next
+to the graph. A many-to-many query then runs an upward search from every source and a backward
+upward search from every target, both with SciPy's Dijkstra on the upward graphs, and
+joins them node by node: every node met by both searches updates the block of
+source x target pairs that meet there, like the buckets of bucket-based many-to-many.
+The KMs of the fastest paths come along, summed up the shortest path trees by pointer
+jumping.
+"""
+
+import hashlib
+import heapq
+import json
+import os
+from dataclasses import dataclass
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+
+from matrix import haversine_km
+
+MIN_WEIGHT = 1e-9  # SciPy drops zero-weight sparse edges, so edges take at least this many minutes
+WITNESS_SETTLED = 60  # nodes a witness search settles at most while contracting
+PRIORITY_SETTLED = 20  # nodes a witness search settles at most while estimating priorities
+QUERY_CHUNK = 64  # sources searched at once; a chunk holds three chunk x nodes arrays
+
+
+@dataclass
+class RoadGraph:
+    """Directed road graph; edge arrays are aligned, speeds in km/min."""
+    lat: np.ndarray
+    long: np.ndarray
+    tail: np.ndarray
+    head: np.ndarray
+    km: np.ndarray
+    speed: np.ndarray
+    road_class: np.ndarray
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as stored:
+            road_class = stored["road_class"] if "road_class" in stored.files else np.zeros(len(stored["tail"]))
+            return cls(stored["lat"], stored["long"], stored["tail"].astype(np.int64),
+                       stored["head"].astype(np.int64), stored["km"], stored["speed"], road_class.astype(np.int64))
+
+    def save(self, path):
+        np.savez(path, lat=self.lat, long=self.long, tail=self.tail, head=self.head, km=self.km, speed=self.speed,
+                 road_class=self.road_class)
+
+    @property
+    def n_nodes(self):
+        return len(self.lat)
+
+    def speeds(self, profile=None, max_speed=None):
+        """Speed of every edge, scaled by the profile factor of its road class and at most max_speed."""
+        factor = np.ones(len(self.km))
+        for road_class, scale in (profile or {}).items():
+            factor[self.road_class == int(road_class)] = scale
+        speed = self.speed * factor
+        return speed if max_speed is None else np.minimum(speed, max_speed)
+
+    def minutes(self, profile=None, max_speed=None):
+        """Travel minutes of every edge at its speed, see speeds."""
+        return np.maximum(self.km / self.speeds(profile, max_speed), MIN_WEIGHT)
+
+    def nearest_nodes(self, lat, long):
+        """Returns the nearest graph node of every point and the KMs to it."""
+        if not hasattr(self, "_tree"):
+            self._scale = np.cos(np.radians(np.mean(self.lat)))
+            self._tree = cKDTree(np.column_stack((self.lat, self.long * self._scale)))
+        lat, long = np.asarray(lat, dtype=np.float64), np.asarray(long, dtype=np.float64)
+        _, node = self._tree.query(np.column_stack((lat, long * self._scale)))
+        return node, haversine_km(lat, long, self.lat[node], self.long[node])
+
+
+def cheapest_edges(tail, head, weight, km):
+    """Keeps the cheapest of parallel edges and drops loops; returns the arrays sorted by (tail, head)."""
+    keep = tail != head
+    tail, head, weight, km = tail[keep], head[keep], weight[keep], km[keep]
+    order = np.lexsort((weight, head, tail))
+    tail, head, weight, km = tail[order], head[order], weight[order], km[order]
+    first = np.ones(len(tail), dtype=bool)
+    first[1:] = (tail[1:] != tail[:-1]) | (head[1:] != head[:-1])
+    return tail[first], head[first], weight[first], km[first]
+
+
+@dataclass
+class Hierarchy:
+    """Contraction hierarchy: node ranks and the upward edges of both search directions."""
+    rank: np.ndarray
+    up_tail: np.ndarray  # forward upward edges, tail -> head with rank[head] > rank[tail]
+    up_head: np.ndarray
+    up_minutes: np.ndarray
+    up_km: np.ndarray
+    down_tail: np.ndarray  # backward upward edges, head -> tail of edges with rank[tail] > rank[head]
+    down_head: np.ndarray
+    down_minutes: np.ndarray
+    down_km: np.ndarray
+
+    def save(self, path):
+        np.savez(path, **{name: getattr(self, name) for name in self.__dataclass_fields__})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as stored:
+            return cls(**{name: stored[name] for name in cls.__dataclass_fields__})
+
+
+def contract(n_nodes, tail, head, minutes, km):
+    """Builds the contraction hierarchy of a graph given as edge arrays."""
+    tail, head, minutes, km = cheapest_edges(np.asarray(tail), np.asarray(head), np.asarray(minutes),
+                                             np.asarray(km))
+    out_edges = [dict() for _ in range(n_nodes)]
+    in_edges = [dict() for _ in range(n_nodes)]
+    for u, v, t, d in zip(tail.tolist(), head.tolist(), minutes.tolist(), km.tolist()):
+        out_edges[u][v] = (t, d)
+        in_edges[v][u] = (t, d)
+    contracted = np.zeros(n_nodes, dtype=bool)
+    deleted_neighbours = np.zeros(n_nodes, dtype=np.int64)
+
+    def witness_distances(source, skip, bound, max_settled):
+        dist = {source: 0.0}
+        heap = [(0.0, source)]
+        settled = 0
+        while heap and settled < max_settled:
+            d, x = heapq.heappop(heap)
+            if d > dist[x]:
+                continue
+            if d > bound:
+                break
+            settled += 1
+            for y, (t, _) in out_edges[x].items():
+                if y == skip or contracted[y]:
+                    continue
+                nd = d + t
+                if nd < dist.get(y, np.inf):
+                    dist[y] = nd
+                    heapq.heappush(heap, (nd, y))
+        return dist
+
+    def shortcuts(v, max_settled):
+        """Shortcuts (u, w, minutes, km) needed when v is contracted."""
+        outgoing = [(w, t, d) for w, (t, d) in out_edges[v].items() if not contracted[w]]
+        needed = []
+        if not outgoing:
+            return needed
+        longest = max(t for _, t, _ in outgoing)
+        for u, (t_uv, d_uv) in in_edges[v].items():
+            if contracted[u]:
+                continue
+            dist = witness_distances(u, v, t_uv + longest, max_settled)
+            for w, t_vw, d_vw in outgoing:
+                if w != u and dist.get(w, np.inf) > t_uv + t_vw:
+                    needed.append((u, w, t_uv + t_vw, d_uv + d_vw))
+        return needed
+
+    def priority(v):
+        degree = (sum(1 for w in out_edges[v] if not contracted[w])
+                  + sum(1 for u in in_edges[v] if not contracted[u]))
+        return len(shortcuts(v, PRIORITY_SETTLED)) - degree + deleted_neighbours[v]
+
+    heap = [(priority(v), v) for v in range(n_nodes)]
+    heapq.heapify(heap)
+    rank = np.empty(n_nodes, dtype=np.int64)
+    up, down = [], []
+    order = 0
+    while heap:
+        _, v = heapq.heappop(heap)
+        if contracted[v]:
+            continue
+        current = priority(v)
+        if heap and current > heap[0][0]:
+            heapq.heappush(heap, (current, v))
+            continue
+        for u, w, t, d in shortcuts(v, WITNESS_SETTLED):
+            if t < out_edges[u].get(w, (np.inf, 0.0))[0]:
+                out_edges[u][w] = (t, d)
+                in_edges[w][u] = (t, d)
+        up.extend((v, w, t, d) for w, (t, d) in out_edges[v].items() if not contracted[w])
+        down.extend((v, u, t, d) for u, (t, d) in in_edges[v].items() if not contracted[u])
+        contracted[v] = True
+        rank[v] = order
+        order += 1
+        for x in list(out_edges[v]) + list(in_edges[v]):
+            deleted_neighbours[x] += 1
+
+    def arrays(edges):
+        if not edges:
+            return (np.empty(0, dtype=np.int64),) * 2 + (np.empty(0),) * 2
+        a, b, t, d = zip(*edges)
+        return np.array(a, dtype=np.int64), np.array(b, dtype=np.int64), np.array(t), np.array(d)
+
+    return Hierarchy(rank, *arrays(up), *arrays(down))
+
+
+def search_trees(n_nodes, tail, head, minutes, km, sources):
+    """Dijkstra from every source over the edges; returns (source, node, minutes, km) arrays of the nodes reached."""
+    tail, head, minutes, km = cheapest_edges(tail, head, minutes, km)
+    graph = csr_matrix((minutes, (tail, head)), shape=(n_nodes, n_nodes))
+    key = tail * n_nodes + head  # sorted, since cheapest_edges sorts by (tail, head)
+    found = ([], [], [], [])
+    for start in range(0, len(sources), QUERY_CHUNK):
+        chunk = np.asarray(sources[start:start + QUERY_CHUNK])
+        dist, pred = dijkstra(graph, indices=chunk, return_predecessors=True)
+        s, v = np.nonzero(np.isfinite(dist))
+        # KMs of the tree edge into every reached node, then summed to the root by pointer jumping
+        entry = np.full(dist.shape, -1, dtype=np.int64)
+        entry[s, v] = np.arange(len(s))
+        parent = pred[s, v]
+        has_parent = parent >= 0
+        parent = np.where(has_parent, entry[s, np.maximum(parent, 0)], -1)
+        acc = np.zeros(len(s))
+        acc[has_parent] = km[np.searchsorted(key, pred[s, v][has_parent] * n_nodes + v[has_parent])]
+        while has_parent.any():
+            up = np.maximum(parent, 0)
+            acc = acc + np.where(has_parent, acc[up], 0.0)
+            parent = np.where(has_parent, parent[up], -1)
+            has_parent = parent >= 0
+        found[0].append(s + start)
+        found[1].append(v)
+        found[2].append(dist[s, v])
+        found[3].append(acc)
+    return tuple(np.concatenate(parts) for parts in found)
+
+
+def join_searches(forward, backward, n_sources, n_targets):
+    """Joins forward and backward searches on the nodes they meet; returns source x target minutes and KMs.
+
+    Targets go in blocks: the backward searches of a block are spread into a nodes x targets
+    array, and every source takes the minimum over its forward search space in one step.
+    """
+    minutes = np.full((n_sources, n_targets), np.inf)
+    km = np.full((n_sources, n_targets), np.inf)
+    f_order = np.argsort(forward[0], kind="stable")
+    f_start = np.searchsorted(forward[0][f_order], np.arange(n_sources + 1))
+    for first in range(0, n_targets, QUERY_CHUNK * 4):
+        width = min(QUERY_CHUNK * 4, n_targets - first)
+        block = (backward[0] >= first) & (backward[0] < first + width)
+        nodes, row = np.unique(backward[1][block], return_inverse=True)
+        # one spare row of inf for forward nodes no backward search of the block reached
+        b_minutes = np.full((len(nodes) + 1, width), np.inf)
+        b_km = np.zeros((len(nodes) + 1, width))
+        b_minutes[row, backward[0][block] - first] = backward[2][block]
+        b_km[row, backward[0][block] - first] = backward[3][block]
+        f_row = np.minimum(np.searchsorted(nodes, forward[1]), len(nodes))
+        f_row[nodes[np.minimum(f_row, len(nodes) - 1)] != forward[1]] = len(nodes)
+        columns = np.arange(width)
+        for s in range(n_sources):
+            e = f_order[f_start[s]:f_start[s + 1]]
+            via = forward[2][e][:, None] + b_minutes[f_row[e]]
+            best = via.argmin(axis=0)
+            minutes[s, first:first + width] = via[best, columns]
+            km[s, first:first + width] = forward[3][e][best] + b_km[f_row[e][best], columns]
+    km[np.isinf(minutes)] = np.inf
+    return minutes, km
+
+
+def hierarchy_many_to_many(hierarchy, n_nodes, sources, targets):
+    """Minutes and KMs of the fastest paths from every source node to every target node."""
+    sources, targets = np.asarray(sources), np.asarray(targets)
+    unique_sources, source_of = np.unique(sources, return_inverse=True)
+    unique_targets, target_of = np.unique(targets, return_inverse=True)
+    forward = search_trees(n_nodes, hierarchy.up_tail, hierarchy.up_head, hierarchy.up_minutes, hierarchy.up_km,
+                           unique_sources)
+    backward = search_trees(n_nodes, hierarchy.down_tail, hierarchy.down_head, hierarchy.down_minutes,
+                            hierarchy.down_km, unique_targets)
+    minutes, km = join_searches(forward, backward, len(unique_sources), len(unique_targets))
+    return minutes[np.ix_(source_of, target_of)], km[np.ix_(source_of, target_of)]
+
+
+def dijkstra_many_to_many(graph, profile, sources, targets, max_speed=None):
+    """Same as hierarchy_many_to_many with plain Dijkstra on the whole graph, to check it on small graphs."""
+    sources, targets = np.asarray(sources), np.asarray(targets)
+    s, v, t, d = search_trees(graph.n_nodes, graph.tail, graph.head, graph.minutes(profile, max_speed), graph.km,
+                              sources)
+    minutes = np.full((len(sources), graph.n_nodes), np.inf)
+    km = np.full((len(sources), graph.n_nodes), np.inf)
+    minutes[s, v], km[s, v] = t, d
+    return minutes[:, targets], km[:, targets]
+
+
+def hierarchy_path(graph_path, profile, max_speed=None):
+    """Where the hierarchy of a graph file, profile and speed cap is stored, keyed by all three."""
+    stat = os.stat(graph_path)
+    cap = [] if max_speed is None else [float(max_speed)]  # uncapped hierarchies keep their earlier keys
+    key = hashlib.sha1(json.dumps([os.path.abspath(graph_path), stat.st_size, stat.st_mtime_ns,
+                                   sorted((str(c), float(f)) for c, f in (profile or {}).items())] + cap).encode())
+    return f"{os.path.splitext(graph_path)[0]}.ch-{key.hexdigest()[:16]}.npz"
+
+
+def load_hierarchy(graph, graph_path, profile=None, max_speed=None):
+    """Returns the hierarchy of the graph for a profile, contracting and storing it the first time.
+
+    max_speed caps the speed of every edge, for a vehicle slower than some of the roads.
+    """
+    if max_speed is not None and max_speed >= graph.speeds(profile).max():
+        max_speed = None  # no road is faster than the vehicle, the cap changes nothing
+    path = hierarchy_path(graph_path, profile, max_speed)
+    try:
+        return Hierarchy.load(path)
+    except OSError:
+        pass
+    hierarchy = contract(graph.n_nodes, graph.tail, graph.head, graph.minutes(profile, max_speed), graph.km)
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    hierarchy.save(tmp_path)
+    os.replace(tmp_path, path)
+    return hierarchy
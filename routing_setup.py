@@ -0,0 +1,33 @@
+"""Native transit registration for the OR-Tools routing models.
+
+Transits registered from Python closures make the solver call back into the interpreter
+(and IndexToNode twice) for every arc it evaluates. The helpers here hand the whole matrix
+or vector to OR-Tools once, so search runs without touching Python.
+"""
+
+import numpy as np
+
+DEMAND_SCALE = 100  # demands and capacities are passed to OR-Tools in units of 0.01 kg
+
+
+def as_int_rows(matrix):
+    """Returns the matrix as a list of lists of Python ints, the form OR-Tools accepts."""
+    matrix = np.asarray(matrix)
+    if matrix.dtype.kind == "f":
+        matrix = np.rint(matrix)
+    return matrix.astype(np.int64).tolist()
+
+
+def register_matrix_transit(routing, matrix):
+    """Registers a node x node transit matrix and returns its transit evaluator index."""
+    return routing.RegisterTransitMatrix(as_int_rows(matrix))
+
+
+def register_vector_transit(routing, vector):
+    """Registers a per-node unary transit vector and returns its transit evaluator index."""
+    return routing.RegisterUnaryTransitVector(as_int_rows(vector))
+
+
+def scale_demands(values, scale=DEMAND_SCALE):
+    """Converts weights in kg to the integer units used by the capacity dimension."""
+    return np.rint(np.asarray(values, dtype=np.float64) * scale).astype(np.int64).tolist()
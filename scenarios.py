@@ -0,0 +1,189 @@
+"""What-if sweeps over fleet compositions, solved in parallel over matrices in shared memory.
+
+A scenario grid varies the vehicle types of an instance: the number of vehicles of a type
+(count) or any of its Vehicle_Data.csv parameters (the VehicleType attributes, e.g.
+capacity or free_km). Every combination of the values given is one scenario, and the
+unchanged fleet is solved first as the base:
+
+    python scenarios.py Customer_Data.csv --vehicles Vehicle_Data.csv --vary bolero.count=2,4,6 \
+        --vary tata.capacity=800,1000 --vary ape.free_km=40,60 --workers 8 --time-limit 5
+
+The instance is built once with model_data. Its distance matrix, and the travel-time
+matrices of a provider when it has them, are copied once into multiprocessing.shared_memory
+blocks that the worker processes attach to without copying. Every worker solves its
+scenarios with the OR-Tools CVRPTW of cvrptw_routing.py on the fleet of the scenario; the
+plans are scored by evaluator.py into one row per scenario with its cost, vehicles used,
+KMs and unserved customers; a scenario is feasible when its plan is and serves everyone.
+"""
+
+import argparse
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import replace
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from batch import hub_of, VEHICLE_FILE
+from CVRP_GUROBI import model_data
+from cvrptw_routing import solve_routing
+from evaluator import evaluate_plans, Instance
+from fleet import assign_vehicles, VEHICLE_COLUMNS, vehicle_types
+from matrix import unique_speeds
+from matrix_cache import MatrixCache
+from neighbours import DEFAULT_K
+
+SHARED_KEYS = ('distance_km', 'travel_minutes')
+INTEGER_ATTRIBUTES = ('count', 'max_customers')
+
+_worker = {}  # the instance a worker process solves, set up by _attach
+
+
+def parse_variation(text):
+    """Parses "type.attribute=v1,v2,..." into (type name, attribute, values)."""
+    try:
+        target, values = text.split("=", 1)
+        name, attribute = target.rsplit(".", 1)
+    except ValueError:
+        raise ValueError(f"expected type.attribute=v1,v2,... but got {text!r}") from None
+    if attribute != "count" and attribute not in VEHICLE_COLUMNS:
+        raise ValueError(f"unknown vehicle attribute {attribute!r}, expected count or one of {list(VEHICLE_COLUMNS)}")
+    cast = int if attribute in INTEGER_ATTRIBUTES else float
+    return name, attribute, [cast(value) for value in values.split(",")]
+
+
+def scenario_grid(variations):
+    """Returns every combination of (type name, attribute, values) variations as a dict {(type, attribute): value}."""
+    keys = [(name, attribute) for name, attribute, _ in variations]
+    return [dict(zip(keys, values)) for values in itertools.product(*(values for _, _, values in variations))]
+
+
+def scenario_name(changes):
+    return " ".join(f"{name}.{attribute}={value}" for (name, attribute), value in changes.items()) or "base"
+
+
+def fleet_variant(types, changes):
+    """Returns a copy of types with the changes {(type name, attribute): value} applied.
+
+    A count below the number of vehicles keeps the first vehicle IDs, one above it adds
+    vehicles named <type>_new_<number>.
+    """
+    names = {t.name for t in types}
+    unknown = sorted({name for name, _ in changes} - names)
+    if unknown:
+        raise ValueError(f"unknown vehicle types {unknown}, the fleet has {sorted(names)}")
+    variant = []
+    for t in types:
+        params = {attribute: value for (name, attribute), value in changes.items() if name == t.name}
+        count = params.pop('count', t.count)
+        ids = t.vehicle_ids[:count] + [f"{t.name}_new_{k}" for k in range(1, count - t.count + 1)]
+        variant.append(replace(t, vehicle_ids=ids, **params))
+    return variant
+
+
+@contextmanager
+def shared_arrays(arrays):
+    """Copies arrays {key: array} into shared memory blocks; yields {key: (block name, shape, dtype)}."""
+    blocks, specs = [], {}
+    try:
+        for key, array in arrays.items():
+            array = np.asarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            blocks.append(block)
+            np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+            specs[key] = (block.name, array.shape, array.dtype.str)
+        yield specs
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+def _attach(data, specs):
+    """Worker initializer: the instance data with its matrices mapped onto the shared memory blocks."""
+    blocks = {}
+    for key, (name, shape, dtype) in specs.items():
+        blocks[key] = shared_memory.SharedMemory(name=name)  # unlinked by the parent once the sweep ends
+        array = np.ndarray(shape, dtype, buffer=blocks[key].buf)
+        array.flags.writeable = False
+        data[key] = array
+    _worker.update(data=data, blocks=blocks)
+
+
+def solve_scenario(changes, time_limit=1):
+    """Solves the instance of this worker with the fleet changed by changes; returns the scenario's row."""
+    data = _worker['data']
+    types = fleet_variant(data['types'], changes)
+    speeds, speed_class = unique_speeds([t.speed for t in types])
+    if data.get('travel_minutes') is not None and len(speeds) != len(data['travel_minutes']):
+        raise ValueError("the travel times of a provider are fixed per speed class, speeds can not vary")
+    data = dict(data, types=types, speed_class={t.name: int(c) for t, c in zip(types, speed_class)})
+    row = {'scenario': scenario_name(changes), 'vehicles': sum(t.count for t in types)}
+    routes_by_type, dropped = solve_routing(data, time_limit)
+    if routes_by_type is None:
+        row['status'] = 'no solution'
+        return row
+    _, _, totals = evaluate_plans(Instance.from_data(data), [assign_vehicles(routes_by_type, types)])
+    row.update(status='solved', cost=float(totals["cost"][0]), vehicles_used=int(totals["routes"][0]),
+               km=float(totals["km"][0]), unserved=len(dropped),
+               feasible=bool(totals["feasible"][0]) and not dropped)  # a plan that drops customers serves too few
+    return row
+
+
+def run_sweep(data, scenarios, workers=None, time_limit=1):
+    """Solves every scenario (changes to the fleet of data) in a pool of workers; returns their rows in order."""
+    shared = {key: data[key] for key in SHARED_KEYS if data.get(key) is not None}
+    light = {key: value for key, value in data.items() if key not in shared}
+    with shared_arrays(shared) as specs:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_attach,
+                                 initargs=(light, specs)) as executor:
+            return list(executor.map(solve_scenario, scenarios, itertools.repeat(time_limit)))
+
+
+def format_sweep(rows):
+    """Returns the rows of run_sweep as a printable table."""
+    width = max(len("scenario"), *(len(row['scenario']) for row in rows))
+    lines = [f"{'scenario':<{width}} {'vehicles':>8} {'used':>5} {'cost':>11} {'km':>9} {'unserved':>8} "
+             f"{'feasible':>8}"]
+    for row in rows:
+        if row['status'] != 'solved':
+            lines.append(f"{row['scenario']:<{width}} {row['vehicles']:>8} {row['status']:>5}")
+            continue
+        lines.append(f"{row['scenario']:<{width}} {row['vehicles']:>8} {row['vehicles_used']:>5} {row['cost']:>11.2f} "
+                     f"{row['km']:>9.2f} {row['unserved']:>8} {'yes' if row['feasible'] else 'no':>8}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("customers", help="Customer_Data.csv of the instance")
+    parser.add_argument("--vehicles", default=VEHICLE_FILE, help="Vehicle_Data.csv of the base fleet")
+    parser.add_argument("--vary", action="append", default=[], metavar="TYPE.ATTRIBUTE=V1,V2",
+                        help="values of a vehicle type attribute (count, capacity, free_km, ...), repeatable")
+    parser.add_argument("--workers", type=int, default=None, help="scenarios solved at the same time")
+    parser.add_argument("--time-limit", type=float, default=1, help="seconds per scenario")
+    parser.add_argument("--k", type=int, default=DEFAULT_K, help="nearest neighbours per node")
+    parser.add_argument("--output", default=None, help="CSV file of the table")
+    args = parser.parse_args()
+
+    types = vehicle_types(pd.read_csv(args.vehicles))
+    try:
+        variations = [parse_variation(text) for text in args.vary]
+        scenarios = [{}] + (scenario_grid(variations) if variations else [])
+        for changes in scenarios:
+            fleet_variant(types, changes)  # unknown types fail here, before any worker starts
+    except ValueError as error:
+        parser.error(str(error))
+    customer_data = pd.read_csv(args.customers)
+    data = model_data(customer_data, types, args.k, MatrixCache(), *hub_of(customer_data))
+    rows = run_sweep(data, scenarios, args.workers, args.time_limit)
+    print(format_sweep(rows))
+    if args.output:
+        pd.DataFrame(rows).to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""On-disk store of solved plans keyed by instance fingerprints, reused as warm starts across days.
+
+A plan is stored under the fingerprint of its instance: the nodes with their demand,
+service time and time window, the fleet (every vehicle type with its count) and the solve
+parameters. An exact repeat is served from the store without solving. Otherwise the plan
+of the same fleet sharing the most customer locations is adapted: stops whose location is
+gone are dropped, routes that broke are cut back to their feasible prefix, and the new
+customers are inserted where they add the least cost. The result seeds the OR-Tools
+search of cvrptw_routing.py; a customer that fits nowhere is left to the search.
+
+Every plan keeps how its solve started (cold or warm, and from which plan), the seconds
+it took and the seconds it took to come within TARGET_GAP of its final objective, so the
+time to target quality of warm starts compares with the one of cold starts (summary).
+There is no shared index: plans are JSON files, one directory per fleet, replaced
+atomically and with their modification time as the last use, so worker processes can read
+and write the same store. The least recently used plans are deleted beyond max_plans.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from cvrptw_routing import solve_routing
+from evaluator import Instance, evaluate_routes
+from fleet import VEHICLE_COLUMNS
+from instrumentation import Trace
+
+SOLUTION_STORE_DIR = os.environ.get("SOLUTION_STORE_DIR", ".solution_store")
+MAX_PLANS = 1000
+TARGET_GAP = 0.01  # a solve reached its target quality within 1% of its final objective
+
+
+def fleet_key(types):
+    """Returns the hash of a fleet: the parameters and the number of vehicles of every type."""
+    fleet = [[t.name, t.count] + [getattr(t, attribute) for attribute in VEHICLE_COLUMNS] for t in types]
+    return hashlib.sha1(json.dumps(fleet, default=str).encode()).hexdigest()
+
+
+def instance_key(data, params=None):
+    """Returns the hash of a model_data instance: its nodes with demand, service time and window, fleet and params."""
+    customers = data['customers']
+    columns = np.column_stack((np.asarray(data['lat'], dtype=np.float64), np.asarray(data['long'], dtype=np.float64),
+                               [0.0] + [data['demand'][c] for c in customers],
+                               [data['service_time'][i] for i in data['nodes']],
+                               [0.0] + [data['earliest'][c] for c in customers],
+                               [0.0] + [data['latest'][c] for c in customers]))
+    digest = hashlib.sha1(f"{fleet_key(data['types'])}:{json.dumps(params or {}, sort_keys=True)}:".encode())
+    digest.update(np.ascontiguousarray(columns, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def time_to_target(trajectory, target=None):
+    """Seconds of the first (seconds, objective) of trajectory at or below target, None if none is.
+
+    The target defaults to the final objective plus TARGET_GAP.
+    """
+    if not trajectory:
+        return None
+    if target is None:
+        target = trajectory[-1][1] * (1 + TARGET_GAP)
+    return next((seconds for seconds, objective in trajectory if objective <= target), None)
+
+
+class SolutionStore:
+    """Plans of solved instances as JSON files, one directory per fleet."""
+
+    def __init__(self, directory=SOLUTION_STORE_DIR, max_plans=MAX_PLANS):
+        self.directory = directory
+        self.max_plans = max_plans
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, fleet, key):
+        """Returns the stored plan of the instance key solved with fleet, or None; counts the hit."""
+        plan = self._read(self._path(fleet, key))
+        if plan is not None:
+            plan['hits'] += 1
+            self._write(fleet, plan)
+        return plan
+
+    def nearest(self, fleet, lat, long):
+        """Returns the plan of the same fleet and depot sharing the most customer locations with lat/long, or None."""
+        locations = {}
+        for pair in zip(lat[1:], long[1:]):
+            locations[pair] = locations.get(pair, 0) + 1
+        best, best_shared = None, 0
+        try:
+            names = os.listdir(os.path.join(self.directory, fleet))
+        except OSError:
+            return None
+        for name in names:
+            plan = self._read(os.path.join(self.directory, fleet, name)) if name.endswith(".json") else None
+            if plan is None or (plan['lat'][0], plan['long'][0]) != (lat[0], long[0]):
+                continue
+            stored = {}
+            for pair in zip(plan['lat'][1:], plan['long'][1:]):
+                stored[pair] = stored.get(pair, 0) + 1
+            shared = sum(min(count, stored.get(pair, 0)) for pair, count in locations.items())
+            if shared > best_shared:
+                best, best_shared = plan, shared
+        return best
+
+    def put(self, fleet, key, lat, long, routes, dropped, stats):
+        """Stores the plan of instance key: routes by type name and dropped customers as node positions.
+
+        lat/long are the node coordinates, depot first; stats are kept with the plan.
+        """
+        plan = dict(stats, key=key, lat=list(lat), long=list(long), routes=routes, dropped=list(dropped), hits=0)
+        self._write(fleet, plan)
+        self._evict()
+
+    def plans(self):
+        """Yields every stored plan."""
+        for fleet in os.listdir(self.directory):
+            folder = os.path.join(self.directory, fleet)
+            if os.path.isdir(folder):
+                for name in os.listdir(folder):
+                    plan = self._read(os.path.join(folder, name)) if name.endswith(".json") else None
+                    if plan is not None:
+                        yield plan
+
+    def summary(self):
+        """Returns the plans, cache hits and mean seconds and seconds to target of the cold and warm solves."""
+        stats = {'plans': 0, 'hits': 0}
+        seconds = {'cold': ([], []), 'warm': ([], [])}
+        for plan in self.plans():
+            stats['plans'] += 1
+            stats['hits'] += plan['hits']
+            total, to_target = seconds[plan['start']]
+            total.append(plan['seconds'])
+            if plan['seconds_to_target'] is not None:
+                to_target.append(plan['seconds_to_target'])
+        for start, (total, to_target) in seconds.items():
+            stats[start] = {'solves': len(total), 'seconds': float(np.mean(total)) if total else None,
+                            'seconds_to_target': float(np.mean(to_target)) if to_target else None}
+        return stats
+
+    def _path(self, fleet, key):
+        return os.path.join(self.directory, fleet, key + ".json")
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, fleet, plan):
+        path = self._path(fleet, plan['key'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.{os.getpid()}.tmp", "w") as f:
+            json.dump(plan, f)
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+    def _evict(self):
+        """Deletes the least recently used plans until at most max_plans are left."""
+        paths = []
+        for fleet in os.listdir(self.directory):
+            folder = os.path.join(self.directory, fleet)
+            if os.path.isdir(folder):
+                paths.extend(os.path.join(folder, name) for name in os.listdir(folder) if name.endswith(".json"))
+        if len(paths) <= self.max_plans:
+            return
+        used = {}
+        for path in paths:
+            try:
+                used[path] = os.path.getmtime(path)
+            except OSError:
+                continue
+        for path in sorted(used, key=used.get)[:len(used) - self.max_plans]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def adapt_plan(plan, lat, long):
+    """Maps the routes of a stored plan onto the nodes at lat/long; returns (routes by type name, unplaced customers).
+
+    Routes and customers are node positions; a stop whose location is gone is dropped and
+    every customer no stop maps onto is left unplaced.
+    """
+    free = {}
+    for p, pair in enumerate(zip(lat[1:], long[1:]), start=1):
+        free.setdefault(pair, []).append(p)
+    routes = {}
+    for name, stored in plan['routes'].items():
+        for route in stored:
+            kept = [free[pair].pop(0) for pair in ((plan['lat'][q], plan['long'][q]) for q in route[1:-1])
+                    if free.get(pair)]
+            if kept:
+                routes.setdefault(name, []).append([0] + kept + [0])
+    placed = {p for rs in routes.values() for route in rs for p in route}
+    return routes, [p for p in range(1, len(lat)) if p not in placed]
+
+
+def repair_routes(instance, routes):
+    """Cuts every infeasible route of routes (by type name, node positions) back to its longest feasible prefix.
+
+    Routes are changed in place; returns the customers cut off.
+    """
+    type_index = {t.name: p for p, t in enumerate(instance.types)}
+    prefixes, owner = [], []
+    for name, rs in routes.items():
+        for r, route in enumerate(rs):
+            for k in range(1, len(route) - 1):
+                prefixes.append(route[:k + 1] + [0])
+                owner.append((name, r, k))
+    if not prefixes:
+        return []
+    nodes = np.concatenate(prefixes)
+    offsets = np.concatenate(([0], np.cumsum([len(p) for p in prefixes])))
+    result, _ = evaluate_routes(instance, nodes, offsets, [type_index[name] for name, _, _ in owner])
+    longest = {}
+    for (name, r, k), feasible in zip(owner, result["feasible"].tolist()):
+        if feasible and k == longest.get((name, r), 0) + 1:
+            longest[name, r] = k
+    cut = []
+    for name, rs in routes.items():
+        for r, route in enumerate(rs):
+            k = longest.get((name, r), 0)
+            cut.extend(route[k + 1:-1])
+            rs[r] = route[:k + 1] + [0]
+        routes[name] = [route for route in rs if len(route) > 2]
+    return cut
+
+
+def insert_customers(instance, routes, customers):
+    """Inserts customers, heaviest first, where they add the least cost and every route stays feasible.
+
+    routes (by type name, node positions) are changed in place, and a customer may open a
+    route of a type with a vehicle to spare. Returns the customers that fit nowhere.
+    """
+    type_index = {t.name: p for p, t in enumerate(instance.types)}
+    left = []
+    for c in sorted(customers, key=lambda c: -instance.demand[c]):
+        candidates, where = [], []
+        for name, rs in routes.items():
+            for r, route in enumerate(rs):
+                candidates.append(route)
+                where.append((name, r, None))
+                for g in range(1, len(route)):
+                    candidates.append(route[:g] + [c] + route[g:])
+                    where.append((name, r, g))
+        for t in instance.types:
+            if len(routes.get(t.name, [])) < t.count:
+                candidates.append([0, c, 0])
+                where.append((t.name, None, 1))
+        nodes = np.concatenate(candidates)
+        offsets = np.concatenate(([0], np.cumsum([len(route) for route in candidates])))
+        result, _ = evaluate_routes(instance, nodes, offsets, [type_index[name] for name, _, _ in where])
+        current = {(name, r): cost for (name, r, g), cost in zip(where, result["cost"].tolist()) if g is None}
+        best = None
+        for (name, r, g), cost, feasible in zip(where, result["cost"].tolist(), result["feasible"].tolist()):
+            if g is not None and feasible:
+                added = cost - current.get((name, r), 0.0)
+                if best is None or added < best[0]:
+                    best = (added, name, r, g)
+        if best is None:
+            left.append(c)
+            continue
+        _, name, r, g = best
+        if r is None:
+            routes.setdefault(name, []).append([0, c, 0])
+        else:
+            routes[name][r].insert(g, c)
+    return left
+
+
+def solve_with_store(data, store, time_limit=1, params=None, trace=None):
+    """Solves a model_data instance with cvrptw_routing.solve_routing, seeded from store.
+
+    Returns (routes by type name, dropped customers, info) like solve_routing plus a dict:
+    'start' is 'cache' for an exact repeat served without solving, 'warm' when the nearest
+    stored plan seeded the search and 'cold' without one, 'base' the key of that plan. The
+    plan and info of every solve are stored. params are the solve parameters that make
+    up the fingerprint together with the instance, e.g. the time limit. The solutions are
+    traced to trace, an in-memory Trace when None, from before the lookup of the nearest
+    plan, so the seconds to target of a warm start include adapting it.
+    """
+    started = time.perf_counter()
+    nodes = data['nodes']
+    fleet, key = fleet_key(data['types']), instance_key(data, params)
+    lat, long = np.asarray(data['lat'], dtype=np.float64).tolist(), np.asarray(data['long'], dtype=np.float64).tolist()
+    plan = store.get(fleet, key)
+    if plan is not None:
+        routes_by_type = {name: [[nodes[p] for p in route] for route in rs] for name, rs in plan['routes'].items()}
+        return (routes_by_type, [nodes[p] for p in plan['dropped']],
+                {'start': 'cache', 'base': key, 'seconds': time.perf_counter() - started})
+
+    trace = Trace() if trace is None else trace
+    info = {'start': 'cold', 'base': None, 'shared': 0.0, 'inserted': 0}
+    initial = None
+    base = store.nearest(fleet, lat, long)
+    if base is not None:
+        instance = Instance.from_data(data)
+        routes, unplaced = adapt_plan(base, lat, long)
+        info['shared'] = 1.0 - len(unplaced) / max(len(nodes) - 1, 1)
+        unplaced += repair_routes(instance, routes)
+        left = insert_customers(instance, routes, unplaced)
+        info.update(start='warm', base=base['key'], inserted=len(unplaced) - len(left))
+        initial = {name: [[nodes[p] for p in route] for route in rs] for name, rs in routes.items()}
+
+    routes_by_type, dropped = solve_routing(data, time_limit, initial, trace)
+    trajectory = trace.trajectory()
+    info.update(seconds=time.perf_counter() - started, objective=trajectory[-1][1] if trajectory else None,
+                seconds_to_target=time_to_target(trajectory))
+    if routes_by_type is not None:
+        position = {i: p for p, i in enumerate(nodes)}
+        store.put(fleet, key, lat, long,
+                  {name: [[position[i] for i in route] for route in rs] for name, rs in routes_by_type.items()},
+                  [position[i] for i in dropped], info)
+    return routes_by_type, dropped, info
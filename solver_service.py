@@ -0,0 +1,409 @@
+"""Local solver service that keeps instances, matrices and worker processes warm between requests.
+
+    python solver_service.py --port 8765 --workers 4
+
+The service answers JSON over HTTP on localhost:
+
+    POST /instances/<name>  {"customers": csv, "vehicles": csv, "rows": n, "k": k}
+    POST /solve             {"instance": name, "budget": seconds, "presize": false}
+    POST /resolve           {"instance": name, "budget": seconds, "routes": {...}, "states": {...},
+                             "new_customers": [row, ...], "now": minutes}
+    POST /evaluate          {"instance": name, "budget": seconds, "plans": [{vehicle ID: route}, ...]}
+    GET  /stats
+
+An instance is loaded once through instance_data.py and its matrix stored in the matrix
+cache; every worker process builds the model data of an instance on its first request and
+keeps it for the later ones. Requests wait in one queue until a worker is free. The budget
+of a request covers its time in the queue: the rest, less OVERHEAD_SECONDS, is the time
+limit of the search, and a request whose budget runs out in the queue is answered with an
+error without solving.
+/stats reports latency percentiles per request kind.
+
+solve, resolve and evaluate are the same operations as plain functions for use in
+process; SolverClient talks to a running service and LocalClient to a SolverService in
+the same process, with the same methods.
+"""
+
+import argparse
+import json
+import queue
+import threading
+import time
+import traceback
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import error as urlerror, request as urlrequest
+
+import numpy as np
+
+from CVRP_GUROBI import HUB_LAT, HUB_LONG, model_data
+from cvrptw_routing import solve_routing
+from evaluator import Instance, evaluate_plans
+from fleet import assign_vehicles, vehicle_types
+from fleet_sizing import dropped_customers, solve_presized
+from incremental import VehicleState, reoptimize
+from instance_data import head, load_customers, load_vehicles
+from matrix import node_coordinates
+from matrix_cache import MATRIX_CACHE_DIR, MatrixCache
+from neighbours import DEFAULT_K
+
+DEFAULT_PORT = 8765
+KINDS = ("solve", "resolve", "evaluate")
+MIN_TIME_LIMIT = 0.05  # seconds of search a request needs left after the queue to be solved
+OVERHEAD_SECONDS = 0.1  # part of the budget kept for building the routing model and scoring the plan
+LATENCY_WINDOW = 10000  # latencies kept per request kind for the percentiles
+PERCENTILES = (50, 90, 99)
+
+
+@dataclass(frozen=True)
+class InstanceSpec:
+    """Where an instance comes from; frozen so that worker processes can key their loaded instances by it."""
+    customers: str
+    vehicles: str
+    rows: int = None  # first customer rows used, all when None
+    k: int = DEFAULT_K
+    hub_lat: float = HUB_LAT
+    hub_long: float = HUB_LONG
+
+
+_loaded = {}  # InstanceSpec: (customer columns, vehicle types, model data), per process
+
+
+def load_instance(spec, cache_dir=MATRIX_CACHE_DIR, read_only=True):
+    """Returns the customer columns, vehicle types and model data of an instance, loading them once per process."""
+    if spec not in _loaded:
+        customers = load_customers(spec.customers)
+        if spec.rows is not None:
+            customers = head(customers, spec.rows)
+        types = vehicle_types(load_vehicles(spec.vehicles))
+        cache = MatrixCache(cache_dir, read_only=read_only)
+        _loaded[spec] = customers, types, model_data(customers, types, spec.k, cache, spec.hub_lat, spec.hub_long)
+    return _loaded[spec]
+
+
+def plan_summary(instance, routes):
+    _, _, totals = evaluate_plans(instance, [routes])
+    return {'cost': float(totals['cost'][0]), 'km': float(totals['km'][0]), 'feasible': bool(totals['feasible'][0])}
+
+
+def solve(spec, time_limit=1, presize=False, cache_dir=MATRIX_CACHE_DIR):
+    """Solves an instance with the OR-Tools CVRPTW; returns routes by vehicle ID, dropped customers, cost and KMs."""
+    _, types, data = load_instance(spec, cache_dir)
+    if presize:
+        (routes_by_type, dropped), _, _ = solve_presized(data, lambda sized: solve_routing(sized, time_limit),
+                                                         dropped_customers)
+    else:
+        routes_by_type, dropped = solve_routing(data, time_limit)
+    if routes_by_type is None:
+        return {'status': 'no solution'}
+    routes = assign_vehicles(routes_by_type, types)
+    return dict(status='solved', routes=routes, dropped=dropped, **plan_summary(Instance.from_data(data), routes))
+
+
+def resolve(spec, routes, states, new_customers, now, time_limit=0.5, cache_dir=MATRIX_CACHE_DIR):
+    """Inserts new customers into a running plan with incremental.reoptimize.
+
+    states maps vehicle IDs to VehicleState fields and new_customers is a list of
+    Customer_Data.csv rows as dicts.
+    """
+    import pandas as pd
+
+    customers, types, _ = load_instance(spec, cache_dir)
+    customer_data = pd.DataFrame(customers)
+    new_customers = pd.DataFrame(new_customers, columns=list(customers))
+    plan, dropped, _ = reoptimize(customer_data, types, routes, {v: VehicleState(**s) for v, s in states.items()},
+                                  new_customers, now, time_limit, spec.k, MatrixCache(cache_dir, read_only=True),
+                                  spec.hub_lat, spec.hub_long)
+    instance = Instance.from_frame(pd.concat([customer_data, new_customers], ignore_index=True), types,
+                                   spec.hub_lat, spec.hub_long)
+    return dict(status='solved', routes=plan, dropped=dropped, **plan_summary(instance, plan))
+
+
+def evaluate(spec, plans, cache_dir=MATRIX_CACHE_DIR):
+    """Scores plans of an instance; returns the totals of every plan."""
+    _, _, data = load_instance(spec, cache_dir)
+    _, _, totals = evaluate_plans(Instance.from_data(data), plans)
+    return {'status': 'evaluated', 'plans': [dict(zip(totals.dtype.names, row)) for row in totals.tolist()]}
+
+
+def run_job(kind, spec, arguments, time_limit, cache_dir):
+    """Runs one request in a worker process; returns its result with the seconds the worker spent."""
+    started = time.perf_counter()
+    if kind == "solve":
+        result = solve(spec, time_limit, arguments.get('presize', False), cache_dir)
+    elif kind == "resolve":
+        result = resolve(spec, arguments['routes'], arguments['states'], arguments['new_customers'],
+                         arguments['now'], time_limit, cache_dir)
+    else:
+        result = evaluate(spec, arguments['plans'], cache_dir)
+    result['worker_seconds'] = time.perf_counter() - started
+    return result
+
+
+def warm_up():
+    """Runs once in every worker so that the pool is started before the first request."""
+    return True
+
+
+@dataclass
+class Job:
+    kind: str
+    instance: str
+    arguments: dict
+    budget: float
+    received: float = field(default_factory=time.perf_counter)
+    started: float = None
+    result: dict = None
+    done: threading.Event = field(default_factory=threading.Event)
+
+    @property
+    def deadline(self):
+        return self.received + self.budget
+
+
+def percentiles(values):
+    if not values:
+        return {f"p{p}": None for p in PERCENTILES}
+    return {f"p{p}": float(v) for p, v in zip(PERCENTILES, np.percentile(np.asarray(values), PERCENTILES))}
+
+
+class SolverService:
+    """Request queue in front of a pool of warm worker processes."""
+
+    def __init__(self, workers=1, cache_dir=MATRIX_CACHE_DIR):
+        self.workers = workers
+        self.cache_dir = cache_dir
+        self.cache = MatrixCache(cache_dir)
+        self.instances = {}
+        self.jobs = queue.Queue()
+        self.free = threading.Semaphore(workers)
+        self.latency = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+        self.waiting = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+        self.errors = defaultdict(int)
+        self.lock = threading.Lock()
+        self.executor = self._start_pool()
+        threading.Thread(target=self._dispatch, daemon=True).start()
+
+    def _start_pool(self):
+        executor = ProcessPoolExecutor(max_workers=self.workers)
+        for future in [executor.submit(warm_up) for _ in range(self.workers)]:
+            future.result()
+        return executor
+
+    def _restart(self, broken):
+        """Replaces the pool once a worker died, however many of the jobs in it saw it break."""
+        with self.lock:
+            if self.executor is not broken:
+                return
+            broken.shutdown(wait=False, cancel_futures=True)
+            self.executor = self._start_pool()
+
+    def add_instance(self, name, spec):
+        """Registers an instance under a name.
+
+        Its columns and matrix are stored once here, for the workers to read from the caches.
+        """
+        load_vehicles(spec.vehicles)
+        customers = load_customers(spec.customers)
+        if spec.rows is not None:
+            customers = head(customers, spec.rows)
+        self.cache.get(*node_coordinates(spec.hub_lat, spec.hub_long, customers["buyer_lat"], customers["buyer_long"]))
+        self.instances[name] = spec
+        return {'instance': name, 'customers': len(customers["customer_no"]), 'spec': asdict(spec)}
+
+    def request(self, kind, instance, budget, **arguments):
+        """Queues a request and waits for its result."""
+        if kind not in KINDS:
+            raise ValueError(f"unknown request {kind!r}, expected one of {KINDS}")
+        if instance not in self.instances:
+            raise KeyError(f"unknown instance {instance!r}")
+        job = Job(kind, instance, arguments, budget)
+        self.jobs.put(job)
+        job.done.wait()
+        return job.result
+
+    def _dispatch(self):
+        while True:
+            job = self.jobs.get()
+            self.free.acquire()
+            job.started = time.perf_counter()
+            time_limit = job.deadline - job.started - OVERHEAD_SECONDS
+            if time_limit < MIN_TIME_LIMIT and job.kind != "evaluate":
+                self.free.release()
+                self._finish(job, {'status': 'expired',
+                                   'error': f"time budget of {job.budget} s spent in the queue"})
+                continue
+            executor = self.executor
+            try:
+                future = executor.submit(run_job, job.kind, self.instances[job.instance], job.arguments,
+                                         time_limit, self.cache_dir)
+            except Exception as error:
+                self.free.release()
+                self._finish(job, {'status': 'error', 'error': traceback.format_exc(limit=3)})
+                if isinstance(error, BrokenProcessPool):
+                    self._restart(executor)
+                continue
+            future.add_done_callback(lambda future, job=job, executor=executor: self._done(job, future, executor))
+
+    def _done(self, job, future, executor):
+        try:
+            result = future.result()
+        except BrokenProcessPool:
+            result = {'status': 'error', 'error': traceback.format_exc(limit=3)}
+            self._restart(executor)
+        except Exception:
+            result = {'status': 'error', 'error': traceback.format_exc(limit=3)}
+        self.free.release()
+        self._finish(job, result)
+
+    def _finish(self, job, result):
+        finished = time.perf_counter()
+        result['queue_seconds'] = job.started - job.received
+        result['seconds'] = finished - job.received
+        with self.lock:
+            self.latency[job.kind].append(result['seconds'])
+            self.waiting[job.kind].append(result['queue_seconds'])
+            if result['status'] in ('error', 'expired'):
+                self.errors[job.kind] += 1
+        job.result = result
+        job.done.set()
+
+    def stats(self):
+        """Returns the request count, errors and latency and queue wait percentiles of every request kind."""
+        with self.lock:
+            return {'workers': self.workers, 'queued': self.jobs.qsize(), 'instances': sorted(self.instances),
+                    'requests': {kind: {'count': len(self.latency[kind]), 'errors': self.errors[kind],
+                                        'latency': percentiles(self.latency[kind]),
+                                        'queue': percentiles(self.waiting[kind])}
+                                 for kind in KINDS if self.latency[kind]}}
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+
+def to_json(value):
+    return json.dumps(value, default=lambda v: v.item()).encode()
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    service = None  # set by serve
+
+    def _reply(self, status, value):
+        body = to_json(value)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._reply(200, self.service.stats())
+        else:
+            self._reply(404, {'error': f"unknown path {self.path}"})
+
+    def do_POST(self):
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path.startswith("/instances/"):
+                self._reply(200, self.service.add_instance(self.path[len("/instances/"):], InstanceSpec(**payload)))
+                return
+            kind = self.path.strip("/")
+            instance, budget = payload.pop('instance'), float(payload.pop('budget', 1))
+            self._reply(200, self.service.request(kind, instance, budget, **payload))
+        except (KeyError, OSError, TypeError, ValueError) as error:
+            self._reply(400, {'status': 'error', 'error': f"{type(error).__name__}: {error}"})
+        except Exception as error:
+            self._reply(500, {'status': 'error', 'error': f"{type(error).__name__}: {error}"})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(service, port=DEFAULT_PORT, host="127.0.0.1"):
+    """Returns an HTTP server for the service; call serve_forever on it, e.g. in a thread."""
+    handler = type("ServiceHandler", (RequestHandler,), {'service': service})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+class Client:
+    """Methods of the service clients; subclasses implement _call."""
+
+    def load(self, name, customers, vehicles, rows=None, k=DEFAULT_K):
+        return self._call(f"instances/{name}", {'customers': customers, 'vehicles': vehicles, 'rows': rows, 'k': k})
+
+    def solve(self, instance, budget=1, presize=False):
+        return self._call("solve", {'instance': instance, 'budget': budget, 'presize': presize})
+
+    def resolve(self, instance, routes, states, new_customers, now, budget=0.5):
+        return self._call("resolve", {'instance': instance, 'budget': budget, 'routes': routes, 'states': states,
+                                      'new_customers': new_customers, 'now': now})
+
+    def evaluate(self, instance, plans, budget=1):
+        return self._call("evaluate", {'instance': instance, 'budget': budget, 'plans': plans})
+
+    def stats(self):
+        return self._call("stats")
+
+
+class SolverClient(Client):
+    """Client of a service running at url."""
+
+    def __init__(self, url=f"http://127.0.0.1:{DEFAULT_PORT}", timeout=None):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _call(self, path, payload=None):
+        data = None if payload is None else to_json(payload)
+        req = urlrequest.Request(f"{self.url}/{path}", data=data, headers={"Content-Type": "application/json"})
+        try:
+            with urlrequest.urlopen(req, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urlerror.HTTPError as error:
+            return json.loads(error.read())
+
+
+class LocalClient(Client):
+    """Stub client calling a SolverService in the same process, without HTTP.
+
+    Payloads go through JSON both ways, so it sees what a SolverClient would.
+    """
+
+    def __init__(self, service):
+        self.service = service
+
+    def _call(self, path, payload=None):
+        payload = json.loads(to_json(payload)) if payload is not None else None
+        if path == "stats":
+            result = self.service.stats()
+        elif path.startswith("instances/"):
+            result = self.service.add_instance(path[len("instances/"):], InstanceSpec(**payload))
+        else:
+            result = self.service.request(path, payload.pop('instance'), payload.pop('budget'), **payload)
+        return json.loads(to_json(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=1, help="worker processes solving requests")
+    parser.add_argument("--cache-dir", default=MATRIX_CACHE_DIR)
+    args = parser.parse_args()
+
+    service = SolverService(args.workers, args.cache_dir)
+    server = serve(service, args.port)
+    print(f"solver service on http://127.0.0.1:{args.port} with {args.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
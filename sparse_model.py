@@ -0,0 +1,332 @@
+"""Assembles the type indexed CVRPTW of CVRP_GUROBI.build_model directly as CSR arrays.
+
+PuLP creates one Python object per variable and copies expressions on every +=, which
+dominates build time once the model has a few hundred thousand arcs. Here every variable
+family is a contiguous block of integer column indices, every constraint family is built
+with NumPy as COO triplets, and the result is a scipy.sparse CSR matrix with row and
+column bound vectors that is handed to HiGHS as is.
+"""
+
+import gzip
+from dataclasses import dataclass
+
+import numpy as np
+from scipy import sparse
+
+from CVRP_GUROBI import HORIZON, routes_from_arcs
+from instrumentation import watch_highs
+from travel_times import arc_minutes
+
+
+@dataclass
+class SparseModel:
+    """min cost @ x  s.t.  row_lower <= A @ x <= row_upper,  col_lower <= x <= col_upper."""
+    cost: np.ndarray
+    A: sparse.csr_matrix
+    row_lower: np.ndarray
+    row_upper: np.ndarray
+    col_lower: np.ndarray
+    col_upper: np.ndarray
+    integrality: np.ndarray  # True for integer (binary or general integer) columns
+    offsets: dict  # first column of every variable family, see column()
+    shape: dict  # shape of every variable family
+
+    def column(self, family, *index):
+        """Returns the column of family[index], e.g. column('x', t, a) for type t on arc position a."""
+        return self.offsets[family] + int(np.ravel_multi_index(index, self.shape[family]))
+
+    def block(self, values, family):
+        """Returns the slice of a solution vector holding family, reshaped to its shape."""
+        size = int(np.prod(self.shape[family]))
+        return values[self.offsets[family]:self.offsets[family] + size].reshape(self.shape[family])
+
+
+class _Rows:
+    """Collects constraint rows as COO triplets."""
+
+    def __init__(self):
+        self.rows, self.cols, self.vals = [], [], []
+        self.lower, self.upper = [], []
+        self.count = 0
+
+    def add(self, nrows, row, col, val, lower, upper):
+        """Adds nrows rows; row holds local row numbers 0..nrows-1 of every (col, val) term."""
+        row, col = np.asarray(row), np.asarray(col)
+        self.rows.append(row + self.count)
+        self.cols.append(col)
+        self.vals.append(np.broadcast_to(np.asarray(val, dtype=np.float64), row.shape))
+        self.lower.append(np.broadcast_to(np.asarray(lower, dtype=np.float64), (nrows,)))
+        self.upper.append(np.broadcast_to(np.asarray(upper, dtype=np.float64), (nrows,)))
+        self.count += nrows
+
+
+def build_sparse_model(data):
+    """Builds the same formulation as CVRP_GUROBI.build_model as a SparseModel."""
+    types = data['types']
+    n_types = len(types)
+    nodes = data['nodes']
+    n_customers = len(nodes) - 1
+    arc_pos = np.asarray(data['arc_positions'], dtype=np.int64)
+    arc_i, arc_j = arc_pos[:, 0], arc_pos[:, 1]
+    n_arcs = len(arc_pos)
+    dist = data['distance_km'][arc_i, arc_j]
+    speed_class = np.array([data['speed_class'][t.name] for t in types])
+    travel = arc_minutes(data, speed_class[:, None], arc_i[None, :], arc_j[None, :])  # of every arc for every type
+
+    demand = np.array([data['demand'][c] for c in data['customers']], dtype=np.float64)
+    service = np.array([data['service_time'][i] for i in nodes], dtype=np.float64)
+    earliest = np.array([data['earliest'][c] for c in data['customers']], dtype=np.float64)
+    latest = np.array([data['latest'][c] for c in data['customers']], dtype=np.float64)
+    capacity = np.array([t.capacity for t in types], dtype=np.float64)
+    max_km = max(t.max_km for t in types)
+    big_km = max_km + dist.max()
+    big_customers = n_customers
+    # arcs a type can never use and big Ms of the time windows from presolve.py, all open with HORIZON without it
+    usable = np.ones((n_types, n_arcs), dtype=bool)
+    big_time = np.full((n_types, n_arcs), float(HORIZON))
+    if data.get('closed_arcs'):
+        usable[:] = [[(i, j, t.name) not in data['closed_arcs'] for i, j in data['arcs']] for t in types]
+    if data.get('big_m'):
+        big_time[:] = [[data['big_m'].get((i, j, c), HORIZON) for i, j in data['arcs']] for c in speed_class.tolist()]
+
+    # column layout, one contiguous block per variable family
+    shape = {'x': (n_types, n_arcs), 'f': (n_types, n_arcs), 'extra_kms': (n_types, n_customers),
+             'd': (n_customers,), 'u': (n_types,), 'y': (n_types, n_customers),
+             'st': (n_customers,), 'c': (n_customers,)}
+    offsets, n_cols = {}, 0
+    for family, dims in shape.items():
+        offsets[family] = n_cols
+        n_cols += int(np.prod(dims))
+
+    def cols(family, *index):
+        return offsets[family] + np.ravel_multi_index(np.broadcast_arrays(*index), shape[family])
+
+    col_lower = np.zeros(n_cols)
+    col_upper = np.full(n_cols, np.inf)
+    integrality = np.zeros(n_cols, dtype=bool)
+    cost = np.zeros(n_cols)
+
+    t_idx = np.arange(n_types)[:, None]
+    a_idx = np.arange(n_arcs)[None, :]
+    c_idx = np.arange(n_customers)
+
+    x_cols = cols('x', t_idx, a_idx)
+    col_upper[x_cols] = usable
+    col_upper[cols('f', t_idx, a_idx)[~usable]] = 0
+    integrality[x_cols] = True
+    y_cols = cols('y', t_idx, c_idx[None, :])
+    col_upper[y_cols] = 1
+    integrality[y_cols] = True
+    # constraint-7 as bounds: a type may only visit customers whose demand it accepts
+    min_demand = np.array([t.min_demand for t in types])[:, None]
+    max_demand = np.array([t.max_demand for t in types])[:, None]
+    col_upper[y_cols[(demand[None, :] < min_demand) | (demand[None, :] > max_demand)]] = 0
+    u_cols = cols('u', np.arange(n_types))
+    col_upper[u_cols] = [t.count for t in types]
+    integrality[u_cols] = True
+    col_upper[cols('d', c_idx)] = max_km
+    col_lower[cols('st', c_idx)] = earliest
+    col_upper[cols('st', c_idx)] = latest
+    col_lower[cols('c', c_idx)] = 1
+    col_upper[cols('c', c_idx)] = big_customers
+
+    # objective function: fixed cost of every vehicle used plus variable cost of the extra kms
+    cost[u_cols] = [t.fixed_cost for t in types]
+    cost[cols('extra_kms', t_idx, c_idx[None, :])] = np.array([t.variable_cost for t in types])[:, None]
+
+    rows = _Rows()
+    into_customer = np.flatnonzero(arc_j != 0)
+    to_depot = np.flatnonzero(arc_j == 0)
+    last = arc_i[to_depot] - 1  # customer index returning to the depot on each of these arcs
+
+    # constraint-1, 8: distance and customer count labels along every arc into a customer
+    for family, step, big in (('d', dist[into_customer], big_km), ('c', np.ones(len(into_customer)), big_customers)):
+        r = np.arange(len(into_customer))
+        rf = np.flatnonzero(arc_i[into_customer] != 0)
+        tt, aa = np.tile(np.arange(n_types), len(r)), np.repeat(into_customer, n_types)
+        used = usable[tt, aa]
+        row = np.concatenate((r, rf, np.repeat(r, n_types)[used]))
+        col = np.concatenate((cols(family, arc_j[into_customer] - 1), cols(family, arc_i[into_customer][rf] - 1),
+                              cols('x', tt[used], aa[used])))
+        val = np.concatenate((np.ones(len(r)), -np.ones(len(rf)), np.full(used.sum(), -big)))
+        rows.add(len(r), row, col, val, step - big, np.inf)
+
+    # constraint-1: extra kms on the arc back to the depot; constraint-8, 12: per type limits on that arc
+    tt = np.repeat(np.arange(n_types), len(to_depot))
+    aa = np.tile(to_depot, n_types)
+    ll = np.tile(last, n_types)
+    used = usable[tt, aa]
+    tt, aa, ll = tt[used], aa[used], ll[used]
+    r = np.arange(len(aa))
+    free_km = np.array([t.free_km for t in types])[tt]
+    rows.add(len(r), np.concatenate((r, r, r)),
+             np.concatenate((cols('extra_kms', tt, ll), cols('d', ll), cols('x', tt, aa))),
+             np.concatenate((np.ones(len(r)), -np.ones(len(r)), np.full(len(r), -big_km))),
+             dist[aa] - free_km - big_km, np.inf)
+    max_customers = np.array([t.max_customers for t in types])[tt]
+    rows.add(len(r), np.concatenate((r, r)), np.concatenate((cols('c', ll), cols('x', tt, aa))),
+             np.concatenate((np.ones(len(r)), np.full(len(r), big_customers))),
+             -np.inf, max_customers + big_customers)
+    type_max_km = np.array([t.max_km for t in types])[tt]
+    rows.add(len(r), np.concatenate((r, r)), np.concatenate((cols('d', ll), cols('x', tt, aa))),
+             np.concatenate((np.ones(len(r)), np.full(len(r), big_km))),
+             -np.inf, type_max_km + big_km - dist[aa])
+
+    # constraint-2: vehicles of type t in use = routes of type t leaving the depot
+    from_depot = np.flatnonzero(arc_i == 0)
+    tt = np.repeat(np.arange(n_types), len(from_depot))
+    aa = np.tile(from_depot, n_types)
+    used = usable[tt, aa]
+    rows.add(n_types, np.concatenate((np.arange(n_types), tt[used])), np.concatenate((u_cols, cols('x', tt, aa)[used])),
+             np.concatenate((np.ones(n_types), -np.ones(used.sum()))), 0, 0)
+
+    # constraint-3: each customer is visited exactly once
+    rows.add(n_customers, np.tile(c_idx, n_types), y_cols.ravel(), 1, 1, 1)
+
+    # constraint-4: flow balancing per type at every node, depot included
+    n_nodes = n_customers + 1
+    tt = np.repeat(np.arange(n_types), n_arcs)
+    aa = np.tile(np.arange(n_arcs), n_types)
+    used = usable[tt, aa]
+    tt, aa = tt[used], aa[used]
+    x_all = cols('x', tt, aa)
+    rows.add(n_types * n_nodes, np.concatenate((tt * n_nodes + arc_j[aa], tt * n_nodes + arc_i[aa])),
+             np.concatenate((x_all, x_all)), np.concatenate((np.ones(len(aa)), -np.ones(len(aa)))), 0, 0)
+
+    # constraint-5, 6: a customer visited by type t is left and entered once by that type
+    for end in (arc_i, arc_j):
+        keep = end[aa] != 0
+        row = tt[keep] * n_customers + end[aa][keep] - 1
+        rows.add(n_types * n_customers, np.concatenate((row, np.arange(n_types * n_customers))),
+                 np.concatenate((x_all[keep], y_cols.ravel())),
+                 np.concatenate((np.ones(keep.sum()), -np.ones(n_types * n_customers))), 0, 0)
+
+    # constraint-9: demand satisfaction
+    f_all = cols('f', tt, aa)
+    into = arc_j[aa] != 0
+    out = arc_i[aa] != 0
+    rows.add(n_customers, np.concatenate((arc_j[aa][into] - 1, arc_i[aa][out] - 1)),
+             np.concatenate((f_all[into], f_all[out])),
+             np.concatenate((np.ones(into.sum()), -np.ones(out.sum()))), demand, demand)
+
+    # constraint-10: flow only on traversed arcs, up to the capacity of the type
+    r = np.arange(len(aa))
+    rows.add(len(r), np.concatenate((r, r)), np.concatenate((f_all, x_all)),
+             np.concatenate((np.ones(len(r)), -capacity[tt])), -np.inf, 0)
+
+    # constraint-11: time windows, travel time depends on the speed of the type; without a big M left the
+    # bounds of the start times imply the constraint
+    tt = np.repeat(np.arange(n_types), len(into_customer))
+    aa = np.tile(into_customer, n_types)
+    used = usable[tt, aa] & (big_time[tt, aa] > 0)
+    tt, aa = tt[used], aa[used]
+    big = big_time[tt, aa]
+    r = np.arange(len(aa))
+    rf = np.flatnonzero(arc_i[aa] != 0)
+    rows.add(len(r), np.concatenate((r, rf, r)),
+             np.concatenate((cols('st', arc_j[aa] - 1), cols('st', arc_i[aa][rf] - 1), cols('x', tt, aa))),
+             np.concatenate((-np.ones(len(r)), np.ones(len(rf)), big)),
+             -np.inf, big - service[arc_i[aa]] - travel[tt, aa])
+
+    A = sparse.csr_matrix((np.concatenate(rows.vals), (np.concatenate(rows.rows), np.concatenate(rows.cols))),
+                          shape=(rows.count, n_cols))
+    A.sum_duplicates()
+    return SparseModel(cost, A, np.concatenate(rows.lower), np.concatenate(rows.upper),
+                       col_lower, col_upper, integrality, offsets, shape)
+
+
+def solve_highs(model, time_limit=None, mip_gap=None, msg=False, start=None, trace=None, monitor=None):
+    """Solves the model with HiGHS; returns (status string, objective, column values or None).
+
+    start is an optional vector of column values passed to HiGHS as a MIP start. Every
+    improving solution is recorded in trace (an instrumentation.Trace) when one is given, and
+    goes to monitor (an anytime.ConvergenceMonitor) as a copy of its column values, which
+    may stop the solve.
+    """
+    import highspy
+
+    h = highspy.Highs()
+    h.setOptionValue("output_flag", msg)
+    if time_limit is not None:
+        h.setOptionValue("time_limit", float(time_limit))
+    if mip_gap is not None:
+        h.setOptionValue("mip_rel_gap", float(mip_gap))
+    lp = highspy.HighsLp()
+    lp.num_col_, lp.num_row_ = model.A.shape[1], model.A.shape[0]
+    lp.col_cost_ = model.cost
+    lp.col_lower_ = model.col_lower
+    lp.col_upper_ = model.col_upper
+    lp.row_lower_ = model.row_lower
+    lp.row_upper_ = model.row_upper
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kRowwise
+    lp.a_matrix_.start_ = model.A.indptr
+    lp.a_matrix_.index_ = model.A.indices
+    lp.a_matrix_.value_ = model.A.data
+    lp.integrality_ = [highspy.HighsVarType.kInteger if i else highspy.HighsVarType.kContinuous
+                       for i in model.integrality]
+    h.passModel(lp)
+    if start is not None:
+        solution = highspy.HighsSolution()
+        solution.col_value = np.asarray(start, dtype=np.float64)
+        solution.value_valid = True
+        h.setSolution(solution)
+    if trace is not None:
+        watch_highs(trace, h)
+    if monitor is not None:
+        monitor.watch_highs(h, np.array)
+    h.run()
+    status = h.modelStatusToString(h.getModelStatus())
+    if h.getInfo().primal_solution_status == 0:
+        return status, None, None
+    values = np.asarray(h.getSolution().col_value)
+    return status, float(model.cost @ values), values
+
+
+def extract_routes(data, model, values):
+    """Returns the routes of a solution vector keyed by concrete vehicle ID."""
+    x = model.block(values, 'x')
+    nodes = data['nodes']
+    used = [(nodes[data['arc_positions'][a][0]], nodes[data['arc_positions'][a][1]], data['types'][t].name)
+            for t, a in zip(*np.nonzero(x > 0.5))]
+    return routes_from_arcs(data, used)
+
+
+def write_mps(model, path):
+    """Writes the model in free MPS format, gzip compressed when path ends in .gz."""
+    opener = gzip.open if str(path).endswith(".gz") else open
+    A = model.A.tocsc()
+    lower, upper = model.row_lower, model.row_upper
+    kinds = np.where(lower == upper, "E", np.where(np.isinf(lower), "L", "G"))
+    rhs = np.where(kinds == "L", upper, lower)
+    ranged = (kinds == "G") & np.isfinite(upper)
+    with opener(path, "wt") as f:
+        f.write("NAME CVRPTW\nROWS\n N obj\n")
+        f.writelines(f" {k} r{r}\n" for r, k in enumerate(kinds))
+        f.write("COLUMNS\n")
+        integer = False
+        for c in range(A.shape[1]):
+            if model.integrality[c] != integer:
+                integer = bool(model.integrality[c])
+                f.write(" MARKER 'MARKER' {}\n".format("'INTORG'" if integer else "'INTEND'"))
+            if model.cost[c]:
+                f.write(f" c{c} obj {float(model.cost[c])!r}\n")
+            lo, hi = A.indptr[c], A.indptr[c + 1]
+            f.writelines(f" c{c} r{r} {v!r}\n" for r, v in zip(A.indices[lo:hi].tolist(), A.data[lo:hi].tolist()))
+        if integer:
+            f.write(" MARKER 'MARKER' 'INTEND'\n")
+        f.write("RHS\n")
+        f.writelines(f" rhs r{r} {v!r}\n" for r, v in enumerate(rhs.tolist()) if v)
+        if ranged.any():
+            f.write("RANGES\n")
+            f.writelines(f" rng r{r} {float(upper[r] - lower[r])!r}\n" for r in np.flatnonzero(ranged).tolist())
+        f.write("BOUNDS\n")
+        for c in range(A.shape[1]):
+            lo, hi = float(model.col_lower[c]), float(model.col_upper[c])
+            if model.integrality[c] and lo == 0 and hi == 1:
+                f.write(f" BV bnd c{c}\n")
+                continue
+            if lo != 0:
+                f.write(f" LO bnd c{c} {lo!r}\n" if np.isfinite(lo) else f" MI bnd c{c}\n")
+            if np.isfinite(hi):
+                f.write(f" UP bnd c{c} {hi!r}\n")
+        f.write("ENDATA\n")
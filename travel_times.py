@@ -0,0 +1,128 @@
+"""Travel-time providers behind the distance and travel-time matrices of the models.
+
+A provider turns the node coordinates of an instance into an n x n distance matrix in KMs
+and, for the distinct vehicle speeds (speed classes), travel-time matrices in minutes:
+
+- HaversineProvider: great circle KMs at the speed of the vehicle, what the models have
+  always used and what model_data uses when it gets no provider.
+- RoadNetworkProvider: fastest paths over a local road network file (road_network.py),
+  computed in bulk on its contraction hierarchies. A vehicle drives no faster than the
+  road or than its own speed, and covers the KMs between a node and its nearest road node
+  at its own speed. Speed profiles can make the roads slower in some delivery slots: the
+  time of an arc comes from the profile of the slot of the node it enters.
+
+model_data stores the travel-time matrices of the other providers as data['travel_minutes'];
+haversine travel times are KMs / speed, computed from the KMs when they are needed. Every
+model reads arc times through arc_minutes.
+"""
+
+import json
+
+import numpy as np
+
+from instance_data import slot_minutes
+from matrix import DENSE_NODES, haversine_matrix, TiledMatrix, travel_time_matrix, unique_speeds
+from road_network import RoadGraph, hierarchy_many_to_many, load_hierarchy
+
+
+class HaversineProvider:
+    """Great circle KMs, travelled at the speed of the vehicle.
+
+    The KMs are read through cache (a MatrixCache) when one is given and computed directly
+    otherwise; above DENSE_NODES nodes they are a matrix.TiledMatrix.
+    """
+
+    def __init__(self, cache=None):
+        self.cache = cache
+
+    def distance_km(self, lat, long):
+        if len(lat) > DENSE_NODES:
+            return TiledMatrix(lat, long)  # a dense matrix would not fit in memory
+        return self.cache.get(lat, long) if self.cache is not None else haversine_matrix(lat, long, unit="km")
+
+    def travel_minutes(self, lat, long, speeds, slots=None):
+        """Minutes between all the nodes, one n x n matrix per speed of speeds; slots are ignored."""
+        return travel_time_matrix(self.distance_km(lat, long), speeds)
+
+
+def load_profiles(path):
+    """Reads speed profiles from a JSON file of {slot start: {road class: speed factor}}, e.g. {"4:00 PM": {"1": 0.6}}.
+
+    Returns them keyed by the slot start in minutes of the model day, the E of the customers.
+    """
+    with open(path) as f:
+        stored = json.load(f)
+    starts = slot_minutes(list(stored)).tolist() if stored else []
+    return {start: {int(c): float(factor) for c, factor in profile.items()}
+            for start, profile in zip(starts, stored.values())}
+
+
+class RoadNetworkProvider:
+    """Fastest paths over a road network file, with optional speed profiles per delivery slot.
+
+    profiles maps the start of a delivery slot (minutes of the model day, see load_profiles)
+    to the speed factor of every road class; slots without a profile, and the depot, travel
+    at free-flow speed. A vehicle drives every road edge at the lower of the road's speed
+    and its own, so its fastest paths may differ from the free-flow ones.
+    The hierarchy of every distinct profile and vehicle speed below the road speeds is
+    contracted on first use and stored next to the road network file.
+    """
+
+    def __init__(self, path, profiles=None):
+        self.path = path
+        self.graph = RoadGraph.load(path)
+        self.profiles = profiles or {}
+        self._free = None
+
+    def _query(self, profile, sources, targets, max_speed=None):
+        minutes, km = hierarchy_many_to_many(load_hierarchy(self.graph, self.path, profile, max_speed),
+                                             self.graph.n_nodes, sources, targets)
+        if np.isinf(minutes).any():
+            raise ValueError(f"some nodes are not connected by the road network {self.path}")
+        return minutes, km
+
+    def _free_flow(self, lat, long):
+        """Nearest road nodes, access KMs and free-flow road minutes and KMs, kept for the last coordinates."""
+        key = (np.asarray(lat).tobytes(), np.asarray(long).tobytes())
+        if self._free is None or self._free[0] != key:
+            node, access_km = self.graph.nearest_nodes(lat, long)
+            self._free = (key, node, access_km, *self._query(None, node, node))
+        return self._free[1:]
+
+    def distance_km(self, lat, long):
+        """KMs of the fastest free-flow paths, access KMs included."""
+        _, access_km, _, road_km = self._free_flow(lat, long)
+        km = road_km + access_km[:, None] + access_km[None, :]
+        np.fill_diagonal(km, 0.0)
+        return km
+
+    def travel_minutes(self, lat, long, speeds, slots=None):
+        """Minutes between all the nodes, one n x n matrix per speed of speeds (km/min).
+
+        slots holds the slot start of every node, entering node j uses the profile of slots[j].
+        """
+        node, access_km, free_minutes, _ = self._free_flow(lat, long)
+        access = access_km[:, None] + access_km[None, :]
+        speeds = np.asarray(speeds, dtype=np.float64)
+        minutes = np.empty((len(speeds), len(node), len(node)))
+        for c, speed in enumerate(speeds.tolist()):
+            if speed >= self.graph.speed.max():
+                road_minutes = free_minutes.copy()
+            else:
+                road_minutes = self._query(None, node, node, speed)[0]
+            if slots is not None:
+                for slot, profile in self.profiles.items():
+                    columns = np.flatnonzero(np.asarray(slots) == slot)
+                    if len(columns):
+                        road_minutes[:, columns] = self._query(profile, node, node[columns], speed)[0]
+            minutes[c] = road_minutes + access / speed
+            np.fill_diagonal(minutes[c], 0.0)
+        return minutes
+
+
+def arc_minutes(data, speed_class, a, b):
+    """Minutes of the arcs from node positions a to b at a speed class of a model_data dict."""
+    if data.get('travel_minutes') is not None:
+        return np.asarray(data['travel_minutes'])[speed_class, a, b]
+    speeds, _ = unique_speeds([t.speed for t in data['types']])
+    return data['distance_km'][a, b] / speeds[speed_class]
@@ -0,0 +1,150 @@
+"""MIP warm start for CVRP_GUROBI.py from a short OR-Tools routing solve.
+
+The OR-Tools model of cvrptw_routing.py is built on the same data as the MIP and enforces
+all of its hard constraints, so the routes it returns are feasible for the MIP. They are
+then translated into values of vehicle_route, flow, start_time, vehicle_use,
+vehicle_visit_node and the route labels, and passed to the configured backend as a MIP
+start.
+"""
+
+import time
+
+import numpy as np
+import pulp as pl
+
+from CVRP_GUROBI import GUROBI, add_arcs, build_model, extract_routes, routes_from_arcs
+from cvrptw_routing import solve_routing
+from instrumentation import phase
+
+
+def heuristic_routes(data, time_limit=1):
+    """Solves the instance with OR-Tools and returns its routes by type name, or None if none is found."""
+    routes_by_type, dropped = solve_routing(data, time_limit)
+    if routes_by_type is None or dropped:
+        return None  # a plan that drops customers is no MIP start
+    return routes_by_type
+
+
+def mip_start_values(data, routes_by_type):
+    """Translates routes by type name into values of every MIP variable family.
+
+    Returns a dict of family name to {index: value}, keyed like the variables of
+    CVRP_GUROBI.build_model; variables that are not listed are zero. Every arc of the
+    routes must be an arc of data, see CVRP_GUROBI.add_arcs.
+    """
+    depot = data['depot']
+    position = {i: p for p, i in enumerate(data['nodes'])}
+    distance_km = data['distance_km']
+    free_km = {t.name: t.free_km for t in data['types']}
+    values = {'vehicle_route': {}, 'flow': {}, 'start_time': {}, 'vehicle_use': {}, 'vehicle_visit_node': {},
+              'extra_kms': {}, 'route_km': {}, 'route_customers': {}}
+    for name, routes in routes_by_type.items():
+        values['vehicle_use'][name] = len(routes)
+        for route in routes:
+            load = sum(data['demand'][i] for i in route[1:-1])
+            km, clock = 0.0, 0.0
+            for count, (i, j) in enumerate(zip(route, route[1:]), start=1):
+                d = float(distance_km[position[i], position[j]])
+                values['vehicle_route'][i, j, name] = 1
+                values['flow'][i, j, name] = load
+                if j == depot:
+                    values['extra_kms'][i, name] = max(0.0, km + d - free_km[name])
+                    continue
+                clock = max(data['earliest'][j], clock + data['service_time'][i]
+                            + data['time'][i, j, data['speed_class'][name]])
+                km += d
+                load -= data['demand'][j]
+                values['start_time'][j] = clock
+                values['route_km'][j] = km
+                values['route_customers'][j] = count
+                values['vehicle_visit_node'][j, name] = 1
+    return values
+
+
+def set_pulp_start(variables, values):
+    """Sets the initial value of every PuLP variable, zero where values has no entry."""
+    for family, family_vars in variables.items():
+        for key, var in family_vars.items():
+            if isinstance(var, pl.LpVariable):
+                var.setInitialValue(values[family].get(key, 0))
+
+
+def sparse_start(data, model, values):
+    """Returns the column vector of a SparseModel holding the MIP start values."""
+    start = np.zeros(model.A.shape[1])
+    arc_index = {a: p for p, a in enumerate(data['arcs'])}
+    type_index = {t.name: p for p, t in enumerate(data['types'])}
+    customer_index = {c: p for p, c in enumerate(data['customers'])}
+    for (i, j, name), value in values['vehicle_route'].items():
+        start[model.column('x', type_index[name], arc_index[i, j])] = value
+    for (i, j, name), value in values['flow'].items():
+        start[model.column('f', type_index[name], arc_index[i, j])] = value
+    for (i, name), value in values['extra_kms'].items():
+        start[model.column('extra_kms', type_index[name], customer_index[i])] = value
+    for (i, name), value in values['vehicle_visit_node'].items():
+        start[model.column('y', type_index[name], customer_index[i])] = value
+    for name, value in values['vehicle_use'].items():
+        start[model.column('u', type_index[name])] = value
+    for family, column in (('route_km', 'd'), ('start_time', 'st'), ('route_customers', 'c')):
+        for i, value in values[family].items():
+            start[model.column(column, customer_index[i])] = value
+    return start
+
+
+def solve_with_warm_start(data, backend="highs", heuristic_time=1, time_limit=1800, mip_gap=0.2, msg=False,
+                          trace=None):
+    """Runs the OR-Tools heuristic, then the MIP started from its routes.
+
+    backend "highs" solves the sparse model with HiGHS, "pulp" the PuLP model with Gurobi.
+    Returns a dict with status, objective, routes by vehicle ID and the stage timings; the
+    heuristic objective is the MIP cost of its routes, the first incumbent of the MIP.
+    trace (an instrumentation.Trace) gets both stages as phases and the heuristic objective
+    and HiGHS incumbents as solutions.
+    """
+    result = {'heuristic_objective': None}
+    started = time.perf_counter()
+    with phase(trace, "heuristic"):
+        routes_by_type = heuristic_routes(data, heuristic_time)
+    result['heuristic_seconds'] = time.perf_counter() - started
+    values = None
+    if routes_by_type is not None:
+        # the MIP only has the candidate arcs, make sure the start uses none outside them
+        add_arcs(data, [(i, j) for routes in routes_by_type.values() for r in routes for i, j in zip(r, r[1:])])
+        values = mip_start_values(data, routes_by_type)
+        result['heuristic_objective'] = (
+            sum(t.fixed_cost * values['vehicle_use'].get(t.name, 0) for t in data['types'])
+            + sum(t.variable_cost * values['extra_kms'].get((i, t.name), 0)
+                  for t in data['types'] for i in data['customers']))
+        if trace is not None:
+            trace.solution(result['heuristic_objective'], "warm start")
+
+    started = time.perf_counter()
+    if backend == "highs":
+        from sparse_model import build_sparse_model, extract_routes as extract_sparse_routes, solve_highs
+
+        with phase(trace, "build"):
+            model = build_sparse_model(data)
+        start = sparse_start(data, model, values) if values is not None else None
+        with phase(trace, "solve"):
+            status, objective, solution = solve_highs(model, time_limit=time_limit, mip_gap=mip_gap, msg=msg,
+                                                      start=start, trace=trace)
+        routes = extract_sparse_routes(data, model, solution) if solution is not None else None
+    else:
+        with phase(trace, "build"):
+            prob, variables = build_model(data)
+        if values is not None:
+            set_pulp_start(variables, values)
+        with phase(trace, "solve"):
+            prob.solve(GUROBI(msg=msg, MIPgap=mip_gap, timeLimit=time_limit, warmStart=values is not None))
+        status, objective = pl.LpStatus[prob.status], pl.value(prob.objective)
+        routes = extract_routes(data, variables) if prob.status == pl.LpStatusOptimal else None
+    result['mip_seconds'] = time.perf_counter() - started
+
+    if routes is None and routes_by_type is not None:
+        # the MIP found nothing better within its limit, fall back to the heuristic plan
+        routes = routes_from_arcs(data, [(i, j, name) for name, rs in routes_by_type.items()
+                                         for r in rs for i, j in zip(r, r[1:])])
+        objective = result['heuristic_objective']
+    result.update(status=status, objective=objective, routes=routes)
+    return result
+